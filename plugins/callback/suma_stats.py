@@ -0,0 +1,130 @@
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.plugins.callback import CallbackBase
+import json
+import os
+
+DOCUMENTATION = """
+---
+name: suma_stats
+type: aggregate
+author: "Arnaud Patard"
+short_description: Summarize the Suse Manager API calls made by a playbook
+description:
+   - Adds up the C(suma_stats) returned by the modules of the collection
+     run with I(instrumentation=true), and prints at the end of the
+     playbook the API methods and the tasks which took the most time.
+   - The calls can also be written to a JSON Lines file, one call per line
+     with the task and host which made it.
+requirements:
+   - enable in configuration
+options:
+   top:
+     description:
+        - Number of methods and tasks shown in the summary.
+     type: int
+     default: 10
+     env:
+        - name: SUMA_STATS_TOP
+     ini:
+        - section: callback_suma_stats
+          key: top
+   trace_path:
+     description:
+        - File receiving the calls, one JSON object per line. It's
+          truncated at the beginning of the playbook.
+     type: path
+     env:
+        - name: SUMA_STATS_TRACE_PATH
+     ini:
+        - section: callback_suma_stats
+          key: trace_path
+"""
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "apatard.suma.suma_stats"
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.methods = {}
+        self.tasks = {}
+        self._trace_file = None
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(CallbackModule, self).set_options(
+            task_keys=task_keys, var_options=var_options, direct=direct
+        )
+        trace_path = self.get_option("trace_path")
+        if trace_path:
+            try:
+                self._trace_file = open(os.path.expanduser(trace_path), "w")
+            except OSError as err:
+                self._display.warning(f"Unable to open {trace_path}: {err}")
+
+    def _add(self, task, host, stats):
+        calls = stats.get("calls")
+        if not calls:
+            return
+        task_stats = self.tasks.setdefault(task, {"count": 0, "time": 0.0})
+        for method, call in calls.items():
+            totals = self.methods.setdefault(
+                method, {"count": 0, "time": 0.0, "sent": 0, "received": 0}
+            )
+            for counter in totals:
+                totals[counter] += call[counter]
+            task_stats["count"] += call["count"]
+            task_stats["time"] += call["time"]
+        if self._trace_file is not None:
+            for trace in stats.get("traces") or []:
+                self._trace_file.write(
+                    json.dumps(dict(trace, task=task, host=host)) + "\n"
+                )
+
+    def _record(self, result):
+        # loop results are only added up once, with the final result
+        results = result._result.get("results")
+        if not isinstance(results, list):
+            results = [result._result]
+        task = result._task.get_name()
+        host = result._host.get_name()
+        for item in results:
+            if isinstance(item, dict) and isinstance(item.get("suma_stats"), dict):
+                self._add(task, host, item["suma_stats"])
+
+    def v2_runner_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result)
+
+    def v2_playbook_on_stats(self, stats):
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+        if not self.methods:
+            return
+        top = self.get_option("top")
+
+        lines = [f"{'SUMA method':<48}{'calls':>8}{'time(s)':>10}{'avg(ms)':>10}"]
+        lines[0] += f"{'sent(kB)':>10}{'recv(kB)':>10}"
+        methods = sorted(self.methods.items(), key=lambda m: m[1]["time"], reverse=True)
+        for method, m in methods[:top]:
+            lines.append(
+                f"{method[:47]:<48}{m['count']:>8}{m['time']:>10.3f}"
+                f"{m['time'] * 1000 / m['count']:>10.1f}"
+                f"{m['sent'] / 1024:>10.1f}{m['received'] / 1024:>10.1f}"
+            )
+        lines.append("")
+        lines.append(f"{'SUMA task':<48}{'calls':>8}{'time(s)':>10}")
+        tasks = sorted(self.tasks.items(), key=lambda t: t[1]["time"], reverse=True)
+        for task, t in tasks[:top]:
+            lines.append(f"{task[:47]:<48}{t['count']:>8}{t['time']:>10.3f}")
+        self._display.banner("SUMA API STATS")
+        self._display.display("\n".join(lines))
@@ -0,0 +1,102 @@
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+class ModuleDocFragment(object):
+
+    # Connection options shared by all the suse manager modules
+    DOCUMENTATION = r"""
+options:
+   hostname:
+     description:
+        - host running the Suse Manager instance.
+        - Required unless the task uses the C(apatard.suma.suma) httpapi
+          connection, whose host, user and password are used instead.
+     required: false
+     type: str
+   login:
+     description:
+        - account on the Suse Manager instance.
+        - Required unless the task uses the httpapi connection.
+     required: false
+     type: str
+   password:
+     description:
+        - password of the suse manager account
+        - Required unless the task uses the httpapi connection.
+     required: false
+     type: str
+   ssl_check:
+     description:
+        - disable SSL check *dangerous*
+     required: false
+     type: bool
+     default: true
+   session_cache:
+     description:
+        - Reuse the session key of a previous task instead of logging in
+          and out on each run.
+        - Session keys are stored on the node running the module, one per
+          hostname/login pair, and are shared by parallel forks.
+        - When a cached session is refused by the server, a new session is
+          opened transparently.
+     required: false
+     type: bool
+     default: false
+   session_cache_ttl:
+     description:
+        - Number of seconds a cached session key is reused. Must be lower
+          than the session lifetime configured on the Suse Manager server.
+     required: false
+     type: int
+     default: 1800
+   session_cache_dir:
+     description:
+        - Directory holding the cached session keys and the state of the
+          limiter.
+     required: false
+     type: path
+     default: ~/.ansible/suma
+   ca_file:
+     description:
+        - PEM file with the CA certificates used to check the certificate of
+          the Suse Manager server, instead of the system ones.
+     required: false
+     type: path
+   max_sessions:
+     description:
+        - Maximum number of modules having a session open at the same time
+          on the Suse Manager instance, for all the forks running on the
+          node. Modules wait for a free slot before logging in.
+        - Not limited when unset or C(0).
+     required: false
+     type: int
+   max_rate:
+     description:
+        - Maximum number of API calls per second made to the Suse Manager
+          instance, for all the forks running on the node. Calls are delayed
+          once the limit is reached.
+        - Not limited when unset or C(0).
+        - The time spent waiting is returned in C(suma_stats.limiter_wait).
+     required: false
+     type: float
+   compression:
+     description:
+        - Compress with gzip the requests bigger than 1400 bytes. Responses
+          are always requested compressed.
+        - The server must accept compressed requests.
+     required: false
+     type: bool
+     default: false
+   instrumentation:
+     description:
+        - Return the number of calls, the time spent and the bytes sent and
+          received for each API method in C(suma_stats.calls), and every
+          call in C(suma_stats.traces).
+        - These can be summarized with the C(apatard.suma.suma_stats)
+          callback plugin.
+     required: false
+     type: bool
+     default: false
+"""
@@ -0,0 +1,84 @@
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible_collections.ansible.netcommon.plugins.plugin_utils.httpapi_base import (
+    HttpApiBase,
+)
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    HTTPAPI_SESSION_KEY,
+    _is_session_fault,
+)
+from xmlrpc.client import Fault as rpcFault
+import xmlrpc.client
+
+DOCUMENTATION = """
+---
+name: suma
+author: "Arnaud Patard"
+short_description: HttpApi plugin for Suse Manager
+description:
+   - Lets the persistent C(ansible-connection) process own the Suse Manager
+     session and its HTTPS connection. The modules of the collection then
+     send their calls through it instead of logging in and out on each
+     task.
+   - The Suse Manager host, login and password are the ones of the
+     connection, C(ansible_host), C(ansible_user) and
+     C(ansible_httpapi_password). C(ansible_httpapi_use_ssl) must be set.
+   - A new session is opened when the server refuses the current one.
+"""
+
+
+class HttpApi(HttpApiBase):
+    def __init__(self, connection):
+        super(HttpApi, self).__init__(connection)
+        self._session_key = None
+        self._credentials = None
+
+    def _post(self, request):
+        (_response, data) = self.connection.send(
+            "/rpc/api",
+            request,
+            method="POST",
+            headers={"Content-Type": "text/xml"},
+        )
+        return data.getvalue()
+
+    def _call(self, name, params):
+        response = self._post(xmlrpc.client.dumps(params, name))
+        return xmlrpc.client.loads(response, use_datetime=True)[0][0]
+
+    def login(self, username, password):
+        self._credentials = (username, password)
+        self._session_key = self._call("auth.login", (username, password))
+
+    def logout(self):
+        if self._session_key is None:
+            return
+        try:
+            self._call("auth.logout", (self._session_key,))
+        except rpcFault:
+            pass
+        self._session_key = None
+
+    def send_request(self, data, **message_kwargs):
+        """Sends the XML-RPC request data with the session of the connection
+        and returns the response, still encoded.
+        """
+        (params, name) = xmlrpc.client.loads(data, use_datetime=True)
+        for retry in (True, False):
+            if params and params[0] == HTTPAPI_SESSION_KEY:
+                params = (self._session_key,) + params[1:]
+            response = self._post(xmlrpc.client.dumps(params, name))
+            # faults are small, don't decode large responses
+            if not retry or b"<fault>" not in response[:512]:
+                break
+            try:
+                xmlrpc.client.loads(response)
+                break
+            except rpcFault as fault:
+                if params[:1] != (self._session_key,) or not _is_session_fault(fault):
+                    break
+            self.login(*self._credentials)
+            params = (HTTPAPI_SESSION_KEY,) + params[1:]
+        return response.decode("utf-8")
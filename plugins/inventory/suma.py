@@ -0,0 +1,186 @@
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.errors import AnsibleError
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    SumaError,
+    suma_fetch_systems,
+)
+
+DOCUMENTATION = """
+---
+name: suma
+author: "Arnaud Patard"
+short_description: Suse Manager inventory source
+description:
+   - Builds an inventory of the systems registered to a Suse Manager
+     instance, using system.listSystems and system.getNetworkForSystems.
+   - Systems can be grouped by Suse Manager system groups.
+   - The configuration file name must end with C(suma.yml) or C(suma.yaml).
+   - Results can be cached with the inventory cache plugins to avoid
+     downloading the whole system list on each run. Use C(--flush-cache)
+     or I(refresh_cache) to force a refresh.
+extends_documentation_fragment:
+   - constructed
+   - inventory_cache
+options:
+   plugin:
+     description:
+        - token that ensures this is a source file for the plugin.
+     required: true
+     choices: [ apatard.suma.suma ]
+   hostname:
+     description:
+        - host running the Suse Manager instance.
+     required: true
+     type: str
+     env:
+        - name: SUMA_HOSTNAME
+   login:
+     description:
+        - account on the Suse Manager instance.
+     required: true
+     type: str
+     env:
+        - name: SUMA_LOGIN
+   password:
+     description:
+        - password of the suse manager account
+     required: true
+     type: str
+     env:
+        - name: SUMA_PASSWORD
+   ssl_check:
+     description:
+        - disable SSL check *dangerous*
+     type: bool
+     default: true
+   inventory_hostname:
+     description:
+        - System attribute used as inventory hostname.
+     type: str
+     choices: [ hostname, name, ip ]
+     default: hostname
+   system_groups:
+     description:
+        - Add the systems to groups named after their Suse Manager system
+          groups, prefixed with C(suma_group_).
+     type: bool
+     default: false
+   refresh_cache:
+     description:
+        - Ignore the cached data and download it again from Suse Manager.
+          The cache is updated with the new data.
+     type: bool
+     default: false
+"""
+
+EXAMPLES = """
+plugin: apatard.suma.suma
+hostname: suma.example.com
+login: admin
+password: password
+system_groups: true
+cache: true
+cache_plugin: jsonfile
+cache_connection: ~/.ansible/suma/inventory
+cache_timeout: 600
+keyed_groups:
+  - key: suma_hostname.split('.')[1:] | join('.')
+    prefix: domain
+"""
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = "apatard.suma.suma"
+
+    def verify_file(self, path):
+        if super(InventoryModule, self).verify_file(path):
+            return path.endswith(("suma.yml", "suma.yaml"))
+        return False
+
+    def _fetch_systems(self):
+        def get_groups(client, session_key):
+            groups = {}
+            if self.get_option("system_groups"):
+                for group in client.systemgroup.listAllGroups(session_key):
+                    members = client.systemgroup.listSystemsMinimal(
+                        session_key, group["name"]
+                    )
+                    groups[group["name"]] = [s["id"] for s in members]
+            return groups
+
+        try:
+            (systems, groups) = suma_fetch_systems(
+                self.get_option("hostname"),
+                self.get_option("login"),
+                self.get_option("password"),
+                self.get_option("ssl_check"),
+                get_groups,
+            )
+        except SumaError as err:
+            raise AnsibleError(str(err))
+        return {"systems": systems, "groups": groups}
+
+    def _populate(self, data):
+        strict = self.get_option("strict")
+        attr = self.get_option("inventory_hostname")
+
+        hosts = {}
+        for system in data["systems"]:
+            host = system[attr] or system["name"]
+            self.inventory.add_host(host)
+            hosts[system["id"]] = host
+            hostvars = {
+                "suma_system_id": system["id"],
+                "suma_name": system["name"],
+                "suma_hostname": system["hostname"],
+                "suma_ip": system["ip"],
+                "suma_last_checkin": system["last_checkin"],
+            }
+            for var, value in hostvars.items():
+                self.inventory.set_variable(host, var, value)
+
+            self._set_composite_vars(
+                self.get_option("compose"), hostvars, host, strict=strict
+            )
+            self._add_host_to_composed_groups(
+                self.get_option("groups"), hostvars, host, strict=strict
+            )
+            self._add_host_to_keyed_groups(
+                self.get_option("keyed_groups"), hostvars, host, strict=strict
+            )
+
+        for name, members in data["groups"].items():
+            group = self.inventory.add_group(
+                self._sanitize_group_name(f"suma_group_{name}")
+            )
+            for system_id in members:
+                if system_id in hosts:
+                    self.inventory.add_child(group, hosts[system_id])
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        user_cache_setting = self.get_option("cache")
+        refresh = self.get_option("refresh_cache")
+        attempt_to_read_cache = user_cache_setting and cache and not refresh
+        cache_needs_update = user_cache_setting and not attempt_to_read_cache
+
+        data = None
+        if attempt_to_read_cache:
+            try:
+                data = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+        if data is None:
+            data = self._fetch_systems()
+        if cache_needs_update:
+            self._cache[cache_key] = data
+
+        self._populate(data)
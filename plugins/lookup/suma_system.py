@@ -0,0 +1,266 @@
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.errors import AnsibleError
+from ansible.plugins.lookup import LookupBase
+from ansible.utils.display import Display
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    SUMA_CACHE_DIR,
+    SumaError,
+    suma_fetch_systems,
+    suma_write_json,
+)
+from xmlrpc.client import Fault as rpcFault
+import fcntl
+import hashlib
+import json
+import os
+import time
+
+DOCUMENTATION = """
+---
+name: suma_system
+author: "Arnaud Patard"
+short_description: Look up Suse Manager systems by id, hostname, IP or minion id
+description:
+   - Returns the systems registered to Suse Manager matching the given terms.
+   - The whole system table is downloaded once with bulk API calls, stored in
+     I(cache_dir) for I(cache_ttl) seconds and indexed on the system id, name,
+     hostname, IP and minion id. It is shared by all the lookups of the run,
+     so each term costs a dictionary lookup.
+   - When several systems share a value, for instance after a system was
+     registered twice, the one with the most recent check-in is returned.
+   - Systems added or deleted during the run, for instance by
+     M(apatard.suma.system_delete), are only seen once the table expires or
+     with I(refresh_cache).
+options:
+   _terms:
+     description:
+        - Values to look up.
+     required: true
+   key:
+     description:
+        - System attribute the terms are matched against.
+     type: str
+     choices: [ id, name, hostname, ip, minion_id ]
+     default: hostname
+   on_missing:
+     description:
+        - Action to take when no system matches a term.
+        - C(error) fails, C(warn) skips the term with a warning and C(skip)
+          silently skips it.
+     type: str
+     choices: [ error, skip, warn ]
+     default: error
+   hostname:
+     description:
+        - host running the Suse Manager instance.
+     required: true
+     type: str
+     env:
+        - name: SUMA_HOSTNAME
+   login:
+     description:
+        - account on the Suse Manager instance.
+     required: true
+     type: str
+     env:
+        - name: SUMA_LOGIN
+   password:
+     description:
+        - password of the suse manager account
+     required: true
+     type: str
+     env:
+        - name: SUMA_PASSWORD
+   ssl_check:
+     description:
+        - disable SSL check *dangerous*
+     type: bool
+     default: true
+   cache_dir:
+     description:
+        - Directory storing the system table.
+     type: path
+     default: ~/.ansible/suma
+   cache_ttl:
+     description:
+        - Number of seconds the system table is used before being downloaded
+          again. C(0) disables the on-disk cache, the table is then
+          downloaded once per process.
+     type: int
+     default: 600
+   refresh_cache:
+     description:
+        - Download the system table again on the first lookup, even if the
+          cached one is still valid.
+     type: bool
+     default: false
+"""
+
+EXAMPLES = """
+- name: Get the id of a system from its hostname
+  ansible.builtin.debug:
+    msg: "{{ lookup('apatard.suma.suma_system', 'web1.example.com').id }}"
+
+- name: Delete systems by IP
+  apatard.suma.system_delete:
+    ids: "{{ query('apatard.suma.suma_system', *addresses, key='ip') | map(attribute='id') }}"
+    hostname: "{{ suma_host }}"
+    login: "{{ suma_login }}"
+    password: "{{ suma_password }}"
+"""
+
+RETURN = """
+_list:
+  description: Systems matching the terms
+  type: list
+  elements: dict
+  contains:
+    id:
+      description: system id
+      type: int
+    name:
+      description: system name
+      type: str
+    hostname:
+      description: system hostname
+      type: str
+    ip:
+      description: system IPv4 address
+      type: str
+    minion_id:
+      description: salt minion id, null for traditional clients
+      type: str
+    last_checkin:
+      description: last check-in date, in ISO 8601 format
+      type: str
+"""
+
+INDEXED_KEYS = ["id", "name", "hostname", "ip", "minion_id"]
+
+display = Display()
+
+# Tables already loaded by this process, keyed by cache file path
+_TABLES = {}
+_REFRESHED = set()
+
+
+class SystemTable:
+    """Systems of a Suse Manager instance with one hash index per attribute"""
+
+    def __init__(self, systems, expires):
+        self.systems = systems
+        self.expires = expires
+        self.indexes = {key: {} for key in INDEXED_KEYS}
+        # oldest check-in first, so that the newest system wins on duplicates
+        for system in sorted(systems, key=lambda s: s["last_checkin"] or ""):
+            for key, index in self.indexes.items():
+                if system[key] is not None:
+                    index[str(system[key])] = system
+
+    def get(self, key, value):
+        return self.indexes[key].get(str(value))
+
+
+def fetch_systems(hostname, login, password, ssl_check=True):
+    """Returns the list of systems with their network infos and minion ids"""
+
+    def get_minion_ids(client, session_key):
+        try:
+            return client.system.getMinionIdMap(session_key)
+        except rpcFault:
+            # not available before SUMA 4.0
+            return {}
+
+    try:
+        (systems, minion_ids) = suma_fetch_systems(
+            hostname, login, password, ssl_check, get_minion_ids
+        )
+    except SumaError as err:
+        raise AnsibleError(str(err))
+    minions = {system_id: minion for minion, system_id in minion_ids.items()}
+    for system in systems:
+        system["minion_id"] = minions.get(system["id"])
+    return systems
+
+
+class LookupModule(LookupBase):
+    def _cache_path(self):
+        cache_dir = os.path.expanduser(self.get_option("cache_dir") or SUMA_CACHE_DIR)
+        digest = hashlib.sha256(
+            f"{self.get_option('hostname')}\0{self.get_option('login')}".encode()
+        ).hexdigest()
+        return os.path.join(cache_dir, f"systems-{digest}.json")
+
+    def _fetch(self):
+        return fetch_systems(
+            self.get_option("hostname"),
+            self.get_option("login"),
+            self.get_option("password"),
+            self.get_option("ssl_check"),
+        )
+
+    def _load_table(self):
+        ttl = self.get_option("cache_ttl")
+        path = self._cache_path()
+        # the table is only downloaded again by the first lookup of the run
+        refresh = self.get_option("refresh_cache") and path not in _REFRESHED
+        if refresh:
+            _REFRESHED.add(path)
+
+        table = _TABLES.get(path)
+        if table is not None and not refresh and table.expires > time.time():
+            return table
+
+        if ttl <= 0:
+            table = SystemTable(self._fetch(), float("inf"))
+            _TABLES[path] = table
+            return table
+
+        # forks wait for the first one to download the table instead of
+        # all downloading it at once
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        lockfd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            entry = None
+            if not refresh:
+                try:
+                    with open(path) as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    pass
+            if entry is None or entry.get("expires", 0) <= time.time():
+                entry = {"systems": self._fetch(), "expires": time.time() + ttl}
+                suma_write_json(path, entry)
+        finally:
+            os.close(lockfd)
+
+        table = SystemTable(entry["systems"], entry["expires"])
+        _TABLES[path] = table
+        return table
+
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        key = self.get_option("key")
+        on_missing = self.get_option("on_missing")
+
+        try:
+            table = self._load_table()
+        except OSError as err:
+            raise AnsibleError(f"Failed to load system table: {err}")
+
+        ret = []
+        for term in terms:
+            system = table.get(key, term)
+            if system is None:
+                msg = f"No system with {key} {term}"
+                if on_missing == "error":
+                    raise AnsibleError(msg)
+                if on_missing == "warn":
+                    display.warning(msg)
+                continue
+            ret.append(system)
+        return ret
@@ -0,0 +1,238 @@
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_ssl_context,
+)
+from xmlrpc.client import Fault as rpcFault
+import asyncio
+import gzip
+import time
+import urllib.parse
+import xmlrpc.client
+
+
+class _RemoteDisconnected(ConnectionError):
+    """The server closed the connection before any byte of the response"""
+
+
+class AsyncSumaTransport:
+    """HTTP/1.1 transport for asyncio keeping a pool of connections.
+
+    At most max_connections requests are in flight at once, each one on
+    its own connection. Idle connections are kept open and reused.
+    connections, sent and received count the connections opened and the
+    body bytes exchanged, like SumaTransport.
+    """
+
+    def __init__(self, hostname, context, max_connections=8):
+        url = urllib.parse.urlsplit("https://" + hostname)
+        self.host = url.hostname
+        self.port = url.port or 443
+        self.netloc = url.netloc
+        self.context = context
+        self.max_connections = max(1, max_connections)
+        self.connections = 0
+        # asyncio streams can't resume TLS sessions
+        self.resumed = 0
+        self.sent = 0
+        self.received = 0
+        self._idle = []
+        self._semaphore = None
+
+    async def _connect(self):
+        (reader, writer) = await asyncio.open_connection(
+            self.host, self.port, ssl=self.context, server_hostname=self.host
+        )
+        self.connections += 1
+        return (reader, writer)
+
+    async def _roundtrip(self, conn, body):
+        (reader, writer) = conn
+        try:
+            writer.write(
+                (
+                    "POST /rpc/api HTTP/1.1\r\n"
+                    f"Host: {self.netloc}\r\n"
+                    "User-Agent: apatard.suma\r\n"
+                    "Content-Type: text/xml\r\n"
+                    "Accept-Encoding: gzip\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "\r\n"
+                ).encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except OSError as err:
+            raise _RemoteDisconnected(str(err)) from err
+        self.sent += len(body)
+
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as err:
+            # like http.client, only an empty response may be retried
+            if err.partial:
+                raise
+            raise _RemoteDisconnected("Remote end closed connection") from err
+        lines = head.decode("iso-8859-1").split("\r\n")
+        (_version, status, reason) = (lines[0].split(" ", 2) + [""])[:3]
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                (name, value) = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # trailers
+                    while (await reader.readline()) not in (b"\r\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(chunks)
+        else:
+            data = await reader.readexactly(int(headers.get("content-length", 0)))
+        self.received += len(data)
+        return (int(status), reason, headers, data)
+
+    async def request(self, body):
+        """Posts body and returns the status, reason, headers and response body"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        async with self._semaphore:
+            while True:
+                reused = bool(self._idle)
+                conn = self._idle.pop() if reused else await self._connect()
+                try:
+                    response = await self._roundtrip(conn, body)
+                except _RemoteDisconnected:
+                    conn[1].close()
+                    # the server closed the idle connection, retry on a new one
+                    if reused:
+                        continue
+                    raise
+                except (OSError, EOFError):
+                    # the call may have run, it's not sent again
+                    conn[1].close()
+                    raise
+                if response[2].get("connection", "").lower() == "close":
+                    conn[1].close()
+                else:
+                    self._idle.append(conn)
+                return response
+
+    async def close(self):
+        for (_reader, writer) in self._idle:
+            writer.close()
+        self._idle = []
+
+
+class _AsyncSumaMethod:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, name):
+        return _AsyncSumaMethod(self._client, f"{self._name}.{name}")
+
+    def __call__(self, *args):
+        return self._client._call(self._name, args)
+
+
+class AsyncSumaClient:
+    """asyncio counterpart of SumaClient.
+
+    API calls are awaited with the client.<namespace>.<method>() syntax.
+    With a parent SumaClient, its session key, limiter and instrumentation
+    are used, but refused sessions are not renewed.
+    """
+
+    def __init__(self, transport, parent=None):
+        self._transport = transport
+        self._parent = parent
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _AsyncSumaMethod(self, name)
+
+    async def _call(self, name, args):
+        parent = self._parent
+        if parent is not None:
+            if args and isinstance(args[0], str) and args[0] in parent._stale_keys:
+                args = (parent._session_key,) + args[1:]
+            if parent._limiter is not None:
+                # don't block the event loop while waiting for a token
+                wait = parent._limiter.take()
+                if wait:
+                    await asyncio.sleep(wait)
+        body = xmlrpc.client.dumps(args, name, encoding="utf-8").encode("utf-8")
+
+        start = time.time()
+        begin = time.perf_counter()
+        (sent, received) = (self._transport.sent, self._transport.received)
+        try:
+            (status, reason, headers, data) = await self._transport.request(body)
+        finally:
+            if parent is not None and parent._instrumentation is not None:
+                parent._instrumentation.record(
+                    name,
+                    start,
+                    time.perf_counter() - begin,
+                    self._transport.sent - sent,
+                    self._transport.received - received,
+                )
+
+        if status != 200:
+            raise xmlrpc.client.ProtocolError(
+                self._transport.netloc + "/rpc/api", status, reason, headers
+            )
+        if headers.get("content-encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        (parser, unmarshaller) = xmlrpc.client.getparser(use_datetime=True)
+        parser.feed(data)
+        parser.close()
+        result = unmarshaller.close()
+        return result[0] if len(result) == 1 else result
+
+
+def suma_async_map(client, func, items, workers):
+    """Same as suma_map, with func(async_client, item) a coroutine function.
+
+    The calls are made from an event loop over a pool of workers
+    connections instead of a pool of threads, sharing the session of
+    client.
+    """
+    params = client._module.params
+    transport = AsyncSumaTransport(
+        params["hostname"],
+        suma_ssl_context(params["ssl_check"], params.get("ca_file")),
+        workers,
+    )
+    client._async_transports.append(transport)
+    async_client = AsyncSumaClient(transport, client)
+    items = list(dict.fromkeys(items))
+    pending = iter(items)
+    results = {}
+    errors = {}
+
+    async def worker():
+        for item in pending:
+            try:
+                results[item] = await func(async_client, item)
+            except (rpcFault, xmlrpc.client.ProtocolError, OSError, EOFError) as err:
+                errors[item] = str(err)
+
+    async def run():
+        try:
+            await asyncio.gather(*(worker() for i in range(transport.max_connections)))
+        finally:
+            await transport.close()
+
+    asyncio.run(run())
+    return ({i: results[i] for i in items if i in results}, errors)
@@ -2,36 +2,932 @@
 # GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+from ansible.module_utils.connection import (
+    Connection,
+    ConnectionError as AnsibleConnectionError,
+)
 import xmlrpc.client
 from xmlrpc.client import Fault as rpcFault
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import datetime
+import fcntl
+import fnmatch
+import hashlib
+import http.client
+import json
+import os
+import random
+import re
 import socket
 import ssl
+import struct
+import threading
+import time
+import types
+import zlib
 
+SUMA_CACHE_DIR = "~/.ansible/suma"
 
-def suma_connect(module):
-    manager_url = "https://" + module.params["hostname"] + "/rpc/api"
+# Fault code returned by SUMA for unknown or expired session keys
+SESSION_FAULT_CODE = 2950
+# Fault code returned by SUMA for unknown system ids
+NO_SUCH_SYSTEM_FAULT_CODE = -210
+# SSL contexts by (ssl_check, ca_file) and TLS sessions to resume by
+# (context id, host, port), shared by the connections of the process
+_SSL_CONTEXTS = {}
+_TLS_SESSIONS = {}
+_SSL_LOCK = threading.Lock()
+
+# Session key used by modules behind the httpapi plugin, which replaces it
+# with its own
+HTTPAPI_SESSION_KEY = "httpapi"
+
+
+class SumaError(Exception):
+    """Error of the helpers used outside of modules, like plugins"""
+
+
+def suma_argument_spec(**kwargs):
+    """Returns the argument spec shared by all modules, updated with kwargs"""
+    spec = dict(
+        hostname=dict(required=False),
+        login=dict(required=False),
+        password=dict(required=False, no_log=True),
+        ssl_check=dict(required=False, type="bool", default=True),
+        session_cache=dict(required=False, type="bool", default=False),
+        session_cache_ttl=dict(required=False, type="int", default=1800),
+        session_cache_dir=dict(required=False, type="path", default=SUMA_CACHE_DIR),
+        ca_file=dict(required=False, type="path"),
+        instrumentation=dict(required=False, type="bool", default=False),
+        compression=dict(required=False, type="bool", default=False),
+        max_sessions=dict(required=False, type="int"),
+        max_rate=dict(required=False, type="float"),
+    )
+    spec.update(kwargs)
+    return spec
+
+
+def suma_write_json(path, data):
+    """Atomically replaces path with data encoded as JSON, readable by the owner"""
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        # dates are written as strings
+        json.dump(data, f, default=str)
+    os.replace(tmp, path)
+
+
+def suma_matcher(patterns, match="glob"):
+    """Returns a function telling if a string matches one of patterns.
+
+    match is exact, glob or regex. Regular expressions are searched, not
+    anchored. Raises ValueError for invalid regular expressions.
+    """
+    if match == "exact":
+        values = set(patterns)
+        return lambda value: value in values
+    if match == "glob":
+        matchers = [re.compile(fnmatch.translate(p)).match for p in patterns]
+    else:
+        try:
+            matchers = [re.compile(p).search for p in patterns]
+        except re.error as err:
+            raise ValueError(f"Invalid regular expression: {err}")
+    return lambda value: value is not None and any(m(value) for m in matchers)
+
+
+def suma_wait(func, timeout, delay=1.0, max_delay=30.0):
+    """Calls func until it returns something else than None.
+
+    Attempts are spaced with an exponential backoff with jitter and stop
+    after timeout seconds. Returns (result, elapsed, attempts), result
+    being None on timeout.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    attempts = 0
+    while True:
+        attempts += 1
+        result = func()
+        now = time.monotonic()
+        if result is not None or now >= deadline:
+            return (result, now - start, attempts)
+        time.sleep(min(random.uniform(delay / 2, delay), deadline - now))
+        delay = min(delay * 2, max_delay)
+
+
+def _is_session_fault(fault):
+    return (
+        fault.faultCode == SESSION_FAULT_CODE or "session" in fault.faultString.lower()
+    )
+
+
+class SessionCache:
+    """On-disk store of session keys, one file per hostname/login pair.
+
+    The lock is held by SumaClient while checking and refreshing the entry
+    so that parallel forks end up sharing a single session. The threads of
+    a process are serialized before taking it.
+    """
+
+    def __init__(self, cache_dir, hostname, login, ttl):
+        self.ttl = ttl
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        digest = hashlib.sha256(f"{hostname}\0{login}".encode()).hexdigest()
+        self.path = os.path.join(cache_dir, f"session-{digest}.json")
+        self._lockfd = None
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._lockfd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._lockfd, fcntl.LOCK_EX)
+        except BaseException:
+            if self._lockfd is not None:
+                os.close(self._lockfd)
+                self._lockfd = None
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        try:
+            fcntl.flock(self._lockfd, fcntl.LOCK_UN)
+            os.close(self._lockfd)
+        finally:
+            self._lockfd = None
+            self._thread_lock.release()
+
+    def get(self):
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) <= time.time():
+            return None
+        return entry.get("session_key")
+
+    def set(self, session_key):
+        suma_write_json(
+            self.path, {"session_key": session_key, "expires": time.time() + self.ttl}
+        )
+
+    def invalidate(self, session_key):
+        if self.get() == session_key:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SumaLimiter:
+    """Limits the sessions and the calls per second made to a SUMA host.
+
+    The state is shared by all the processes of the node with files of
+    cache_dir. Each session holds an flock on one of max_sessions slot
+    files until it's released. Calls take a token from a bucket refilled
+    with max_rate tokens per second, stored in a file updated under flock.
+    session_wait and rate_wait are the seconds spent waiting.
+    """
+
+    _BUCKET = struct.Struct("dd")
+
+    def __init__(self, cache_dir, hostname, max_sessions=None, max_rate=None):
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        digest = hashlib.sha256(hostname.encode()).hexdigest()
+        self._prefix = os.path.join(cache_dir, f"limit-{digest}")
+        self.max_sessions = max_sessions
+        self.max_rate = max_rate
+        self.session_wait = 0.0
+        self.rate_wait = 0.0
+        self._slotfd = None
+        self._bucketfd = None
+        self._lock = threading.Lock()
+        if max_rate:
+            self._bucketfd = os.open(
+                f"{self._prefix}.bucket", os.O_RDWR | os.O_CREAT, 0o600
+            )
 
-    context = ssl.create_default_context()
-    if module.params["ssl_check"] is False:
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
+    def acquire(self):
+        """Waits for a free session slot"""
+        if not self.max_sessions:
+            return
+        start = time.monotonic()
+        delay = 0.005
+        first = os.getpid() % self.max_sessions
+        while True:
+            for i in range(self.max_sessions):
+                slot = (first + i) % self.max_sessions
+                fd = os.open(
+                    f"{self._prefix}.slot{slot}", os.O_RDWR | os.O_CREAT, 0o600
+                )
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                self._slotfd = fd
+                self.session_wait += time.monotonic() - start
+                return
+            time.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, 0.2)
 
+    def release(self):
+        if self._slotfd is not None:
+            os.close(self._slotfd)
+            self._slotfd = None
+        if self._bucketfd is not None:
+            os.close(self._bucketfd)
+            self._bucketfd = None
+
+    def throttle(self):
+        """Waits until a call can be made"""
+        wait = self.take()
+        if wait:
+            time.sleep(wait)
+
+    def take(self):
+        """Takes a token and returns the seconds to wait before the call"""
+        if self._bucketfd is None:
+            return 0.0
+        capacity = max(1.0, self.max_rate)
+        with self._lock:
+            fcntl.flock(self._bucketfd, fcntl.LOCK_EX)
+            try:
+                now = time.monotonic()
+                data = os.pread(self._bucketfd, self._BUCKET.size, 0)
+                if len(data) == self._BUCKET.size:
+                    (tokens, updated) = self._BUCKET.unpack(data)
+                    # updated is in the future after a reboot
+                    elapsed = max(0.0, now - updated)
+                    tokens = min(capacity, tokens + elapsed * self.max_rate)
+                else:
+                    tokens = capacity
+                # tokens go negative when calls are waiting for their turn
+                tokens -= 1
+                os.pwrite(self._bucketfd, self._BUCKET.pack(tokens, now), 0)
+            finally:
+                fcntl.flock(self._bucketfd, fcntl.LOCK_UN)
+            if tokens >= 0:
+                return 0.0
+            wait = -tokens / self.max_rate
+            self.rate_wait += wait
+        return wait
+
+
+class SumaStats:
+    """Per-method counters of the API calls, shared by a client and its clones.
+
+    Each call records its duration and the bytes sent and received on the
+    wire. traces keeps every call, in order.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.traces = []
+        self._lock = threading.Lock()
+
+    def record(self, method, start, duration, sent, received):
+        with self._lock:
+            stats = self.calls.setdefault(
+                method, {"count": 0, "time": 0.0, "sent": 0, "received": 0}
+            )
+            stats["count"] += 1
+            stats["time"] += duration
+            stats["sent"] += sent
+            stats["received"] += received
+            self.traces.append(
+                {
+                    "method": method,
+                    "start": start,
+                    "duration": duration,
+                    "sent": sent,
+                    "received": received,
+                }
+            )
+
+
+class _CountingResponse:
+    def __init__(self, response, transport):
+        self._response = response
+        self._transport = transport
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._transport.received += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class _StreamingUnmarshaller(xmlrpc.client.Unmarshaller):
+    """Unmarshaller handing out the elements of a top level array as soon
+    as they are decoded, instead of building the whole list.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.array_mark = None
+
+    def start(self, tag, attrs):
+        if tag == "array" and not self._marks and self.array_mark is None:
+            self.array_mark = len(self._stack)
+        super().start(tag, attrs)
+
+    def pop_items(self):
+        """Removes and returns the elements of the array decoded so far"""
+        if self.array_mark is None or not self._marks:
+            return []
+        # an element may be partially decoded, above the next mark
+        end = self._marks[1] if len(self._marks) > 1 else len(self._stack)
+        items = self._stack[self.array_mark : end]
+        del self._stack[self.array_mark : end]
+        self._marks[1:] = [mark - len(items) for mark in self._marks[1:]]
+        return items
+
+
+_END = object()
+
+
+def _resume(first, items):
     try:
-        client = xmlrpc.client.ServerProxy(
-            manager_url, context=context, use_datetime=True
+        if first is not _END:
+            yield first
+            yield from items
+    finally:
+        items.close()
+
+
+def _recorded(items, record):
+    try:
+        yield from items
+    finally:
+        record()
+
+
+class _SumaHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection resuming the TLS session of a previous connection"""
+
+    def __init__(self, transport, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._transport = transport
+        self._session_id = (id(self._context), self.host, self.port)
+
+    def connect(self):
+        start = time.perf_counter()
+        # same as the parent, with the session
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        self.sock = self._context.wrap_socket(
+            self.sock,
+            server_hostname=server_hostname,
+            session=_TLS_SESSIONS.get(self._session_id),
         )
-    except socket.gaierror:
-        module.fail_json(msg="Failed to connect")
+        self._transport.connections += 1
+        self._transport.connect_time += time.perf_counter() - start
+        if self.sock.session_reused:
+            self._transport.resumed += 1
+
+    def getresponse(self):
+        response = super().getresponse()
+        # TLS 1.3 tickets are only received after the handshake
+        if self.sock is not None and self.sock.session is not None:
+            _TLS_SESSIONS[self._session_id] = self.sock.session
+        return response
+
+
+class SumaTransport(xmlrpc.client.SafeTransport):
+    """HTTPS transport keeping one HTTP/1.1 connection for the whole module run.
+
+    The connection is reopened when the server closes it, either after a
+    response or while idle. connections counts the TCP/TLS connections
+    actually opened, resumed those resuming a previous TLS session and
+    connect_time the time spent opening them. sent and received count the
+    request and response bodies, as sent on the wire.
 
+    Responses are always requested gzip compressed. With compression,
+    requests bigger than 1400 bytes are compressed too. When streaming is
+    set, calls returning an array return instead a generator decoding its
+    elements as the response is received.
+    """
+
+    def __init__(self, *args, compression=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+        self.resumed = 0
+        self.connect_time = 0.0
+        self.sent = 0
+        self.received = 0
+        self.streaming = False
+        self._stream = None
+        if compression:
+            self.encode_threshold = 1400
+
+    def send_content(self, connection, request_body):
+        # same as the parent, counting the encoded body
+        if self.encode_threshold is not None and self.encode_threshold < len(
+            request_body
+        ):
+            connection.putheader("Content-Encoding", "gzip")
+            request_body = xmlrpc.client.gzip_encode(request_body)
+        self.sent += len(request_body)
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        response = _CountingResponse(response, self)
+        if not self.streaming:
+            return super().parse_response(response)
+        items = self._iter_response(response)
+        self._stream = items
+        # decode up to the first element so that faults are raised here
+        return (_resume(next(items, _END), items),)
+
+    def _iter_response(self, response):
+        unmarshaller = _StreamingUnmarshaller(
+            self._use_datetime, self._use_builtin_types
+        )
+        parser = xmlrpc.client.ExpatParser(unmarshaller)
+        decompressor = None
+        if response.getheader("Content-Encoding", "") == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        complete = False
+        try:
+            while True:
+                data = response.read(65536)
+                if not data:
+                    break
+                if decompressor is not None:
+                    data = decompressor.decompress(data)
+                parser.feed(data)
+                yield from unmarshaller.pop_items()
+            complete = True
+            parser.close()
+            result = unmarshaller.close()
+        finally:
+            self._stream = None
+            # the rest of the response is still to be read
+            if not complete:
+                self.close()
+        if unmarshaller.array_mark is None:
+            yield result[0]
+        else:
+            # the elements decoded with the end of the array
+            yield from result[0]
+
+    def make_connection(self, host):
+        if self._stream is not None:
+            self._stream.close()
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        self._connection = host, _SumaHTTPSConnection(
+            self, chost, None, context=self.context, **(x509 or {})
+        )
+        return self._connection[1]
+
+
+class _HttpApiMethod:
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    def __getattr__(self, name):
+        return _HttpApiMethod(self._connection, f"{self._name}.{name}")
+
+    def __call__(self, *args):
+        request = xmlrpc.client.dumps(args, self._name)
+        try:
+            response = self._connection.send_request(request)
+        except AnsibleConnectionError as err:
+            raise xmlrpc.client.ProtocolError(
+                "httpapi", getattr(err, "code", 0), str(err), {}
+            )
+        return xmlrpc.client.loads(response, use_datetime=True)[0][0]
+
+
+class SumaHttpApiProxy:
+    """XML-RPC proxy sending the calls through the persistent connection of
+    the apatard.suma.suma httpapi plugin, which owns the session.
+    """
+
+    def __init__(self, socket_path):
+        self._socket_path = socket_path
+        self._connection = Connection(socket_path)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _HttpApiMethod(self._connection, name)
+
+
+class _SumaMethod:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, name):
+        return _SumaMethod(self._client, f"{self._name}.{name}")
+
+    def __call__(self, *args):
+        return self._client._call(self._name, args)
+
+
+class SumaClient:
+    """Wrapper around the XML-RPC proxy keeping track of the session key.
+
+    API calls are made with the usual client.<namespace>.<method>() syntax.
+    When the session comes from the cache and gets refused by the server,
+    a new one is opened and the call is retried with it. Clones renew the
+    session of their parent, so that it's only opened once.
+    """
+
+    def __init__(self, module, proxy, transport=None, parent=None):
+        self._module = module
+        self._proxy = proxy
+        self._transport = transport
+        self._parent = parent
+        self._session_key = None
+        self._session_cache = None
+        self._stale_keys = set()
+        self._clones = []
+        self._async_transports = []
+        self._instrumentation = None
+        self._limiter = None
+        self._startup = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _SumaMethod(self, name)
+
+    def _call(self, name, args, retry=True):
+        root = self._parent or self
+        if args and isinstance(args[0], str) and args[0] in root._stale_keys:
+            args = (root._session_key,) + args[1:]
+        method = self._proxy
+        for attr in name.split("."):
+            method = getattr(method, attr)
+        if self._limiter is not None:
+            self._limiter.throttle()
+        try:
+            if self._instrumentation is None:
+                return method(*args)
+            return self._instrumented_call(name, method, args)
+        except rpcFault as fault:
+            if (
+                not retry
+                or self._session_cache is None
+                or not args
+                or (args[0] != root._session_key and args[0] not in root._stale_keys)
+                or not _is_session_fault(fault)
+            ):
+                raise
+        with self._session_cache as cache:
+            # another thread may have renewed it in the meantime
+            if root._session_key == args[0]:
+                root._stale_keys.add(args[0])
+                cache.invalidate(args[0])
+                root._session_key = self._login(cache)
+        self._session_key = root._session_key
+        return self._call(name, args, retry=False)
+
+    def _instrumented_call(self, name, method, args):
+        transport = self._transport
+        (sent, received) = (transport.sent, transport.received) if transport else (0, 0)
+        start = time.time()
+        begin = time.perf_counter()
+
+        def record():
+            duration = time.perf_counter() - begin
+            if transport is not None:
+                (total_sent, total_received) = (transport.sent, transport.received)
+            else:
+                (total_sent, total_received) = (sent, received)
+            self._instrumentation.record(
+                name, start, duration, total_sent - sent, total_received - received
+            )
+
+        try:
+            result = method(*args)
+        except BaseException:
+            record()
+            raise
+        # streamed calls are recorded once the response is consumed
+        if isinstance(result, types.GeneratorType):
+            return _recorded(result, record)
+        record()
+        return result
+
+    def _stream(self, name, *args):
+        """Makes the call like client.<name>(*args), returning an iterator
+        over the elements of the returned array, decoded as the response is
+        received. It must be consumed before the next call.
+        """
+        if self._transport is None:
+            return iter(self._call(name, args))
+        self._transport.streaming = True
+        try:
+            return iter(self._call(name, args))
+        finally:
+            self._transport.streaming = False
+
+    def _login(self, cache=None):
+        if cache is not None:
+            session_key = cache.get()
+            if session_key is not None:
+                return session_key
+        params = self._module.params
+        try:
+            session_key = self._call(
+                "auth.login", (params["login"], params["password"]), retry=False
+            )
+        except rpcFault as fault:
+            self._module.fail_json(msg=f"Failed to login: {fault}")
+        except xmlrpc.client.ProtocolError as fault:
+            self._module.fail_json(msg=f"Failed to login: {fault}")
+        except socket.gaierror:
+            self._module.fail_json(msg="Failed to connect")
+        if cache is not None:
+            cache.set(session_key)
+        return session_key
+
+    def _clone(self):
+        """Returns a client with its own connection, sharing the session"""
+        if isinstance(self._proxy, SumaHttpApiProxy):
+            (proxy, transport) = (SumaHttpApiProxy(self._proxy._socket_path), None)
+        else:
+            (proxy, transport) = suma_proxy(
+                self._module.params["hostname"],
+                self._module.params["ssl_check"],
+                self._module.params.get("compression", False),
+                self._module.params.get("ca_file"),
+            )
+        clone = SumaClient(self._module, proxy, transport, self._parent or self)
+        clone._session_key = self._session_key
+        clone._session_cache = self._session_cache
+        clone._instrumentation = self._instrumentation
+        clone._limiter = self._limiter
+        self._clones.append(clone)
+        return clone
+
+    def _logout(self):
+        # cached and httpapi sessions are kept open for the next tasks
+        if self._session_cache is None and self._session_key != HTTPAPI_SESSION_KEY:
+            self._call("auth.logout", (self._session_key,), retry=False)
+        for client in [self] + self._clones:
+            if client._transport is not None:
+                client._transport.close()
+        if self._limiter is not None:
+            self._limiter.release()
+
+    def _stats(self):
+        stats = {}
+        transports = [c._transport for c in [self] + self._clones if c._transport]
+        transports += self._async_transports
+        if transports:
+            stats["connections"] = sum(t.connections for t in transports)
+            stats["tls_resumed"] = sum(t.resumed for t in transports)
+        if self._startup:
+            stats["startup"] = self._startup
+        if self._limiter is not None:
+            stats["limiter_wait"] = {
+                "sessions": self._limiter.session_wait,
+                "rate": self._limiter.rate_wait,
+            }
+        if self._instrumentation is not None:
+            stats["calls"] = self._instrumentation.calls
+            stats["traces"] = self._instrumentation.traces
+        return stats
+
+
+def suma_imap(client, func, items, workers):
+    """Calls func(client, item) for each item from a pool of workers threads
+    and yields (item, result, error) in the order of items.
+
+    Each thread uses its own connection, all of them sharing the session
+    of client. A single item is handled by client itself. At most twice
+    as many items as workers are pending at once, error is the message of
+    a failed call and result None.
+    """
+    local = threading.local()
+    items = list(items)
+    single = len(items) == 1
+
+    def run(item):
+        if single:
+            return func(client, item)
+        thread_client = getattr(local, "client", None)
+        if thread_client is None:
+            thread_client = local.client = client._clone()
+        return func(thread_client, item)
+
+    def outcome(item, future):
+        try:
+            return (item, future.result(), None)
+        except (rpcFault, xmlrpc.client.ProtocolError, OSError) as err:
+            return (item, None, str(err))
+
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append((item, executor.submit(run, item)))
+            if len(pending) >= 2 * workers:
+                yield outcome(*pending.popleft())
+        while pending:
+            yield outcome(*pending.popleft())
+
+
+def suma_map(client, func, items, workers):
+    """Same as suma_imap, returning (results, errors), two dicts keyed by
+    item, errors holding the message of the failed calls.
+    """
+    results = {}
+    errors = {}
+    for item, result, error in suma_imap(client, func, dict.fromkeys(items), workers):
+        if error is None:
+            results[item] = result
+        else:
+            errors[item] = error
+    return (results, errors)
+
+
+def suma_ssl_context(ssl_check=True, ca_file=None):
+    """Returns the SSL context used to connect to the API.
+
+    Contexts are created once per process: loading the CA certificates is
+    slow, and TLS sessions can only be resumed with the same context.
+    """
+    key = (ssl_check is not False, ca_file)
+    with _SSL_LOCK:
+        context = _SSL_CONTEXTS.get(key)
+        if context is None:
+            context = ssl.create_default_context(cafile=ca_file)
+            if ssl_check is False:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            _SSL_CONTEXTS[key] = context
+    return context
+
+
+def suma_proxy(hostname, ssl_check=True, compression=False, ca_file=None):
+    """Returns the XML-RPC proxy to the API of hostname and its transport"""
+    manager_url = "https://" + hostname + "/rpc/api"
+    context = suma_ssl_context(ssl_check, ca_file)
+    transport = SumaTransport(
+        use_datetime=True, context=context, compression=compression
+    )
+    proxy = xmlrpc.client.ServerProxy(manager_url, transport=transport)
+    return (proxy, transport)
+
+
+def suma_fetch_systems(hostname, login, password, ssl_check=True, extra=None):
+    """Returns the registered systems with their network infos.
+
+    A session is opened for the calls. extra(client, session_key) is called
+    before logging out and its result is returned with the systems. Errors
+    are raised as SumaError.
+    """
+    (client, transport) = suma_proxy(hostname, ssl_check)
     try:
-        session_key = client.auth.login(
-            module.params["login"], module.params["password"]
+        try:
+            session_key = client.auth.login(login, password)
+        except (rpcFault, xmlrpc.client.ProtocolError, OSError) as err:
+            raise SumaError(f"Failed to login: {err}")
+
+        try:
+            sys_list = client.system.listSystems(session_key)
+            net_list = client.system.getNetworkForSystems(
+                session_key, [s["id"] for s in sys_list]
+            )
+            extra_result = None if extra is None else extra(client, session_key)
+        except (rpcFault, xmlrpc.client.ProtocolError, OSError) as err:
+            raise SumaError(f"Failed to get system list: {err}")
+        finally:
+            try:
+                client.auth.logout(session_key)
+            except (rpcFault, xmlrpc.client.ProtocolError, OSError):
+                pass
+    finally:
+        transport.close()
+
+    networks = {n["system_id"]: n for n in net_list}
+    systems = []
+    for system in sys_list:
+        net = networks.get(system["id"], {})
+        last_checkin = system.get("last_checkin")
+        if isinstance(last_checkin, datetime.datetime):
+            last_checkin = last_checkin.isoformat()
+        systems.append(
+            {
+                "id": system["id"],
+                "name": system["name"],
+                "hostname": net.get("hostname"),
+                "ip": net.get("ip"),
+                "last_checkin": last_checkin,
+            }
         )
-    except rpcFault as fault:
-        module.fail_json(msg=f"Failed to login: {fault}")
-    except xmlrpc.client.ProtocolError as fault:
-        module.fail_json(msg=f"Failed to login: {fault}")
-    except socket.gaierror:
-        module.fail_json(msg="Failed to connect")
-
-    return (client, session_key)
+    return (systems, extra_result)
+
+
+def suma_connect(module):
+    """Logs in and returns the client and the session key.
+
+    With connection: httpapi, calls go through the persistent connection
+    and its session. Otherwise, hostname, login and password are used to
+    open a session for this module run.
+    """
+    socket_path = getattr(module, "_socket_path", None)
+    startup = {}
+    if socket_path:
+        proxy = SumaHttpApiProxy(socket_path)
+        transport = None
+        if module.params["hostname"] is None:
+            try:
+                module.params["hostname"] = proxy._connection.get_option("host")
+            except AnsibleConnectionError as err:
+                module.fail_json(msg=f"Failed to connect: {err}")
+    else:
+        missing = [
+            option
+            for option in ("hostname", "login", "password")
+            if module.params[option] is None
+        ]
+        if missing:
+            module.fail_json(msg=f"missing required arguments: {', '.join(missing)}")
+        start = time.perf_counter()
+        try:
+            suma_ssl_context(module.params["ssl_check"], module.params.get("ca_file"))
+        except (OSError, ssl.SSLError) as err:
+            module.fail_json(msg=f"Failed to load CA certificates: {err}")
+        startup["ssl_context"] = time.perf_counter() - start
+        try:
+            (proxy, transport) = suma_proxy(
+                module.params["hostname"],
+                module.params["ssl_check"],
+                module.params.get("compression", False),
+                module.params.get("ca_file"),
+            )
+        except socket.gaierror:
+            module.fail_json(msg="Failed to connect")
+
+    client = SumaClient(module, proxy, transport)
+    client._startup = startup
+    if module.params.get("instrumentation"):
+        client._instrumentation = SumaStats()
+    for option in ("max_sessions", "max_rate"):
+        if (module.params.get(option) or 0) < 0:
+            module.fail_json(msg=f"{option} must be positive")
+    if module.params.get("max_sessions") or module.params.get("max_rate"):
+        try:
+            client._limiter = SumaLimiter(
+                module.params["session_cache_dir"],
+                module.params["hostname"],
+                module.params["max_sessions"],
+                module.params["max_rate"],
+            )
+            client._limiter.acquire()
+        except OSError as err:
+            module.fail_json(msg=f"Failed to set up limiter: {err}")
+    start = time.perf_counter()
+    if socket_path:
+        # the httpapi plugin is already logged in
+        client._session_key = HTTPAPI_SESSION_KEY
+    elif module.params.get("session_cache"):
+        try:
+            client._session_cache = SessionCache(
+                module.params["session_cache_dir"],
+                module.params["hostname"],
+                module.params["login"],
+                module.params["session_cache_ttl"],
+            )
+        except OSError as err:
+            module.fail_json(msg=f"Failed to create session cache: {err}")
+        with client._session_cache as cache:
+            client._session_key = client._login(cache)
+    else:
+        client._session_key = client._login()
+    if transport is not None:
+        # the connection is opened by the first call, don't count it twice
+        startup["connect"] = transport.connect_time
+        startup["login"] = time.perf_counter() - start - transport.connect_time
+
+    return (client, client._session_key)
+
+
+def suma_exit_json(module, client, **kwargs):
+    """Closes the session and exits the module"""
+    client._logout()
+    module.exit_json(suma_stats=client._stats(), **kwargs)
+
+
+def suma_fail_json(module, client, **kwargs):
+    """Closes the session and fails the module"""
+    client._logout()
+    module.fail_json(suma_stats=client._stats(), **kwargs)
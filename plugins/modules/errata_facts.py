@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
+    suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_map,
+)
+from xmlrpc.client import Fault as rpcFault
+
+DOCUMENTATION = """
+---
+module: errata_facts
+author: "Arnaud Patard"
+short_description: Return the errata relevant to SUMA systems
+description:
+   - Returns the errata relevant to the registered systems in the
+     C(suma_errata) fact.
+   - The errata of the systems are fetched concurrently within a single
+     session. Each advisory is returned once in C(advisories), keyed by
+     advisory name, C(affected) gives the ids of the systems needing each
+     advisory and C(systems) the advisories needed by each system.
+   - I(advisory_types) and I(severities) are applied before the indexes
+     are built.
+options:
+   ids:
+     description:
+        - Only return the errata of the systems with these ids.
+        - Defaults to all the registered systems.
+     required: false
+     type: list
+     elements: int
+   workers:
+     description:
+        - Maximum number of concurrent requests.
+     required: false
+     type: int
+     default: 8
+   advisory_types:
+     description:
+        - Only return the advisories of these types.
+     required: false
+     type: list
+     elements: str
+     choices: [ Security Advisory, Bug Fix Advisory, Product Enhancement Advisory ]
+   severities:
+     description:
+        - Only return the advisories with these severities.
+        - The severity of each advisory is added to C(advisories). It
+          needs one more call per advisory.
+     required: false
+     type: list
+     elements: str
+     choices: [ critical, important, moderate, low ]
+extends_documentation_fragment:
+   - apatard.suma.suma
+"""
+
+
+def get_severities(module, client, session_key, advisories):
+    """Adds their severity to advisories"""
+
+    def get_details(thread_client, name):
+        return thread_client.errata.getDetails(session_key, name)
+
+    (details, errors) = suma_map(
+        client, get_details, list(advisories), module.params["workers"]
+    )
+    if errors:
+        (name, error) = next(iter(errors.items()))
+        suma_fail_json(
+            module, client, msg=f"Failed to get errata details of {name}: {error}"
+        )
+    for name, advisory in advisories.items():
+        advisory["severity"] = details[name].get("severity") or ""
+
+
+def index_errata(module, client, session_key, relevant):
+    """Returns the advisories table and the indexes of relevant errata"""
+    advisories = {}
+    for errata in relevant.values():
+        for erratum in errata:
+            name = erratum["advisory_name"]
+            if name not in advisories:
+                advisories[name] = {
+                    k: v for k, v in erratum.items() if k != "advisory_name"
+                }
+
+    types = module.params["advisory_types"]
+    if types is not None:
+        advisories = {
+            name: advisory
+            for name, advisory in advisories.items()
+            if advisory.get("advisory_type") in types
+        }
+    severities = module.params["severities"]
+    if severities is not None:
+        get_severities(module, client, session_key, advisories)
+        advisories = {
+            name: advisory
+            for name, advisory in advisories.items()
+            if advisory["severity"].lower() in severities
+        }
+
+    affected = {name: [] for name in advisories}
+    systems = {}
+    for system_id, errata in relevant.items():
+        names = [e["advisory_name"] for e in errata if e["advisory_name"] in affected]
+        systems[system_id] = names
+        for name in names:
+            affected[name].append(system_id)
+    return {"advisories": advisories, "affected": affected, "systems": systems}
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=suma_argument_spec(
+            ids=dict(required=False, type="list", elements="int"),
+            workers=dict(required=False, type="int", default=8),
+            advisory_types=dict(
+                required=False,
+                type="list",
+                elements="str",
+                choices=[
+                    "Security Advisory",
+                    "Bug Fix Advisory",
+                    "Product Enhancement Advisory",
+                ],
+            ),
+            severities=dict(
+                required=False,
+                type="list",
+                elements="str",
+                choices=["critical", "important", "moderate", "low"],
+            ),
+        ),
+        supports_check_mode=True,
+    )
+
+    (client, session_key) = suma_connect(module)
+
+    system_ids = module.params["ids"]
+    if system_ids is None:
+        try:
+            system_ids = [s["id"] for s in client.system.listSystems(session_key)]
+        except rpcFault as fault:
+            suma_fail_json(module, client, msg=f"Failed to get system list: {fault}")
+
+    def get_errata(thread_client, system_id):
+        return thread_client.system.getRelevantErrata(session_key, system_id)
+
+    (relevant, errors) = suma_map(
+        client, get_errata, system_ids, module.params["workers"]
+    )
+    facts = {"suma_errata": index_errata(module, client, session_key, relevant)}
+    suma_exit_json(module, client, changed=False, ansible_facts=facts, errors=errors)
+
+
+if __name__ == "__main__":
+    main()
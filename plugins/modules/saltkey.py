@@ -5,7 +5,11 @@
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
     suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_matcher,
 )
 from xmlrpc.client import Fault as rpcFault
 
@@ -20,47 +24,148 @@ options:
    key:
      description:
         - name of the key
-     required: true
-   state:
-     description:
-        - state of the key (accepted / rejected / absent)
-     required: true
-   hostname:
+        - Mutually exclusive with I(keys).
+     required: false
+     type: str
+   keys:
      description:
-        - host running the Suse Manager instance.
-     required: true
-   login:
+        - names of the keys to handle in a single run.
+        - The key lists are downloaded once and per-key results are returned
+          in C(results).
+        - Mutually exclusive with I(key).
+     required: false
+     type: list
+     elements: str
+   match:
      description:
-        - account on the Suse Manager instance.
-     required: true
-   password:
+        - How I(keys) are compared to the keys known by Suse Manager.
+        - With C(glob) or C(regex), I(keys) are patterns and only the keys
+          which can reach I(state) are selected, for instance pending keys
+          when I(state=accepted).
+     required: false
+     type: str
+     choices: [ exact, glob, regex ]
+     default: exact
+   state:
      description:
-        - password of the suse manager account
+        - state of the key (accepted / rejected / absent)
      required: true
-   ssl_check:
-     description:
-        - disable SSL check *dangerous*
-     required: false
+extends_documentation_fragment:
+   - apatard.suma.suma
 """
 
+STATE_ACTIONS = {
+    "accepted": "accept",
+    "rejected": "reject",
+    "absent": "delete",
+}
+
+
+def key_status(saltkey, keysets):
+    for status in ("accepted", "pending", "rejected"):
+        if saltkey in keysets[status]:
+            return status
+    return "absent"
+
+
+def plan_key(status, state):
+    """Returns (changed, error) for a key going from status to state"""
+    if status == state:
+        return (False, None)
+    if status == "absent":
+        return (False, "Key not found")
+    if state != "absent" and status != "pending":
+        return (False, f"Key neither {state} nor pending")
+    return (True, None)
+
+
+def select_keys(patterns, match, state, keysets):
+    if match == "exact":
+        return list(dict.fromkeys(patterns))
+
+    # Only pick keys which are either already in the wanted state or can
+    # reach it, so "accept web-*" doesn't fail on rejected keys.
+    if state == "absent":
+        candidates = keysets["accepted"] | keysets["pending"] | keysets["rejected"]
+    else:
+        candidates = keysets[state] | keysets["pending"]
+
+    return sorted(filter(suma_matcher(patterns, match), candidates))
+
+
+def bulk_keys(module, client, session_key, keysets):
+    state = module.params["state"]
+    action = STATE_ACTIONS[state]
+
+    selected = select_keys(
+        module.params["keys"], module.params["match"], state, keysets
+    )
+
+    results = {}
+    before = []
+    after = []
+    failed = []
+    for saltkey in selected:
+        status = key_status(saltkey, keysets)
+        (changed, error) = plan_key(status, state)
+        results[saltkey] = {"changed": changed, "status": status}
+        if error is not None:
+            results[saltkey]["msg"] = error
+            failed.append(saltkey)
+            continue
+        if not changed:
+            continue
+        if not module.check_mode:
+            try:
+                getattr(client.saltkey, action)(session_key, saltkey)
+            except rpcFault as fault:
+                results[saltkey].update(
+                    changed=False, msg=f"Failed to {action} : {fault}"
+                )
+                failed.append(saltkey)
+                continue
+        before.append(f"{saltkey}: {status}\n")
+        after.append(f"{saltkey}: {state}\n")
+
+    changed = len(before) != 0
+    diff = {"before": "".join(before), "after": "".join(after)}
+    if failed:
+        suma_fail_json(
+            module,
+            client,
+            msg=f"Failed to handle keys: {','.join(failed)}",
+            changed=changed,
+            results=results,
+            diff=diff,
+        )
+    suma_exit_json(module, client, changed=changed, results=results, diff=diff)
+
 
 def main():
     module = AnsibleModule(
-        argument_spec=dict(
-            key=dict(required=True),
+        argument_spec=suma_argument_spec(
+            key=dict(required=False),
+            keys=dict(required=False, type="list", elements="str"),
+            match=dict(
+                required=False, default="exact", choices=["exact", "glob", "regex"]
+            ),
             state=dict(
                 required=True,
                 choices=["accepted", "absent", "rejected"],
             ),
-            hostname=dict(required=True),
-            login=dict(required=True),
-            password=dict(required=True, no_log=True),
-            ssl_check=dict(required=False, type="bool", default=True),
         ),
+        mutually_exclusive=[["key", "keys"]],
+        required_one_of=[["key", "keys"]],
         supports_check_mode=True,
     )
 
     saltkey = module.params["key"]
+    # validate patterns before connecting
+    if module.params["keys"] is not None:
+        try:
+            suma_matcher(module.params["keys"], module.params["match"])
+        except ValueError as err:
+            module.fail_json(msg=f"keys: {err}")
 
     (client, session_key) = suma_connect(module)
 
@@ -69,58 +174,56 @@ def main():
         pending_keylist = client.saltkey.pendingList(session_key)
         rejected_keylist = client.saltkey.rejectedList(session_key)
     except rpcFault as fault:
-        module.fail_json(msg=f"Failed to get key infos: {fault}")
+        suma_fail_json(module, client, msg=f"Failed to get key infos: {fault}")
+
+    keysets = {
+        "accepted": set(accepted_keylist),
+        "pending": set(pending_keylist),
+        "rejected": set(rejected_keylist),
+    }
+    if module.params["keys"] is not None:
+        bulk_keys(module, client, session_key, keysets)
 
-    keylist = accepted_keylist + pending_keylist + rejected_keylist
+    accepted_keylist = keysets["accepted"]
+    pending_keylist = keysets["pending"]
+    rejected_keylist = keysets["rejected"]
+    keylist = accepted_keylist | pending_keylist | rejected_keylist
     if saltkey not in keylist:
         if module.params["state"] == "absent":
-            client.auth.logout(session_key)
-            module.exit_json(changed=False)
-        client.auth.logout(session_key)
-        module.fail_json(msg="Key not found")
+            suma_exit_json(module, client, changed=False)
+        suma_fail_json(module, client, msg="Key not found")
 
     if module.params["state"] == "accepted":
         if saltkey in accepted_keylist:
-            client.auth.logout(session_key)
-            module.exit_json(changed=False)
+            suma_exit_json(module, client, changed=False)
         if saltkey not in pending_keylist:
-            client.auth.logout(session_key)
-            module.fail_json(msg="Key neither accepted nor pending")
+            suma_fail_json(module, client, msg="Key neither accepted nor pending")
         if not module.check_mode:
             try:
                 client.saltkey.accept(session_key, saltkey)
             except rpcFault as fault:
-                client.auth.logout(session_key)
-                module.fail_json(msg=f"Failed to accept : {fault}")
-        client.auth.logout(session_key)
-        module.exit_json(changed=True)
+                suma_fail_json(module, client, msg=f"Failed to accept : {fault}")
+        suma_exit_json(module, client, changed=True)
     elif module.params["state"] == "absent":
         if not module.check_mode:
             try:
                 client.saltkey.delete(session_key, saltkey)
             except rpcFault as fault:
-                client.auth.logout(session_key)
-                module.fail_json(msg=f"Failed to delete : {fault}")
-        client.auth.logout(session_key)
-        module.exit_json(changed=True)
+                suma_fail_json(module, client, msg=f"Failed to delete : {fault}")
+        suma_exit_json(module, client, changed=True)
     elif module.params["state"] == "rejected":
         if saltkey in rejected_keylist:
-            client.auth.logout(session_key)
-            module.exit_json(changed=False)
+            suma_exit_json(module, client, changed=False)
         if saltkey not in pending_keylist:
-            client.auth.logout(session_key)
-            module.fail_json(msg="Key neither rejected nor pending")
+            suma_fail_json(module, client, msg="Key neither rejected nor pending")
         if not module.check_mode:
             try:
                 client.saltkey.reject(session_key, saltkey)
             except rpcFault as fault:
-                client.auth.logout(session_key)
-                module.fail_json(msg=f"Failed to reject : {fault}")
-        client.auth.logout(session_key)
-        module.exit_json(changed=True)
+                suma_fail_json(module, client, msg=f"Failed to reject : {fault}")
+        suma_exit_json(module, client, changed=True)
 
-    client.auth.logout(session_key)
-    module.fail_json(msg="Should not be reached")
+    suma_fail_json(module, client, msg="Should not be reached")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,341 @@
+#!/usr/bin/python
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
+    suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_map,
+    suma_wait,
+)
+from xmlrpc.client import Fault as rpcFault
+import datetime
+import time
+
+DOCUMENTATION = """
+---
+module: system_action
+author: "Arnaud Patard"
+short_description: Schedule an action on SUMA systems and wait for it
+description:
+   - Schedules a package install, a full package upgrade, errata, a reboot
+     or a highstate on several systems at once and waits for the actions
+     to be done.
+   - Actions are scheduled for all the systems with a single call, except
+     reboots which are scheduled one system at a time. The systems of each
+     action are then asked to the server, as a call may return several
+     actions.
+   - All the actions are tracked with a single query of the actions in
+     progress, repeated with an exponential backoff. The outcome of each
+     system is only asked once an action is no longer in progress. A system
+     not listed in the outcome of a finished action is asked again on the
+     next query before being reported as C(unknown).
+options:
+   ids:
+     description:
+        - Ids of the systems.
+     required: true
+     type: list
+     elements: int
+   action:
+     description:
+        - Action to schedule.
+        - C(package_upgrade) upgrades all the packages.
+     required: true
+     type: str
+     choices: [ package_install, package_upgrade, errata_apply, reboot, highstate ]
+   package_ids:
+     description:
+        - Ids of the packages to install with C(package_install).
+     required: false
+     type: list
+     elements: int
+   errata_ids:
+     description:
+        - Ids of the errata to apply with C(errata_apply).
+     required: false
+     type: list
+     elements: int
+   highstate_test:
+     description:
+        - Run the highstate in test mode.
+     required: false
+     type: bool
+     default: false
+   wait:
+     description:
+        - Wait for the actions to be done. Otherwise, only the ids of the
+          scheduled actions are returned.
+     required: false
+     type: bool
+     default: true
+   timeout:
+     description:
+        - Maximum number of seconds to wait for the actions.
+     required: false
+     type: int
+     default: 600
+   delay:
+     description:
+        - Initial number of seconds between two queries. It's doubled after
+          each query, up to I(max_delay).
+     required: false
+     type: float
+     default: 2
+   max_delay:
+     description:
+        - Maximum number of seconds between two queries.
+     required: false
+     type: float
+     default: 30
+   workers:
+     description:
+        - Maximum number of concurrent requests when scheduling reboots.
+     required: false
+     type: int
+     default: 8
+extends_documentation_fragment:
+   - apatard.suma.suma
+"""
+
+
+def schedule(module, client, session_key):
+    """Schedules the action and returns the systems of each action id and
+    the scheduling errors of each system.
+    """
+    ids = module.params["ids"]
+    action = module.params["action"]
+    # as soon as possible, whatever the timezone of the server
+    earliest = datetime.datetime.now() - datetime.timedelta(days=1)
+
+    if action == "reboot":
+
+        def reboot(thread_client, system_id):
+            return thread_client.system.scheduleReboot(session_key, system_id, earliest)
+
+        (action_ids, errors) = suma_map(client, reboot, ids, module.params["workers"])
+        return ({a: [i] for i, a in action_ids.items()}, errors)
+
+    try:
+        if action == "package_install":
+            action_ids = client.system.schedulePackageInstall(
+                session_key, ids, module.params["package_ids"], earliest
+            )
+        elif action == "package_upgrade":
+            action_ids = client.system.schedulePackageUpdate(session_key, ids, earliest)
+        elif action == "errata_apply":
+            action_ids = client.system.scheduleApplyErrata(
+                session_key, ids, module.params["errata_ids"], earliest
+            )
+        else:
+            action_ids = client.system.scheduleApplyHighstate(
+                session_key, ids, earliest, module.params["highstate_test"]
+            )
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to schedule {action}: {fault}")
+    # errata are applied with one action per erratum
+    if not isinstance(action_ids, list):
+        action_ids = [action_ids]
+    actions = action_systems(module, client, session_key, action_ids)
+    scheduled = {i for system_ids in actions.values() for i in system_ids}
+    errors = {i: "No action scheduled" for i in ids if i not in scheduled}
+    return (actions, errors)
+
+
+def action_systems(module, client, session_key, action_ids):
+    """Returns the systems of each action, as listed by the server"""
+
+    def get_systems(thread_client, action_id):
+        system_ids = []
+        # in progress first, so that a system finishing meanwhile is listed
+        for method in (
+            thread_client.schedule.listInProgressSystems,
+            thread_client.schedule.listCompletedSystems,
+            thread_client.schedule.listFailedSystems,
+        ):
+            for summary in method(session_key, action_id):
+                if summary["server_id"] not in system_ids:
+                    system_ids.append(summary["server_id"])
+        return system_ids
+
+    (actions, errors) = suma_map(
+        client, get_systems, action_ids, module.params["workers"]
+    )
+    if errors:
+        (action_id, error) = next(iter(errors.items()))
+        suma_fail_json(
+            module,
+            client,
+            msg=f"Failed to get the systems of action {action_id}: {error}",
+            actions={a: None for a in action_ids},
+        )
+    return {a: actions[a] for a in action_ids}
+
+
+def track(module, client, session_key, actions, systems):
+    """Waits for the actions and fills the outcome of their systems.
+
+    Returns the elapsed time and the number of queries.
+    """
+    start = time.monotonic()
+    pending = set(actions)
+    # finished actions with systems not listed yet
+    unlisted = set()
+
+    def done(action_id, status, summaries):
+        for summary in summaries:
+            outcome = systems.get(summary["server_id"])
+            if outcome is None:
+                continue
+            outcome["actions"][action_id] = {
+                "status": status,
+                "message": summary.get("message"),
+                "timestamp": summary.get("timestamp"),
+            }
+
+    def probe():
+        in_progress = {
+            a["id"] for a in client.schedule.listInProgressActions(session_key)
+        }
+        elapsed = time.monotonic() - start
+        for action_id in pending - in_progress:
+            done(
+                action_id,
+                "completed",
+                client.schedule.listCompletedSystems(session_key, action_id),
+            )
+            done(
+                action_id,
+                "failed",
+                client.schedule.listFailedSystems(session_key, action_id),
+            )
+            missing = [
+                i for i in actions[action_id] if action_id not in systems[i]["actions"]
+            ]
+            if missing and action_id not in unlisted:
+                # the outcome may not be recorded yet, ask again next time
+                unlisted.add(action_id)
+            else:
+                for system_id in missing:
+                    # still not listed, for instance when the action was canceled
+                    systems[system_id]["actions"][action_id] = {
+                        "status": "unknown",
+                        "message": None,
+                        "timestamp": None,
+                    }
+                pending.discard(action_id)
+            for system_id in actions[action_id]:
+                outcome = systems[system_id]
+                if (
+                    outcome["elapsed"] is None
+                    and len(outcome["actions"]) == outcome["scheduled"]
+                ):
+                    outcome["elapsed"] = elapsed
+        pending.intersection_update(in_progress | unlisted)
+        return True if not pending else None
+
+    try:
+        (result, elapsed, attempts) = suma_wait(
+            probe,
+            module.params["timeout"],
+            module.params["delay"],
+            module.params["max_delay"],
+        )
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to get actions status: {fault}")
+    return (elapsed, attempts)
+
+
+def system_status(outcome):
+    statuses = {a["status"] for a in outcome["actions"].values()}
+    if len(outcome["actions"]) < outcome["scheduled"]:
+        return "pending"
+    for status in ("failed", "unknown"):
+        if status in statuses:
+            return status
+    return "completed"
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=suma_argument_spec(
+            ids=dict(required=True, type="list", elements="int"),
+            action=dict(
+                required=True,
+                choices=[
+                    "package_install",
+                    "package_upgrade",
+                    "errata_apply",
+                    "reboot",
+                    "highstate",
+                ],
+            ),
+            package_ids=dict(required=False, type="list", elements="int"),
+            errata_ids=dict(required=False, type="list", elements="int"),
+            highstate_test=dict(required=False, type="bool", default=False),
+            wait=dict(required=False, type="bool", default=True),
+            timeout=dict(required=False, type="int", default=600),
+            delay=dict(required=False, type="float", default=2),
+            max_delay=dict(required=False, type="float", default=30),
+            workers=dict(required=False, type="int", default=8),
+        ),
+        required_if=[
+            ["action", "package_install", ["package_ids"]],
+            ["action", "errata_apply", ["errata_ids"]],
+        ],
+        supports_check_mode=True,
+    )
+
+    (client, session_key) = suma_connect(module)
+
+    if module.check_mode:
+        suma_exit_json(module, client, changed=True)
+
+    (actions, errors) = schedule(module, client, session_key)
+    if not module.params["wait"]:
+        suma_exit_json(
+            module, client, changed=bool(actions), actions=actions, errors=errors
+        )
+
+    systems = {}
+    for action_id, system_ids in actions.items():
+        for system_id in system_ids:
+            outcome = systems.setdefault(
+                system_id, {"scheduled": 0, "actions": {}, "elapsed": None}
+            )
+            outcome["scheduled"] += 1
+    (elapsed, attempts) = track(module, client, session_key, actions, systems)
+    for outcome in systems.values():
+        outcome["status"] = system_status(outcome)
+        del outcome["scheduled"]
+
+    result = dict(
+        changed=bool(actions),
+        actions=actions,
+        systems=systems,
+        errors=errors,
+        elapsed=elapsed,
+        attempts=attempts,
+    )
+    pending = [i for i, o in systems.items() if o["status"] == "pending"]
+    failed = [i for i, o in systems.items() if o["status"] in ("failed", "unknown")]
+    if pending:
+        suma_fail_json(
+            module, client, msg=f"Timeout waiting for {len(pending)} systems", **result
+        )
+    if failed or errors:
+        suma_fail_json(
+            module,
+            client,
+            msg=f"Action failed on {len(failed) + len(errors)} systems",
+            **result,
+        )
+    suma_exit_json(module, client, **result)
+
+
+if __name__ == "__main__":
+    main()
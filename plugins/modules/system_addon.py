@@ -5,7 +5,11 @@
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
     suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_map,
 )
 from xmlrpc.client import Fault as rpcFault
 
@@ -16,12 +20,28 @@ author: "Arnaud Patard"
 short_description: Set system entitlements / add-on
 description:
    - Set system entitlements / add-on
+   - With I(ids), the add-ons of many systems are reconciled at once. The
+     current add-ons are found with one system.listSystemsWithEntitlement
+     call per add-on and only the systems needing a change are updated.
 options:
    id:
      description:
         - system id
-     required: true
+        - Mutually exclusive with I(ids).
+     required: false
+     type: int
+   ids:
+     description:
+        - list of system ids
+     required: false
+     type: list
+     elements: int
+   workers:
+     description:
+        - Maximum number of concurrent updates when using I(ids).
+     required: false
      type: int
+     default: 8
    addon:
      description:
         - List of entitlements to enable/disable
@@ -34,26 +54,8 @@ options:
      required: true
      type: str
      choices: [ absent, present ]
-   hostname:
-     description:
-        - host running the Suse Manager instance.
-     required: true
-     type: str
-   login:
-     description:
-        - account on the Suse Manager instance.
-     required: true
-     type: str
-   password:
-     description:
-        - password of the suse manager account
-     required: true
-     type: str
-   ssl_check:
-     description:
-        - disable SSL check *dangerous*
-     required: false
-     type: bool
+extends_documentation_fragment:
+   - apatard.suma.suma
 """
 
 AVAILABLE_ADDONS = {
@@ -65,17 +67,73 @@ AVAILABLE_ADDONS = {
 }
 
 
+def addon_index(client, session_key):
+    """Returns {system id: set of enabled add-ons}"""
+    index = {}
+    for addon in AVAILABLE_ADDONS:
+        for system in client.system.listSystemsWithEntitlement(session_key, addon):
+            index.setdefault(system["id"], set()).add(addon)
+    return index
+
+
+def bulk_addons(module, client, session_key, addons):
+    try:
+        index = addon_index(client, session_key)
+    except rpcFault as fault:
+        suma_fail_json(
+            module, client, msg=f"Failed to get systems add-ons list: {fault}"
+        )
+
+    changes = {}
+    for system_id in dict.fromkeys(module.params["ids"]):
+        cur_en_addons = index.get(system_id, set())
+        if module.params["state"] == "present":
+            todo = addons - cur_en_addons
+            after = cur_en_addons | addons
+        else:
+            todo = addons & cur_en_addons
+            after = cur_en_addons - addons
+        if todo:
+            changes[system_id] = (sorted(todo), cur_en_addons, after)
+
+    before = "".join(f"{i}: {','.join(sorted(c[1]))}\n" for i, c in changes.items())
+    after = "".join(f"{i}: {','.join(sorted(c[2]))}\n" for i, c in changes.items())
+    diff = {"before": before, "after": after}
+    if module.check_mode or not changes:
+        suma_exit_json(module, client, changed=len(changes) != 0, diff=diff, errors={})
+
+    if module.params["state"] == "present":
+
+        def update(thread_client, system_id):
+            thread_client.system.addEntitlements(
+                session_key, system_id, changes[system_id][0]
+            )
+
+    else:
+
+        def update(thread_client, system_id):
+            thread_client.system.removeEntitlements(
+                session_key, system_id, changes[system_id][0]
+            )
+
+    (done, errors) = suma_map(client, update, changes, module.params["workers"])
+    result = dict(changed=len(done) != 0, diff=diff, errors=errors)
+    if errors:
+        suma_fail_json(module, client, msg="Failed to update some systems", **result)
+    suma_exit_json(module, client, **result)
+
+
 def main():
     module = AnsibleModule(
-        argument_spec=dict(
-            id=dict(required=True, type="int"),
+        argument_spec=suma_argument_spec(
+            id=dict(required=False, type="int"),
+            ids=dict(required=False, type="list", elements="int"),
+            workers=dict(required=False, type="int", default=8),
             addon=dict(required=True, type="list", elements="str"),
             state=dict(required=True, choices=["present", "absent"]),
-            hostname=dict(required=True),
-            login=dict(required=True),
-            password=dict(required=True, no_log=True),
-            ssl_check=dict(required=False, type="bool", default=True),
         ),
+        mutually_exclusive=[["id", "ids"]],
+        required_one_of=[["id", "ids"]],
         supports_check_mode=True,
     )
 
@@ -87,13 +145,17 @@ def main():
 
     (client, session_key) = suma_connect(module)
 
+    if module.params["ids"] is not None:
+        bulk_addons(module, client, session_key, addons)
+
     try:
         cur_en_addons = set(
             client.system.getEntitlements(session_key, module.params["id"])
         )
     except rpcFault as fault:
-        client.auth.logout(session_key)
-        module.fail_json(msg=f"Failed to get system add-ons list: {fault}")
+        suma_fail_json(
+            module, client, msg=f"Failed to get system add-ons list: {fault}"
+        )
     cur_dis_addons = AVAILABLE_ADDONS - cur_en_addons
 
     # systems have salt_entitled when managed by salt
@@ -103,50 +165,41 @@ def main():
 
     if module.params["state"] == "absent":
         if cur_dis_addons == addons:
-            client.auth.logout(session_key)
-            module.exit_json(changed=False)
+            suma_exit_json(module, client, changed=False)
         diff = {
             "before": f"{','.join(cur_en_addons)}\n",
             "after": f"{','.join(cur_en_addons - addons)}\n",
         }
         if module.check_mode:
-            client.auth.logout(session_key)
-            module.exit_json(changed=True, diff=diff)
+            suma_exit_json(module, client, changed=True, diff=diff)
         try:
             client.system.removeEntitlements(
                 session_key, module.params["id"], list(addons)
             )
         except rpcFault as fault:
-            client.auth.logout(session_key)
-            module.fail_json(msg=f"Failed to get remove add-on: {fault}")
+            suma_fail_json(module, client, msg=f"Failed to get remove add-on: {fault}")
 
-        client.auth.logout(session_key)
-        module.exit_json(changed=True, diff=diff)
+        suma_exit_json(module, client, changed=True, diff=diff)
 
     if module.params["state"] == "present":
         if cur_en_addons == addons:
-            client.auth.logout(session_key)
-            module.exit_json(changed=False)
+            suma_exit_json(module, client, changed=False)
         diff = {
             "before": f"{','.join(cur_en_addons)}\n",
             "after": f"{','.join(addons)}\n",
         }
         if module.check_mode:
-            client.auth.logout(session_key)
-            module.exit_json(changed=True, diff=diff)
+            suma_exit_json(module, client, changed=True, diff=diff)
         try:
             client.system.addEntitlements(
                 session_key, module.params["id"], list(addons)
             )
         except rpcFault as fault:
-            client.auth.logout(session_key)
-            module.fail_json(msg=f"Failed to get add add-on: {fault}")
+            suma_fail_json(module, client, msg=f"Failed to get add add-on: {fault}")
 
-        client.auth.logout(session_key)
-        module.exit_json(changed=True, diff=diff)
+        suma_exit_json(module, client, changed=True, diff=diff)
 
-    client.auth.logout(session_key)
-    module.fail_json(msg="Should not be reached")
+    suma_fail_json(module, client, msg="Should not be reached")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
+    suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_map,
+    suma_wait,
+)
+import ipaddress
+import time
+
+DOCUMENTATION = """
+---
+module: system_bootstrap
+author: "Arnaud Patard"
+short_description: Bootstrap systems from SUMA
+description:
+   - Asks Suse Manager to bootstrap hosts over SSH with system.bootstrap,
+     the hosts being registered with an activation key. Nothing runs on
+     the hosts from Ansible.
+   - Several hosts are bootstrapped concurrently within a single session,
+     at most I(workers) at once. The hosts already registered, looked up
+     by IP address or hostname, are skipped.
+   - The outcome of each host is returned in C(hosts), with the time
+     taken by the bootstrap and, with I(wait), until the system is
+     registered.
+options:
+   hosts:
+     description:
+        - Hostnames or IP addresses of the hosts to bootstrap, reachable
+          over SSH from Suse Manager. The systems are found with an exact
+          match of their hostname or IP address.
+     required: true
+     type: list
+     elements: str
+   activation_key:
+     description:
+        - Activation key used to register the systems.
+     required: true
+     type: str
+   ssh_user:
+     description:
+        - SSH user on the hosts.
+     required: false
+     type: str
+     default: root
+   ssh_port:
+     description:
+        - SSH port of the hosts.
+     required: false
+     type: int
+     default: 22
+   ssh_password:
+     description:
+        - SSH password of I(ssh_user).
+        - Mutually exclusive with I(ssh_private_key).
+     required: false
+     type: str
+   ssh_private_key:
+     description:
+        - Content of the SSH private key of I(ssh_user).
+     required: false
+     type: str
+   ssh_private_key_password:
+     description:
+        - Password of I(ssh_private_key).
+     required: false
+     type: str
+   salt_ssh:
+     description:
+        - Manage the systems with salt-ssh instead of a salt minion.
+     required: false
+     type: bool
+     default: false
+   workers:
+     description:
+        - Maximum number of hosts bootstrapped concurrently.
+     required: false
+     type: int
+     default: 8
+   wait:
+     description:
+        - Wait for the systems to be registered.
+     required: false
+     type: bool
+     default: true
+   timeout:
+     description:
+        - Maximum number of seconds to wait for each system, after its
+          bootstrap.
+     required: false
+     type: int
+     default: 300
+   delay:
+     description:
+        - Initial number of seconds between two queries. It's doubled after
+          each query, up to I(max_delay).
+     required: false
+     type: float
+     default: 2
+   max_delay:
+     description:
+        - Maximum number of seconds between two queries.
+     required: false
+     type: float
+     default: 15
+extends_documentation_fragment:
+   - apatard.suma.suma
+"""
+
+
+def find_host(client, session_key, host):
+    """Returns the id of the system registered as host, or None"""
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        (attr, results) = ("hostname", client.system.search.hostname(session_key, host))
+    else:
+        (attr, results) = ("ip", client.system.search.ip(session_key, host))
+    # searches are not exact matches
+    for result in results:
+        if result.get(attr) == host:
+            return result["id"]
+    return None
+
+
+def bootstrap_host(module, client, session_key, host):
+    """Bootstraps host unless it's registered and returns its outcome"""
+    params = module.params
+    system_id = find_host(client, session_key, host)
+    if system_id is not None:
+        return dict(status="present", system_id=system_id)
+    if module.check_mode:
+        return dict(status="bootstrapped")
+
+    start = time.perf_counter()
+    if params["ssh_private_key"] is not None:
+        client.system.bootstrapWithPrivateSshKey(
+            session_key,
+            host,
+            params["ssh_port"],
+            params["ssh_user"],
+            params["ssh_private_key"],
+            params["ssh_private_key_password"] or "",
+            params["activation_key"],
+            params["salt_ssh"],
+        )
+    else:
+        client.system.bootstrap(
+            session_key,
+            host,
+            params["ssh_port"],
+            params["ssh_user"],
+            params["ssh_password"],
+            params["activation_key"],
+            params["salt_ssh"],
+        )
+    outcome = dict(status="bootstrapped", bootstrap_time=time.perf_counter() - start)
+    if not params["wait"]:
+        return outcome
+
+    def probe():
+        return find_host(client, session_key, host)
+
+    (system_id, elapsed, attempts) = suma_wait(
+        probe, params["timeout"], params["delay"], params["max_delay"]
+    )
+    if system_id is None:
+        outcome["status"] = "timeout"
+    else:
+        outcome.update(
+            status="registered",
+            system_id=system_id,
+            registration_time=time.perf_counter() - start,
+        )
+    return outcome
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=suma_argument_spec(
+            hosts=dict(required=True, type="list", elements="str"),
+            activation_key=dict(required=True, no_log=False),
+            ssh_user=dict(required=False, default="root"),
+            ssh_port=dict(required=False, type="int", default=22),
+            ssh_password=dict(required=False, no_log=True),
+            ssh_private_key=dict(required=False, no_log=True),
+            ssh_private_key_password=dict(required=False, no_log=True),
+            salt_ssh=dict(required=False, type="bool", default=False),
+            workers=dict(required=False, type="int", default=8),
+            wait=dict(required=False, type="bool", default=True),
+            timeout=dict(required=False, type="int", default=300),
+            delay=dict(required=False, type="float", default=2),
+            max_delay=dict(required=False, type="float", default=15),
+        ),
+        mutually_exclusive=[["ssh_password", "ssh_private_key"]],
+        required_one_of=[["ssh_password", "ssh_private_key"]],
+        supports_check_mode=True,
+    )
+
+    (client, session_key) = suma_connect(module)
+
+    def bootstrap(thread_client, host):
+        return bootstrap_host(module, thread_client, session_key, host)
+
+    (outcomes, errors) = suma_map(
+        client, bootstrap, module.params["hosts"], module.params["workers"]
+    )
+    hosts = {}
+    for host in dict.fromkeys(module.params["hosts"]):
+        if host in errors:
+            hosts[host] = dict(status="failed", error=errors[host])
+        else:
+            hosts[host] = outcomes[host]
+
+    changed = any(
+        h["status"] in ("bootstrapped", "registered", "timeout") for h in hosts.values()
+    )
+    result = dict(changed=changed, hosts=hosts)
+    failed = [h for h, o in hosts.items() if o["status"] in ("failed", "timeout")]
+    if failed:
+        suma_fail_json(
+            module,
+            client,
+            msg=f"Failed to bootstrap {len(failed)} hosts: {', '.join(failed)}",
+            **result,
+        )
+    suma_exit_json(module, client, **result)
+
+
+if __name__ == "__main__":
+    main()
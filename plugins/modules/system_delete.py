@@ -5,7 +5,12 @@
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    NO_SUCH_SYSTEM_FAULT_CODE,
+    suma_argument_spec,
     suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_matcher,
 )
 from xmlrpc.client import Fault as rpcFault
 
@@ -16,47 +21,267 @@ author: "Arnaud Patard"
 short_description: Delete a system from SUMA
 description:
    - Delete synchronously a system
+   - Several systems can be deleted at once with I(ids) or I(names). They
+     are deleted with system.deleteSystems, I(batch_size) systems per call,
+     and the systems deleted, missing or in error are returned.
+   - With I(inactive_days), the systems which did not check in for that
+     many days are purged, optionally filtered on their hostname with
+     I(include) and I(exclude). Nothing is deleted when there are more
+     than I(max_delete) of them. In check mode, the systems which would
+     be deleted are returned.
 options:
    id:
      description:
         - system id
-     required: true
-   cleanup_type:
+        - Mutually exclusive with I(ids), I(names) and I(inactive_days).
+     required: false
+     type: int
+   ids:
      description:
-        - Cleanup behaviour
-     required: true
-   hostname:
+        - list of system ids to delete
+     required: false
+     type: list
+     elements: int
+   names:
      description:
-        - host running the Suse Manager instance.
-     required: true
-   login:
+        - list of system names to delete. All the systems registered with
+          one of these names are deleted.
+     required: false
+     type: list
+     elements: str
+   inactive_days:
      description:
-        - account on the Suse Manager instance.
-     required: true
-   password:
+        - Purge the systems which did not check in for this number of days.
+     required: false
+     type: int
+   include:
      description:
-        - password of the suse manager account
-     required: true
-   ssl_check:
+        - With I(inactive_days), only purge the systems whose hostname
+          matches one of these patterns.
+     required: false
+     type: list
+     elements: str
+   exclude:
      description:
-        - disable SSL check *dangerous*
+        - With I(inactive_days), never purge the systems whose hostname
+          matches one of these patterns.
      required: false
+     type: list
+     elements: str
+   match:
+     description:
+        - How I(include) and I(exclude) patterns are matched.
+     required: false
+     type: str
+     choices: [ exact, glob, regex ]
+     default: glob
+   max_delete:
+     description:
+        - With I(inactive_days), fail without deleting anything when more
+          systems than this would be purged.
+     required: false
+     type: int
+     default: 50
+   batch_size:
+     description:
+        - Number of systems deleted per system.deleteSystems call.
+     required: false
+     type: int
+     default: 100
+   cleanup:
+     description:
+        - Cleanup behaviour
+     required: true
+     type: str
+     choices: [ fail_on_err, none, force ]
+extends_documentation_fragment:
+   - apatard.suma.suma
 """
 
 
+def system_exists(client, session_key, system_id):
+    try:
+        client.system.getName(session_key, system_id)
+    except rpcFault as fault:
+        if fault.faultCode == NO_SUCH_SYSTEM_FAULT_CODE:
+            return False
+        raise
+    return True
+
+
+def resolve_names(client, session_key, names):
+    """Returns ({name: [ids]}, [missing names])"""
+    found = {}
+    missing = []
+    for name in names:
+        ids = [s["id"] for s in client.system.getId(session_key, name)]
+        if ids:
+            found[name] = ids
+        else:
+            missing.append(name)
+    return (found, missing)
+
+
+def delete_systems(module, client, session_key, system_ids, cleanup, missing):
+    """Deletes system_ids by batches and returns (deleted, errors)
+
+    Systems which disappeared in the meantime are added to missing.
+    """
+    batch_size = module.params["batch_size"]
+    deleted = []
+    errors = {}
+    for i in range(0, len(system_ids), batch_size):
+        batch = system_ids[i : i + batch_size]
+        if module.check_mode:
+            deleted.extend(batch)
+            continue
+        try:
+            client.system.deleteSystems(session_key, batch, cleanup)
+            deleted.extend(batch)
+            continue
+        except rpcFault:
+            pass
+        # find out which systems of the batch are failing
+        for system_id in batch:
+            try:
+                client.system.deleteSystem(session_key, system_id, cleanup)
+                deleted.append(system_id)
+            except rpcFault as fault:
+                if fault.faultCode == NO_SUCH_SYSTEM_FAULT_CODE:
+                    missing.append(system_id)
+                else:
+                    errors[system_id] = str(fault)
+    return (deleted, errors)
+
+
+def inactive_systems(module, client, session_key):
+    """Returns the inactive systems matching include and exclude"""
+    systems = client.system.listInactiveSystems(
+        session_key, module.params["inactive_days"]
+    )
+    include = module.params["include"]
+    exclude = module.params["exclude"]
+    if not systems or (include is None and exclude is None):
+        return systems
+
+    # the hostname is not in the inactive systems list
+    networks = client.system.getNetworkForSystems(
+        session_key, [s["id"] for s in systems]
+    )
+    hostnames = {n["system_id"]: n.get("hostname") or "" for n in networks}
+    if include is not None:
+        matcher = suma_matcher(include, module.params["match"])
+        systems = [s for s in systems if matcher(hostnames.get(s["id"], ""))]
+    if exclude is not None:
+        matcher = suma_matcher(exclude, module.params["match"])
+        systems = [s for s in systems if not matcher(hostnames.get(s["id"], ""))]
+    for system in systems:
+        system["hostname"] = hostnames.get(system["id"])
+    return systems
+
+
+def purge(module, client, session_key, cleanup):
+    try:
+        systems = inactive_systems(module, client, session_key)
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to get inactive systems: {fault}")
+
+    if len(systems) > module.params["max_delete"]:
+        suma_fail_json(
+            module,
+            client,
+            msg=f"{len(systems)} systems to purge, more than max_delete "
+            f"({module.params['max_delete']})",
+            systems=systems,
+        )
+
+    missing = []
+    (deleted, errors) = delete_systems(
+        module, client, session_key, [s["id"] for s in systems], cleanup, missing
+    )
+    result = dict(
+        changed=len(deleted) != 0,
+        deleted=deleted,
+        missing=missing,
+        errors=errors,
+        systems=systems,
+    )
+    if errors:
+        suma_fail_json(module, client, msg="Failed to delete some systems", **result)
+    suma_exit_json(module, client, **result)
+
+
+def delete_batch(module, client, session_key, cleanup):
+    missing = []
+    try:
+        if module.params["names"] is not None:
+            (found, missing) = resolve_names(
+                client, session_key, module.params["names"]
+            )
+            system_ids = [i for ids in found.values() for i in ids]
+        elif module.check_mode:
+            # nothing is deleted to tell the missing systems, ask for each
+            system_ids = []
+            for system_id in dict.fromkeys(module.params["ids"]):
+                if system_exists(client, session_key, system_id):
+                    system_ids.append(system_id)
+                else:
+                    missing.append(system_id)
+        else:
+            # the missing systems are found by delete_systems
+            system_ids = module.params["ids"]
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to get list of systems: {fault}")
+
+    system_ids = list(dict.fromkeys(system_ids))
+    (deleted, errors) = delete_systems(
+        module, client, session_key, system_ids, cleanup, missing
+    )
+    result = dict(
+        changed=len(deleted) != 0, deleted=deleted, missing=missing, errors=errors
+    )
+    if errors:
+        suma_fail_json(module, client, msg="Failed to delete some systems", **result)
+    suma_exit_json(module, client, **result)
+
+
 def main():
     module = AnsibleModule(
-        argument_spec=dict(
-            id=dict(required=True, type="int"),
+        argument_spec=suma_argument_spec(
+            id=dict(required=False, type="int"),
+            ids=dict(required=False, type="list", elements="int"),
+            names=dict(required=False, type="list", elements="str"),
+            inactive_days=dict(required=False, type="int"),
+            include=dict(required=False, type="list", elements="str"),
+            exclude=dict(required=False, type="list", elements="str"),
+            match=dict(
+                required=False, default="glob", choices=["exact", "glob", "regex"]
+            ),
+            max_delete=dict(required=False, type="int", default=50),
+            batch_size=dict(required=False, type="int", default=100),
             cleanup=dict(required=True, choices=["fail_on_err", "none", "force"]),
-            hostname=dict(required=True),
-            login=dict(required=True),
-            password=dict(required=True, no_log=True),
-            ssl_check=dict(required=False, type="bool", default=True),
         ),
+        mutually_exclusive=[["id", "ids", "names", "inactive_days"]],
+        required_one_of=[["id", "ids", "names", "inactive_days"]],
+        required_by={"include": "inactive_days", "exclude": "inactive_days"},
         supports_check_mode=True,
     )
 
+    if module.params["batch_size"] < 1:
+        module.fail_json(msg="batch_size must be a positive number")
+    if module.params["inactive_days"] is not None:
+        if module.params["inactive_days"] < 1:
+            module.fail_json(msg="inactive_days must be a positive number")
+        if module.params["max_delete"] < 0:
+            module.fail_json(msg="max_delete must be positive")
+    # validate patterns before connecting
+    for option in ("include", "exclude"):
+        if module.params[option] is not None:
+            try:
+                suma_matcher(module.params[option], module.params["match"])
+            except ValueError as err:
+                module.fail_json(msg=f"{option}: {err}")
+
     if module.params["cleanup"] == "fail_on_err":
         cleanup = "FAIL_ON_CLEANUP_ERR"
     elif module.params["cleanup"] == "none":
@@ -66,27 +291,25 @@ def main():
 
     (client, session_key) = suma_connect(module)
 
-    try:
-        syslist = client.system.listSystems(session_key)
-    except rpcFault as fault:
-        client.auth.logout(session_key)
-        module.fail_json(msg=f"Failed to get list of systems: {fault}")
+    if module.params["inactive_days"] is not None:
+        purge(module, client, session_key, cleanup)
+
+    if module.params["id"] is None:
+        delete_batch(module, client, session_key, cleanup)
 
     try:
-        next(sysinfo for sysinfo in syslist if sysinfo["id"] == module.params["id"])
-    except StopIteration:
-        client.auth.logout(session_key)
-        module.exit_json(changed=False)
+        if not system_exists(client, session_key, module.params["id"]):
+            suma_exit_json(module, client, changed=False)
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to get system: {fault}")
 
     try:
         if not module.check_mode:
             client.system.deleteSystem(session_key, module.params["id"], cleanup)
     except rpcFault as fault:
-        client.auth.logout(session_key)
-        module.fail_json(msg=f"Failed to delete system: {fault}")
+        suma_fail_json(module, client, msg=f"Failed to delete system: {fault}")
 
-    client.auth.logout(session_key)
-    module.exit_json(changed=True)
+    suma_exit_json(module, client, changed=True)
 
 
 if __name__ == "__main__":
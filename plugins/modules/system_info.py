@@ -5,7 +5,12 @@
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
     suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_map,
+    suma_write_json,
 )
 from xmlrpc.client import Fault as rpcFault
 
@@ -15,58 +20,223 @@ module: system_info
 author: "Arnaud Patard"
 short_description: Return info about a system registered to SUMA
 description:
-   - Returns product list of a host
+   - Returns the installed products, details, network, installed packages,
+     relevant errata or entitlements of a host.
+   - All the requested kinds of I(info) are fetched concurrently within a
+     single session. With a single kind, I(info) is returned as is.
+     Otherwise, it's a dict keyed by kind.
+   - With I(ids), the infos of several systems are fetched concurrently
+     within a single session and returned keyed by system id.
 options:
    id:
      description:
         - system id
-     required: true
-   info:
+        - Mutually exclusive with I(ids).
+     required: false
+     type: int
+   ids:
      description:
-        - system infos to return
-     required: true
-   hostname:
+        - list of system ids, or C(all) for all the registered systems.
+     required: false
+     type: list
+     elements: str
+   workers:
      description:
-        - host running the Suse Manager instance.
-     required: true
-   login:
+        - Maximum number of concurrent requests.
+     required: false
+     type: int
+     default: 8
+   info:
      description:
-        - account on the Suse Manager instance.
+        - system infos to return
      required: true
-   password:
+     type: list
+     elements: str
+     choices: [products, details, network, packages, errata, entitlements]
+   fields:
      description:
-        - password of the suse manager account
-     required: true
-   ssl_check:
+        - Dict of field lists keyed by kind. Only these fields of the infos
+          of each kind are returned, for instance the C(name) and C(version)
+          of C(packages).
+     required: false
+     type: dict
+   output_paths:
      description:
-        - disable SSL check *dangerous*
+        - Dict of JSON file paths keyed by kind. The infos of these kinds
+          are written in the files instead of being returned in I(info).
+          With I(ids), the files hold the infos keyed by system id.
+        - Nothing is written in check mode.
      required: false
+     type: dict
+extends_documentation_fragment:
+   - apatard.suma.suma
 """
 
+# API method and description of each kind of info
+INFO_KINDS = {
+    "products": ("system.getInstalledProducts", "installed products list"),
+    "details": ("system.getDetails", "details"),
+    "network": ("system.getNetwork", "network"),
+    "packages": ("system.listInstalledPackages", "installed packages list"),
+    "errata": ("system.getRelevantErrata", "relevant errata"),
+    "entitlements": ("system.getEntitlements", "entitlements"),
+}
+
+
+def project(data, fields):
+    """Returns data with only fields in its dicts"""
+    if isinstance(data, dict):
+        return {f: data[f] for f in fields if f in data}
+    if isinstance(data, list):
+        return [project(d, fields) for d in data]
+    return data
+
+
+def fetch_info(module, client, session_key, system_ids):
+    """Fetches each kind of info of each system.
+
+    Returns (results, errors), keyed by (system id, kind).
+    """
+    fields = module.params["fields"] or {}
+
+    def get_info(thread_client, item):
+        (system_id, kind) = item
+        method = thread_client
+        for name in INFO_KINDS[kind][0].split("."):
+            method = getattr(method, name)
+        data = method(session_key, system_id)
+        if kind in fields:
+            data = project(data, fields[kind])
+        return data
+
+    items = [(i, kind) for i in system_ids for kind in module.params["info"]]
+    return suma_map(client, get_info, items, module.params["workers"])
+
+
+def by_system(items):
+    """Turns a dict keyed by (system id, kind) into dicts of kinds by system"""
+    systems = {}
+    for (system_id, kind), value in items.items():
+        systems.setdefault(system_id, {})[kind] = value
+    return systems
+
+
+def write_outputs(module, client, info, single):
+    """Moves the kinds with an output path from info to their files"""
+    output_paths = module.params["output_paths"] or {}
+    for kind, path in output_paths.items():
+        if single:
+            data = info.pop(kind, None)
+        else:
+            data = {i: kinds.pop(kind) for i, kinds in info.items() if kind in kinds}
+        if module.check_mode:
+            continue
+        try:
+            suma_write_json(path, data)
+        except OSError as err:
+            suma_fail_json(module, client, msg=f"Failed to write {kind}: {err}")
+    return output_paths
+
+
+def return_info(module, client, info, errors=None):
+    """Exits with info, the kinds of info of the system or, with errors,
+    of each system.
+    """
+    kinds = module.params["info"]
+    output_paths = write_outputs(module, client, info, errors is None)
+    if len(kinds) == 1:
+        # a single kind is returned as is
+        if kinds[0] in output_paths:
+            info = None
+        elif errors is None:
+            info = info[kinds[0]]
+        else:
+            info = {i: v[kinds[0]] for i, v in info.items()}
+        if errors is not None:
+            errors = {i: e[kinds[0]] for i, e in errors.items()}
+    kwargs = {}
+    if info is not None:
+        kwargs["info"] = info
+    if errors is not None:
+        kwargs["errors"] = errors
+    if output_paths:
+        kwargs["output_paths"] = output_paths
+    suma_exit_json(module, client, changed=False, **kwargs)
+
+
+def multi_info(module, client, session_key):
+    ids = module.params["ids"]
+    try:
+        if ids == ["all"]:
+            system_ids = [s["id"] for s in client.system.listSystems(session_key)]
+        else:
+            system_ids = [int(i) for i in ids]
+    except ValueError:
+        suma_fail_json(module, client, msg=f"Invalid system ids: {','.join(ids)}")
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to get system list: {fault}")
+
+    (results, errors) = fetch_info(module, client, session_key, system_ids)
+    return_info(module, client, by_system(results), by_system(errors))
+
 
 def main():
     module = AnsibleModule(
-        argument_spec=dict(
-            id=dict(required=True, type="int"),
-            info=dict(required=True, choices=["products"]),
-            hostname=dict(required=True),
-            login=dict(required=True),
-            password=dict(required=True, no_log=True),
-            ssl_check=dict(required=False, type="bool", default=True),
+        argument_spec=suma_argument_spec(
+            id=dict(required=False, type="int"),
+            ids=dict(required=False, type="list", elements="str"),
+            workers=dict(required=False, type="int", default=8),
+            info=dict(
+                required=True,
+                type="list",
+                elements="str",
+                choices=list(INFO_KINDS),
+            ),
+            fields=dict(
+                required=False,
+                type="dict",
+                options={
+                    kind: dict(required=False, type="list", elements="str")
+                    for kind in INFO_KINDS
+                },
+            ),
+            output_paths=dict(
+                required=False,
+                type="dict",
+                options={
+                    kind: dict(required=False, type="path") for kind in INFO_KINDS
+                },
+            ),
         ),
+        mutually_exclusive=[["id", "ids"]],
+        required_one_of=[["id", "ids"]],
         supports_check_mode=True,
     )
+    module.params["info"] = list(dict.fromkeys(module.params["info"]))
+    for option in ("fields", "output_paths"):
+        if module.params[option] is not None:
+            module.params[option] = {
+                kind: value
+                for kind, value in module.params[option].items()
+                if value is not None and kind in module.params["info"]
+            }
 
     (client, session_key) = suma_connect(module)
 
-    try:
-        info = client.system.getInstalledProducts(session_key, module.params["id"])
-    except rpcFault as fault:
-        client.auth.logout(session_key)
-        module.fail_json(msg=f"Failed to get system installed products list: {fault}")
+    if module.params["ids"] is not None:
+        multi_info(module, client, session_key)
+
+    system_id = module.params["id"]
+    (results, errors) = fetch_info(module, client, session_key, [system_id])
+    for kind in module.params["info"]:
+        error = errors.get((system_id, kind))
+        if error is not None:
+            description = INFO_KINDS[kind][1]
+            suma_fail_json(
+                module, client, msg=f"Failed to get system {description}: {error}"
+            )
 
-    client.auth.logout(session_key)
-    module.exit_json(changed=False, info=info)
+    return_info(module, client, by_system(results)[system_id])
 
 
 if __name__ == "__main__":
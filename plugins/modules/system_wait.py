@@ -0,0 +1,163 @@
+#!/usr/bin/python
+# Copyright (c) 2022, Arnaud Patard <apatard@hupstream.com>
+# GNU General Public License v3.0+ (see LICENSE or https://www.gnu.org/licenses/gpl-3.0.txt)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    suma_argument_spec,
+    suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_wait,
+)
+from xmlrpc.client import Fault as rpcFault
+
+DOCUMENTATION = """
+---
+module: system_wait
+author: "Arnaud Patard"
+short_description: Wait for a system to be registered to SUMA
+description:
+   - Waits until a system is registered to Suse Manager and, optionally,
+     until its installed products are known.
+   - The system is looked up by IP, hostname or minion id with targeted
+     queries. Queries are repeated with an exponential backoff until
+     I(timeout) expires, all within a single session.
+options:
+   ip:
+     description:
+        - IP address of the system
+     required: false
+     type: str
+   system_hostname:
+     description:
+        - hostname of the system
+     required: false
+     type: str
+   minion_id:
+     description:
+        - salt minion id of the system
+     required: false
+     type: str
+   wait_for:
+     description:
+        - C(registered) waits for the system to be known by Suse Manager.
+        - C(products) also waits for its installed products list to be
+          not empty.
+     required: false
+     type: str
+     choices: [ registered, products ]
+     default: registered
+   timeout:
+     description:
+        - Maximum number of seconds to wait.
+     required: false
+     type: int
+     default: 120
+   delay:
+     description:
+        - Initial number of seconds between two queries. It's doubled after
+          each query, up to I(max_delay).
+     required: false
+     type: float
+     default: 1
+   max_delay:
+     description:
+        - Maximum number of seconds between two queries.
+     required: false
+     type: float
+     default: 15
+extends_documentation_fragment:
+   - apatard.suma.suma
+"""
+
+
+def find_system(module, client, session_key):
+    """Returns the id of the system, or None if it's not registered"""
+    if module.params["minion_id"] is not None:
+        systems = client.system.getId(session_key, module.params["minion_id"])
+        return systems[0]["id"] if systems else None
+
+    if module.params["ip"] is not None:
+        (attr, value) = ("ip", module.params["ip"])
+        results = client.system.search.ip(session_key, value)
+    else:
+        (attr, value) = ("hostname", module.params["system_hostname"])
+        results = client.system.search.hostname(session_key, value)
+    # searches are not exact matches
+    for result in results:
+        if result.get(attr) == value:
+            return result["id"]
+    return None
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=suma_argument_spec(
+            ip=dict(required=False),
+            system_hostname=dict(required=False),
+            minion_id=dict(required=False),
+            wait_for=dict(
+                required=False, default="registered", choices=["registered", "products"]
+            ),
+            timeout=dict(required=False, type="int", default=120),
+            delay=dict(required=False, type="float", default=1),
+            max_delay=dict(required=False, type="float", default=15),
+        ),
+        mutually_exclusive=[["ip", "system_hostname", "minion_id"]],
+        required_one_of=[["ip", "system_hostname", "minion_id"]],
+        supports_check_mode=True,
+    )
+
+    (client, session_key) = suma_connect(module)
+
+    state = {"system_id": None}
+
+    def probe():
+        if state["system_id"] is None:
+            state["system_id"] = find_system(module, client, session_key)
+            if state["system_id"] is None:
+                return None
+        if module.params["wait_for"] == "products":
+            products = client.system.getInstalledProducts(
+                session_key, state["system_id"]
+            )
+            if len(products) == 0:
+                return None
+            return products
+        return []
+
+    try:
+        (products, elapsed, attempts) = suma_wait(
+            probe,
+            module.params["timeout"],
+            module.params["delay"],
+            module.params["max_delay"],
+        )
+    except rpcFault as fault:
+        suma_fail_json(module, client, msg=f"Failed to get system: {fault}")
+
+    if products is None:
+        suma_fail_json(
+            module,
+            client,
+            msg=f"Timeout waiting for system ({module.params['wait_for']})",
+            system_id=state["system_id"],
+            elapsed=elapsed,
+            attempts=attempts,
+        )
+
+    result = dict(
+        changed=False,
+        system_id=state["system_id"],
+        elapsed=elapsed,
+        attempts=attempts,
+    )
+    if module.params["wait_for"] == "products":
+        result["products"] = products
+    suma_exit_json(module, client, **result)
+
+
+if __name__ == "__main__":
+    main()
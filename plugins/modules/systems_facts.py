@@ -5,9 +5,24 @@
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    SUMA_CACHE_DIR,
+    suma_argument_spec,
     suma_connect,
+    suma_exit_json,
+    suma_fail_json,
+    suma_imap,
+    suma_matcher,
+    suma_write_json,
 )
 from xmlrpc.client import Fault as rpcFault
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import random
+import time
+import xmlrpc.client
 
 DOCUMENTATION = """
 ---
@@ -16,56 +31,422 @@ author: "Arnaud Patard"
 short_description: List SUMA systems ids
 description:
    - Returns all registered systems ids.
+   - Filters and I(fields) are applied inside the module so only the
+     matching systems are returned. Without I(incremental), I(ids) and
+     I(name_prefix) also reduce the network infos asked to the server.
+   - The system list and network infos are decoded one system at a time
+     as they are received. With I(output_path), the memory used does not
+     depend on the number of systems.
+   - With I(chunk_size), the network infos are asked by chunks of systems
+     fetched concurrently. The time taken by the last attempt of each
+     chunk and by all its attempts, with the waits between them, are
+     returned in C(chunks).
 options:
-   hostname:
+   incremental:
      description:
-        - host running the Suse Manager instance.
-     required: true
-   login:
+        - Keep a snapshot of the network infos on the node running the
+          module and only ask them for the systems which are new or whose
+          last checkin or last boot changed since the previous run.
+        - The snapshot holds all the registered systems, I(ids) and
+          I(name_prefix) only filter the systems returned.
+     required: false
+     type: bool
+     default: false
+   snapshot_path:
+     description:
+        - Path of the snapshot used by I(incremental).
+        - Defaults to C(~/.ansible/suma/systems-<hostname>.json).
+     required: false
+     type: path
+   ids:
+     description:
+        - Only return the systems with these ids.
+     required: false
+     type: list
+     elements: int
+   name_prefix:
+     description:
+        - Only return the systems whose name starts with this prefix.
+     required: false
+     type: str
+   system_hostnames:
+     description:
+        - Only return the systems whose hostname matches one of these
+          patterns.
+     required: false
+     type: list
+     elements: str
+   ips:
+     description:
+        - Only return the systems whose IP matches one of these patterns.
+     required: false
+     type: list
+     elements: str
+   match:
+     description:
+        - How I(system_hostnames) and I(ips) patterns are matched.
+     required: false
+     type: str
+     choices: [ exact, glob, regex ]
+     default: glob
+   fields:
+     description:
+        - Only return these fields of the network infos, for instance
+          C(system_id) and C(ip).
+     required: false
+     type: list
+     elements: str
+   output_path:
+     description:
+        - Write the systems to this file, one JSON record per line, instead
+          of returning them as the C(suma_systems) fact.
+        - The file is written on the node running the module, and only its
+          path, number of records and checksum are returned in C(output).
+     required: false
+     type: path
+   output_compress:
+     description:
+        - Compress I(output_path) with gzip.
+     required: false
+     type: bool
+     default: false
+   chunk_size:
      description:
-        - account on the Suse Manager instance.
-     required: true
-   password:
+        - Number of systems per system.getNetworkForSystems call.
+        - Defaults to a single call for all the systems.
+     required: false
+     type: int
+   workers:
      description:
-        - password of the suse manager account
-     required: true
-   ssl_check:
+        - Maximum number of chunks fetched concurrently with I(chunk_size).
+     required: false
+     type: int
+     default: 4
+   chunk_retries:
+     description:
+        - Number of times a chunk is asked again when the call fails with
+          an HTTP or network error.
+     required: false
+     type: int
+     default: 2
+   chunk_retry_delay:
      description:
-        - disable SSL check *dangerous*
+        - Initial number of seconds before asking a chunk again. It's
+          doubled after each retry, with some jitter so that the failing
+          chunks aren't asked all at once.
      required: false
+     type: float
+     default: 1
+extends_documentation_fragment:
+   - apatard.suma.suma
 """
 
 
+def _marker(sysinfo):
+    """Returns what tells if a system changed since the snapshot"""
+    last_checkin = sysinfo.get("last_checkin")
+    if isinstance(last_checkin, datetime.datetime):
+        last_checkin = last_checkin.isoformat()
+    else:
+        last_checkin = str(last_checkin)
+    return [last_checkin, str(sysinfo.get("last_boot"))]
+
+
+def load_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)["systems"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def chunked_network(module, client, session_key, system_ids, chunks):
+    """Yields the network infos of system_ids asked by chunks, in order"""
+    size = module.params["chunk_size"]
+    retries = module.params["chunk_retries"]
+
+    def get_chunk(thread_client, chunk):
+        first = time.perf_counter()
+        delay = module.params["chunk_retry_delay"]
+        for attempt in range(1, retries + 2):
+            start = time.perf_counter()
+            try:
+                net_list = thread_client.system.getNetworkForSystems(
+                    session_key, list(chunk)
+                )
+            except (xmlrpc.client.ProtocolError, OSError):
+                # timeouts of the server or of the proxy
+                if attempt > retries:
+                    raise
+                time.sleep(random.uniform(delay / 2, delay))
+                delay *= 2
+                continue
+            end = time.perf_counter()
+            return (net_list, end - start, end - first, attempt)
+
+    items = [tuple(system_ids[i : i + size]) for i in range(0, len(system_ids), size)]
+    for chunk, result, error in suma_imap(
+        client, get_chunk, items, module.params["workers"]
+    ):
+        if error is not None:
+            suma_fail_json(
+                module,
+                client,
+                msg=f"Failed to get network infos for systems {chunk[0]} to "
+                f"{chunk[-1]}: {error}",
+                chunks=chunks,
+            )
+        (net_list, elapsed, total_time, attempts) = result
+        chunks.append(
+            dict(
+                first_id=chunk[0],
+                size=len(chunk),
+                time=elapsed,
+                total_time=total_time,
+                attempts=attempts,
+            )
+        )
+        yield from net_list
+
+
+def get_network(module, client, session_key, system_ids, chunks):
+    """Returns the network infos of system_ids, streamed from a single call
+    or asked by chunks.
+    """
+    if module.params["chunk_size"] is not None:
+        return chunked_network(module, client, session_key, system_ids, chunks)
+    try:
+        return client._stream("system.getNetworkForSystems", session_key, system_ids)
+    except rpcFault as fault:
+        suma_fail_json(
+            module, client, msg=f"Failed to get network infos for system list: {fault}"
+        )
+
+
+def incremental_network(module, client, session_key, sys_list, chunks):
+    """Returns (network infos, number of systems refreshed) using the snapshot.
+
+    The snapshot is built from the whole sys_list, the prefilter is only
+    applied to the network infos returned.
+    """
+    path = module.params["snapshot_path"]
+    if path is None:
+        path = os.path.join(
+            os.path.expanduser(SUMA_CACHE_DIR),
+            f"systems-{module.params['hostname']}.json",
+        )
+    previous = load_snapshot(path)
+
+    sys_list = list(sys_list)
+    wanted = {sysinfo["id"] for sysinfo in prefilter(module, sys_list)}
+    snapshot = {}
+    stale_ids = []
+    for sysinfo in sys_list:
+        key = str(sysinfo["id"])
+        marker = _marker(sysinfo)
+        entry = previous.get(key)
+        if entry is not None and entry["marker"] == marker:
+            snapshot[key] = entry
+        else:
+            snapshot[key] = {"marker": marker, "network": None}
+            stale_ids.append(sysinfo["id"])
+
+    if stale_ids:
+        net_list = get_network(module, client, session_key, stale_ids, chunks)
+        for net in net_list:
+            entry = snapshot.get(str(net["system_id"]))
+            if entry is not None:
+                entry["network"] = net
+
+    try:
+        suma_write_json(path, {"systems": snapshot})
+    except OSError as err:
+        module.warn(f"Failed to save snapshot {path}: {err}")
+
+    net_syslist = [
+        entry["network"]
+        for key, entry in snapshot.items()
+        if entry["network"] is not None and int(key) in wanted
+    ]
+    return (net_syslist, len(stale_ids))
+
+
+def prefilter(module, sys_list):
+    """Filters the system list on what's known before getting network infos"""
+    if module.params["ids"] is not None:
+        ids = set(module.params["ids"])
+        sys_list = [s for s in sys_list if s["id"] in ids]
+    if module.params["name_prefix"] is not None:
+        prefix = module.params["name_prefix"]
+        sys_list = [s for s in sys_list if s["name"].startswith(prefix)]
+    return sys_list
+
+
+def _match(net_syslist, attr, matcher):
+    return (n for n in net_syslist if matcher(n.get(attr)))
+
+
+def postfilter(module, net_syslist):
+    """Filters and projects the network infos, one system at a time"""
+    for attr, option in (("hostname", "system_hostnames"), ("ip", "ips")):
+        if module.params[option] is not None:
+            matcher = suma_matcher(module.params[option], module.params["match"])
+            net_syslist = _match(net_syslist, attr, matcher)
+    if module.params["fields"] is not None:
+        fields = module.params["fields"]
+        net_syslist = ({f: n[f] for f in fields if f in n} for n in net_syslist)
+    return net_syslist
+
+
+class _HashingWriter:
+    """Write-only file object computing the checksum of what goes through"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        if self.f is not None:
+            self.f.write(data)
+        return len(data)
+
+    def flush(self):
+        if self.f is not None:
+            self.f.flush()
+
+
+def file_checksum(path):
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+    except FileNotFoundError:
+        return None
+    return sha256.hexdigest()
+
+
+def write_jsonl(module, records):
+    """Streams records to output_path and returns the output infos.
+
+    In check mode, nothing is written but the checksum is still computed
+    to tell if the file would change.
+    """
+    path = module.params["output_path"]
+    tmp = f"{path}.{os.getpid()}"
+    f = None if module.check_mode else open(tmp, "wb")
+    try:
+        try:
+            sink = _HashingWriter(f)
+            if module.params["output_compress"]:
+                # mtime=0 so that the same records give the same file
+                out = gzip.GzipFile(fileobj=sink, mode="wb", mtime=0)
+            else:
+                out = sink
+            count = 0
+            for record in records:
+                out.write(json.dumps(record, default=str).encode() + b"\n")
+                count += 1
+            if out is not sink:
+                out.close()
+        finally:
+            if f is not None:
+                f.close()
+
+        checksum = sink.sha256.hexdigest()
+        changed = checksum != file_checksum(path)
+        if f is not None:
+            if changed:
+                os.replace(tmp, path)
+            else:
+                os.unlink(tmp)
+    except BaseException:
+        # don't leave a partial file behind
+        if f is not None:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+        raise
+    output = dict(
+        path=path,
+        records=count,
+        checksum=checksum,
+        compressed=module.params["output_compress"],
+    )
+    return (changed, output)
+
+
+def return_systems(module, client, net_syslist, **kwargs):
+    records = postfilter(module, net_syslist)
+    if module.params["output_path"] is None:
+        facts = {"suma_systems": list(records)}
+        suma_exit_json(module, client, changed=False, ansible_facts=facts, **kwargs)
+    try:
+        (changed, output) = write_jsonl(module, records)
+    except OSError as err:
+        suma_fail_json(module, client, msg=f"Failed to write systems: {err}")
+    suma_exit_json(module, client, changed=changed, output=output, **kwargs)
+
+
 def main():
     module = AnsibleModule(
-        argument_spec=dict(
-            hostname=dict(required=True),
-            login=dict(required=True),
-            password=dict(required=True, no_log=True),
-            ssl_check=dict(required=False, type="bool", default=True),
+        argument_spec=suma_argument_spec(
+            incremental=dict(required=False, type="bool", default=False),
+            snapshot_path=dict(required=False, type="path"),
+            ids=dict(required=False, type="list", elements="int"),
+            name_prefix=dict(required=False),
+            system_hostnames=dict(required=False, type="list", elements="str"),
+            ips=dict(required=False, type="list", elements="str"),
+            match=dict(
+                required=False, default="glob", choices=["exact", "glob", "regex"]
+            ),
+            fields=dict(required=False, type="list", elements="str"),
+            output_path=dict(required=False, type="path"),
+            output_compress=dict(required=False, type="bool", default=False),
+            chunk_size=dict(required=False, type="int"),
+            workers=dict(required=False, type="int", default=4),
+            chunk_retries=dict(required=False, type="int", default=2),
+            chunk_retry_delay=dict(required=False, type="float", default=1),
         ),
         supports_check_mode=True,
     )
 
+    if module.params["chunk_size"] is not None and module.params["chunk_size"] < 1:
+        module.fail_json(msg="chunk_size must be a positive number")
+    if module.params["chunk_retries"] < 0:
+        module.fail_json(msg="chunk_retries must be positive")
+    if module.params["chunk_retry_delay"] < 0:
+        module.fail_json(msg="chunk_retry_delay must be positive")
+
+    # validate patterns before connecting
+    for option in ("system_hostnames", "ips"):
+        if module.params[option] is not None:
+            try:
+                suma_matcher(module.params[option], module.params["match"])
+            except ValueError as err:
+                module.fail_json(msg=f"{option}: {err}")
+
     (client, session_key) = suma_connect(module)
 
     try:
-        sys_list = client.system.listSystems(session_key)
+        sys_list = client._stream("system.listSystems", session_key)
     except rpcFault as fault:
-        client.auth.logout(session_key)
-        module.fail_json(msg=f"Failed to get system list: {fault}")
+        suma_fail_json(module, client, msg=f"Failed to get system list: {fault}")
 
-    sys_idlist = list(map(lambda d: d["id"], sys_list))
-    try:
-        net_syslist = client.system.getNetworkForSystems(session_key, sys_idlist)
-    except rpcFault as fault:
-        client.auth.logout(session_key)
-        module.fail_json(msg=f"Failed to get network infos for system list: {fault}")
+    chunks = []
+    kwargs = {} if module.params["chunk_size"] is None else {"chunks": chunks}
+
+    if module.params["incremental"]:
+        (net_syslist, refreshed) = incremental_network(
+            module, client, session_key, sys_list, chunks
+        )
+        return_systems(module, client, net_syslist, refreshed=refreshed, **kwargs)
 
-    client.auth.logout(session_key)
-    facts = {}
-    facts = {"suma_systems": net_syslist}
-    module.exit_json(changed=False, ansible_facts=facts)
+    sys_idlist = list(map(lambda d: d["id"], prefilter(module, sys_list)))
+    net_syslist = get_network(module, client, session_key, sys_idlist, chunks)
+    return_systems(module, client, net_syslist, **kwargs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+"""Module performance benchmarks against the fake SUMA server.
+
+Each module runs in its own interpreter, like under ansible, and the wall
+time, peak RSS, number of RPCs and bytes exchanged are recorded. These
+tests are skipped unless SUMA_BENCHMARK is set (see tox -e benchmark).
+
+Environment variables:
+  SUMA_BENCH_SYSTEMS: fleet size (default: 1000)
+  SUMA_BENCH_LATENCY: per-call latency of the server, in seconds (default: 0)
+  SUMA_BENCH_OUTPUT: file receiving the results as JSON
+"""
+
+from ansible_collections.apatard.suma.tests.unit.modules.fake_suma import (
+    FakeFleet,
+    FakeSumaAPI,
+    FakeSumaServer,
+)
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+SYSTEMS = int(os.environ.get("SUMA_BENCH_SYSTEMS", "1000"))
+LATENCY = float(os.environ.get("SUMA_BENCH_LATENCY", "0"))
+
+# Regression thresholds. RPC counts are exact upper bounds, wall time and
+# memory are scaled with the fleet size.
+FLEET_FACTOR = max(1.0, SYSTEMS / 1000)
+MAX_WALL = 5.0 * FLEET_FACTOR
+MAX_RSS_KB = 100 * 1024 * FLEET_FACTOR
+
+# Runs the module as __main__ and records its peak RSS. ru_maxrss is not
+# used as Linux carries it over from the (forked) test runner across exec.
+_BOOTSTRAP = """
+import atexit, os, runpy, sys
+
+def report_rss():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                with open(os.environ["SUMA_BENCH_RSS_FILE"], "w") as f:
+                    f.write(line.split()[1])
+
+atexit.register(report_rss)
+runpy.run_module(sys.argv.pop(1), run_name="__main__", alter_sys=True)
+"""
+
+
+@unittest.skipUnless(os.environ.get("SUMA_BENCHMARK"), "SUMA_BENCHMARK not set")
+class test_suma_benchmark(unittest.TestCase):
+    results = []
+
+    @classmethod
+    def setUpClass(cls):
+        cls.api = FakeSumaAPI(FakeFleet(SYSTEMS), LATENCY)
+        cls.server = FakeSumaServer(cls.api).start()
+        cls.base_args = {
+            "hostname": cls.server.hostname,
+            "login": "login",
+            "password": "password",
+            "ssl_check": False,
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        header = f"{'benchmark':<36}{'wall(s)':>10}{'rss(MB)':>10}"
+        header += f"{'rpcs':>8}{'sent(kB)':>10}{'recv(kB)':>10}"
+        lines = [f"\nfleet: {SYSTEMS} systems, latency: {LATENCY}s", header]
+        for r in cls.results:
+            lines.append(
+                f"{r['name']:<36}{r['wall']:>10.3f}{r['rss_kb'] / 1024:>10.1f}"
+                f"{r['rpcs']:>8}{r['bytes_in'] / 1024:>10.1f}"
+                f"{r['bytes_out'] / 1024:>10.1f}"
+            )
+        print("\n".join(lines), file=sys.stderr)
+        output = os.environ.get("SUMA_BENCH_OUTPUT")
+        if output:
+            with open(output, "w") as f:
+                json.dump(
+                    {"systems": SYSTEMS, "latency": LATENCY, "results": cls.results},
+                    f,
+                    indent=2,
+                )
+
+    def setUp(self):
+        self.api.fleet = FakeFleet(SYSTEMS)
+        self.api.reset_stats()
+
+    def run_module(self, module, args):
+        """Runs module in a new interpreter and returns its result"""
+        module_args = dict(self.base_args, **args)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args_file = os.path.join(tmpdir, "args.json")
+            rss_file = os.path.join(tmpdir, "rss")
+            with open(args_file, "w") as f:
+                json.dump({"ANSIBLE_MODULE_ARGS": module_args}, f)
+            env = dict(
+                os.environ,
+                PYTHONPATH=os.pathsep.join(sys.path),
+                SUMA_BENCH_RSS_FILE=rss_file,
+            )
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    _BOOTSTRAP,
+                    f"ansible_collections.apatard.suma.plugins.modules.{module}",
+                    args_file,
+                ],
+                capture_output=True,
+                env=env,
+            )
+            wall = time.perf_counter() - start
+            with open(rss_file) as f:
+                rss_kb = int(f.read())
+        stdout = proc.stdout
+        errors = proc.stderr
+
+        try:
+            result = json.loads(stdout)
+        except ValueError:
+            self.fail(f"Invalid module output: {stdout!r} {errors}")
+        self.results.append(
+            {
+                "name": self.id().rsplit(".", 1)[-1].replace("test_", "", 1),
+                "wall": wall,
+                "rss_kb": rss_kb,
+                "rpcs": sum(self.api.calls.values()),
+                "calls": dict(self.api.calls),
+                "bytes_in": self.api.bytes_in,
+                "bytes_out": self.api.bytes_out,
+                "connections": self.api.connections,
+            }
+        )
+        return result
+
+    def check_thresholds(self, max_rpcs, connections=1):
+        r = self.results[-1]
+        self.assertLessEqual(r["rpcs"], max_rpcs, r["calls"])
+        self.assertLessEqual(r["wall"], MAX_WALL + r["rpcs"] * LATENCY)
+        self.assertLessEqual(r["rss_kb"], MAX_RSS_KB)
+        # keep-alive connections are used for the whole module run
+        self.assertLessEqual(r["connections"], connections)
+
+    def test_saltkey_accept(self):
+        result = self.run_module(
+            "saltkey", {"key": "pending-000000.example.com", "state": "accepted"}
+        )
+        self.assertTrue(result["changed"], result)
+        self.check_thresholds(6)
+
+    def test_saltkey_accept_glob(self):
+        result = self.run_module(
+            "saltkey", {"keys": ["pending-*"], "match": "glob", "state": "accepted"}
+        )
+        self.assertEqual(len(result["results"]), 10, result)
+        self.check_thresholds(15)
+
+    def test_systems_facts(self):
+        result = self.run_module("systems_facts", {})
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), SYSTEMS)
+        self.check_thresholds(4)
+
+    def test_systems_facts_output(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_path = os.path.join(tmpdir, "systems.jsonl")
+            result = self.run_module("systems_facts", {"output_path": output_path})
+        self.assertEqual(result["output"]["records"], SYSTEMS, result)
+        self.check_thresholds(4)
+
+    def test_systems_facts_chunks(self):
+        result = self.run_module("systems_facts", {"chunk_size": 100, "workers": 4})
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), SYSTEMS)
+        chunks = -(-SYSTEMS // 100)
+        self.check_thresholds(3 + chunks, connections=1 + 4)
+
+    def test_system_info(self):
+        result = self.run_module("system_info", {"id": 1000010000, "info": "products"})
+        self.assertEqual(len(result["info"]), 1, result)
+        self.check_thresholds(3)
+
+    def test_system_info_kinds(self):
+        result = self.run_module(
+            "system_info",
+            {"id": 1000010000, "info": ["products", "details", "packages", "errata"]},
+        )
+        self.assertEqual(len(result["info"]["packages"]), 100, result)
+        self.check_thresholds(6, connections=5)
+
+    def test_system_addon(self):
+        result = self.run_module(
+            "system_addon",
+            {"id": 1000010001, "addon": ["monitoring_entitled"], "state": "present"},
+        )
+        self.assertTrue(result["changed"], result)
+        self.check_thresholds(4)
+
+    def test_system_delete(self):
+        result = self.run_module(
+            "system_delete", {"id": 1000010000, "cleanup": "force"}
+        )
+        self.assertTrue(result["changed"], result)
+        self.check_thresholds(4)
+
+    def test_systems_facts_incremental(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = {
+                "incremental": True,
+                "snapshot_path": os.path.join(tmpdir, "snapshot.json"),
+            }
+            self.run_module("systems_facts", args)
+            self.results.pop()
+            self.api.reset_stats()
+            result = self.run_module("systems_facts", args)
+        self.assertEqual(result["refreshed"], 0, result)
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), SYSTEMS)
+        self.check_thresholds(3)
+
+    def test_system_delete_ids(self):
+        ids = list(range(1000010000, 1000010000 + min(SYSTEMS, 500)))
+        result = self.run_module(
+            "system_delete", {"ids": ids, "cleanup": "force", "batch_size": 100}
+        )
+        self.assertEqual(len(result["deleted"]), len(ids), result)
+        self.check_thresholds(3 + (len(ids) + 99) // 100)
+
+    def test_system_wait(self):
+        result = self.run_module(
+            "system_wait", {"ip": "10.0.0.1", "wait_for": "products"}
+        )
+        self.assertEqual(result["system_id"], 1000010000, result)
+        self.check_thresholds(4)
+
+    def test_system_info_all(self):
+        result = self.run_module(
+            "system_info", {"ids": "all", "info": "products", "workers": 8}
+        )
+        self.assertEqual(len(result["info"]), SYSTEMS, result["errors"])
+        self.check_thresholds(SYSTEMS + 3, connections=9)
+
+    def test_errata_facts(self):
+        result = self.run_module("errata_facts", {"workers": 8})
+        errata = result["ansible_facts"]["suma_errata"]
+        self.assertEqual(len(errata["systems"]), SYSTEMS, result["errors"])
+        self.assertEqual(len(errata["advisories"]), 20)
+        self.check_thresholds(SYSTEMS + 3, connections=9)
+
+    def test_system_action(self):
+        result = self.run_module(
+            "system_action",
+            {
+                "ids": list(range(1000010000, 1000010000 + SYSTEMS)),
+                "action": "highstate",
+            },
+        )
+        self.assertEqual(len(result["systems"]), SYSTEMS, result)
+        self.check_thresholds(9)
+
+    def test_system_delete_purge(self):
+        result = self.run_module(
+            "system_delete",
+            {
+                "inactive_days": 30,
+                "include": ["sys-0000*"],
+                "max_delete": 100,
+                "cleanup": "force",
+                "_ansible_check_mode": True,
+            },
+        )
+        self.assertEqual(len(result["deleted"]), 100, result)
+        self.check_thresholds(4)
+
+    def test_system_bootstrap(self):
+        hosts = [f"new-{i:03d}.example.com" for i in range(20)]
+        result = self.run_module(
+            "system_bootstrap",
+            {
+                "hosts": hosts,
+                "activation_key": "1-sles15",
+                "ssh_password": "secret",
+                "workers": 8,
+            },
+        )
+        self.assertTrue(result["changed"], result)
+        self.assertEqual(len(result["hosts"]), 20, result)
+        # one lookup before and one after the bootstrap of each host
+        self.check_thresholds(2 + 3 * 20, connections=9)
+
+    def test_system_addon_ids(self):
+        result = self.run_module(
+            "system_addon",
+            {
+                "ids": list(range(1000010000, 1000010000 + SYSTEMS)),
+                "addon": ["monitoring_entitled"],
+                "state": "present",
+            },
+        )
+        self.assertTrue(result["changed"], result)
+        # one call per add-on, then one per system without the add-on
+        missing = SYSTEMS - len(range(6, SYSTEMS, 15))
+        self.check_thresholds(2 + 5 + missing, connections=9)
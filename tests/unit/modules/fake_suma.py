@@ -0,0 +1,570 @@
+"""Local stand-in for the Suse Manager XML-RPC API.
+
+The server listens on https://127.0.0.1:<port>/rpc/api with a self-signed
+certificate and serves a synthetic fleet. It counts the calls made and the
+bytes exchanged so that tests and benchmarks can check them.
+
+It can also be started by hand:
+
+    python -m ansible_collections.apatard.suma.tests.unit.modules.fake_suma \\
+        --systems 10000 --latency 0.01
+"""
+
+import argparse
+import collections
+import datetime
+import ipaddress
+import os
+import socketserver
+import ssl
+import tempfile
+import threading
+import time
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+SESSION_FAULT = xmlrpc.client.Fault(2950, "Could not find session")
+NO_SUCH_SYSTEM_FAULT = -210
+
+FAKE_ADVISORY_TYPES = [
+    "Security Advisory",
+    "Bug Fix Advisory",
+    "Product Enhancement Advisory",
+]
+
+FAKE_SEVERITIES = ["Critical", "Important", "Moderate", "Low"]
+
+FAKE_ADDONS = [
+    "container_build_host",
+    "monitoring_entitled",
+    "osimage_build_host",
+    "virtualization_host",
+    "ansible_control_node",
+]
+
+
+class FakeFleet:
+    """Synthetic fleet of systems, salt keys, entitlements and products"""
+
+    def __init__(self, systems=1000, pending=10, rejected=10, packages=100, errata=20):
+        epoch = datetime.datetime(2022, 10, 1)
+        self.packages = packages
+        # system i needs the errata j with (i + j) % 5 == 0
+        self.errata = [
+            {
+                "id": 3000 + j,
+                "advisory_name": f"SUSE-2022-{j:04d}",
+                "advisory_type": FAKE_ADVISORY_TYPES[j % len(FAKE_ADVISORY_TYPES)],
+                "advisory_synopsis": f"Security update for package-{j:04d}",
+                "date": epoch + datetime.timedelta(days=j),
+            }
+            for j in range(errata)
+        ]
+        self.systems = {}
+        for i in range(systems):
+            system_id = 1000010000 + i
+            name = f"sys-{i:06d}.example.com"
+            self.systems[system_id] = {
+                "id": system_id,
+                "name": name,
+                "hostname": name,
+                "ip": str(ipaddress.IPv4Address("10.0.0.0") + i + 1),
+                "minion_id": name,
+                "last_checkin": epoch + datetime.timedelta(minutes=i),
+                "last_boot": float(i),
+                "entitlements": {"salt_entitled"}
+                | ({FAKE_ADDONS[i % len(FAKE_ADDONS)]} if i % 3 == 0 else set()),
+                "products": [
+                    {
+                        "name": "SLES",
+                        "version": "15.4",
+                        "arch": "x86_64",
+                        "isBaseProduct": True,
+                        "friendlyName": "SUSE Linux Enterprise Server 15 SP4 x86_64",
+                    }
+                ],
+            }
+        self.keys = {
+            "accepted": {s["minion_id"] for s in self.systems.values()},
+            "pending": {f"pending-{i:06d}.example.com" for i in range(pending)},
+            "rejected": {f"rejected-{i:06d}.example.com" for i in range(rejected)},
+        }
+
+
+class FakeSumaAPI:
+    """Implementation of the subset of the API used by the collection"""
+
+    def __init__(self, fleet, latency=0.0, action_duration=0.0):
+        self.fleet = fleet
+        self.latency = latency
+        # scheduled actions are done action_duration seconds later, failed
+        # on the systems of failing_systems
+        self.action_duration = action_duration
+        self.failing_systems = set()
+        # like some versions of the server, one action per system
+        self.action_per_system = False
+        self.actions = {}
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connections = 0
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.connections = 0
+
+    def _dispatch(self, method, params):
+        with self.lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        func = getattr(self, method.replace(".", "_"), None)
+        if func is None:
+            raise xmlrpc.client.Fault(-1, f"Unknown method {method}")
+        if method != "auth.login":
+            if not params or params[0] not in self.sessions:
+                raise SESSION_FAULT
+            params = params[1:]
+        return func(*params)
+
+    def _system(self, system_id):
+        try:
+            return self.fleet.systems[system_id]
+        except KeyError:
+            raise xmlrpc.client.Fault(
+                NO_SUCH_SYSTEM_FAULT, f"No such system - sid = {system_id}"
+            )
+
+    # auth
+    def auth_login(self, login, password):
+        if password != "password":
+            raise xmlrpc.client.Fault(
+                2950, "Either the password or username is incorrect."
+            )
+        key = os.urandom(16).hex()
+        with self.lock:
+            self.sessions.add(key)
+        return key
+
+    def auth_logout(self):
+        return 1
+
+    # saltkey
+    def saltkey_acceptedList(self):
+        return sorted(self.fleet.keys["accepted"])
+
+    def saltkey_pendingList(self):
+        return sorted(self.fleet.keys["pending"])
+
+    def saltkey_rejectedList(self):
+        return sorted(self.fleet.keys["rejected"])
+
+    def _move_key(self, key, src, dst):
+        if key not in self.fleet.keys[src]:
+            raise xmlrpc.client.Fault(-1, f"Key {key} not {src}")
+        self.fleet.keys[src].discard(key)
+        if dst is not None:
+            self.fleet.keys[dst].add(key)
+        return 1
+
+    def saltkey_accept(self, key):
+        return self._move_key(key, "pending", "accepted")
+
+    def saltkey_reject(self, key):
+        return self._move_key(key, "pending", "rejected")
+
+    def saltkey_delete(self, key):
+        for keys in self.fleet.keys.values():
+            keys.discard(key)
+        return 1
+
+    # system
+    def system_listSystems(self):
+        return [
+            {
+                "id": s["id"],
+                "name": s["name"],
+                "last_checkin": s["last_checkin"],
+                "last_boot": s["last_boot"],
+            }
+            for s in self.fleet.systems.values()
+        ]
+
+    def system_listInactiveSystems(self, days):
+        since = datetime.datetime.now() - datetime.timedelta(days=days)
+        return [
+            {"id": s["id"], "name": s["name"], "last_checkin": s["last_checkin"]}
+            for s in self.fleet.systems.values()
+            if s["last_checkin"] < since
+        ]
+
+    def system_getNetworkForSystems(self, system_ids):
+        return [
+            {
+                "system_id": s["id"],
+                "system_name": s["name"],
+                "ip": s["ip"],
+                "hostname": s["hostname"],
+            }
+            for s in map(self.fleet.systems.get, system_ids)
+            if s is not None
+        ]
+
+    def system_getName(self, system_id):
+        system = self._system(system_id)
+        return {
+            "id": system["id"],
+            "name": system["name"],
+            "last_checkin": system["last_checkin"],
+        }
+
+    def system_getId(self, name):
+        return [
+            {"id": s["id"], "name": s["name"], "last_checkin": s["last_checkin"]}
+            for s in self.fleet.systems.values()
+            if s["name"] == name
+        ]
+
+    def system_getMinionIdMap(self):
+        return {s["minion_id"]: s["id"] for s in self.fleet.systems.values()}
+
+    def _search(self, attr, term):
+        return [
+            {"id": s["id"], "name": s["name"], "hostname": s["hostname"], "ip": s["ip"]}
+            for s in self.fleet.systems.values()
+            if term in s[attr]
+        ]
+
+    def system_search_ip(self, term):
+        return self._search("ip", term)
+
+    def system_search_hostname(self, term):
+        return self._search("hostname", term)
+
+    def system_getDetails(self, system_id):
+        system = self._system(system_id)
+        return {
+            "id": system["id"],
+            "profile_name": system["name"],
+            "minion_id": system["minion_id"],
+            "base_entitlement": "salt_entitled",
+            "last_boot": system["last_boot"],
+            "description": "Initial Registration Parameters",
+        }
+
+    def system_getNetwork(self, system_id):
+        system = self._system(system_id)
+        return {"ip": system["ip"], "ip6": "::1", "hostname": system["hostname"]}
+
+    def system_listInstalledPackages(self, system_id):
+        self._system(system_id)
+        return [
+            {
+                "package_id": 2000 + p,
+                "name": f"package-{p:04d}",
+                "epoch": "",
+                "version": "1.0",
+                "release": f"150400.{p}.1",
+                "arch": "x86_64",
+                "installtime": datetime.datetime(2022, 10, 1),
+            }
+            for p in range(self.fleet.packages)
+        ]
+
+    def system_getRelevantErrata(self, system_id):
+        self._system(system_id)
+        return [e for j, e in enumerate(self.fleet.errata) if (system_id + j) % 5 == 0]
+
+    # schedule
+    def _schedule(self, name, system_ids):
+        for system_id in system_ids:
+            self._system(system_id)
+        with self.lock:
+            action_id = 5000 + len(self.actions)
+            self.actions[action_id] = {
+                "name": name,
+                "systems": list(system_ids),
+                "created": time.monotonic(),
+            }
+        return action_id
+
+    def _schedule_many(self, name, system_ids):
+        if not self.action_per_system:
+            return self._schedule(name, system_ids)
+        for system_id in system_ids:
+            self._system(system_id)
+        return [self._schedule(name, [system_id]) for system_id in system_ids]
+
+    def _action_done(self, action_id):
+        action = self.actions.get(action_id)
+        if action is None:
+            raise xmlrpc.client.Fault(-1, f"No such action - {action_id}")
+        return time.monotonic() - action["created"] >= self.action_duration
+
+    def _action_systems(self, action_id, failed):
+        if not self._action_done(action_id):
+            return []
+        return [
+            {
+                "server_id": system_id,
+                "server_name": self.fleet.systems[system_id]["name"],
+                "timestamp": datetime.datetime.now(),
+                "message": "failed" if failed else "done",
+            }
+            for system_id in self.actions[action_id]["systems"]
+            if (system_id in self.failing_systems) == failed
+        ]
+
+    def schedule_listInProgressActions(self):
+        return [
+            {"id": action_id, "name": action["name"]}
+            for action_id, action in list(self.actions.items())
+            if not self._action_done(action_id)
+        ]
+
+    def schedule_listInProgressSystems(self, action_id):
+        if self._action_done(action_id):
+            return []
+        return [
+            {
+                "server_id": system_id,
+                "server_name": self.fleet.systems[system_id]["name"],
+                "timestamp": datetime.datetime.now(),
+                "message": "queued",
+            }
+            for system_id in self.actions[action_id]["systems"]
+        ]
+
+    def schedule_listCompletedSystems(self, action_id):
+        return self._action_systems(action_id, False)
+
+    def schedule_listFailedSystems(self, action_id):
+        return self._action_systems(action_id, True)
+
+    def system_schedulePackageInstall(self, system_ids, package_ids, earliest):
+        return self._schedule_many("Package Install", system_ids)
+
+    def system_schedulePackageUpdate(self, system_ids, earliest):
+        return self._schedule_many("Package Update", system_ids)
+
+    def system_scheduleApplyErrata(self, system_ids, errata_ids, earliest):
+        return [self._schedule(f"Patch Update {e}", system_ids) for e in errata_ids]
+
+    def system_scheduleApplyHighstate(self, system_ids, earliest, test):
+        return self._schedule_many("Apply highstate", system_ids)
+
+    def system_scheduleReboot(self, system_id, earliest):
+        return self._schedule("System reboot", [system_id])
+
+    # errata
+    def errata_getDetails(self, advisory_name):
+        for j, erratum in enumerate(self.fleet.errata):
+            if erratum["advisory_name"] == advisory_name:
+                return {
+                    "issue_date": erratum["date"],
+                    "synopsis": erratum["advisory_synopsis"],
+                    "type": erratum["advisory_type"],
+                    "severity": FAKE_SEVERITIES[j % len(FAKE_SEVERITIES)],
+                }
+        raise xmlrpc.client.Fault(-208, f"No such errata - {advisory_name}")
+
+    def system_bootstrap(self, host, port, user, password, key, salt_ssh):
+        if host.startswith("unreachable"):
+            raise xmlrpc.client.Fault(-1, f"Unable to connect to {host}:{port}")
+        with self.lock:
+            system_id = max(self.fleet.systems) + 1
+            try:
+                ip = str(ipaddress.ip_address(host))
+                name = f"host-{system_id}.example.com"
+            except ValueError:
+                (ip, name) = ("", host)
+            self.fleet.systems[system_id] = {
+                "id": system_id,
+                "name": name,
+                "hostname": name,
+                "ip": ip,
+                "minion_id": name,
+                "last_checkin": datetime.datetime.now(),
+                "last_boot": 0.0,
+                "entitlements": {"salt_entitled"},
+                "products": [],
+            }
+            self.fleet.keys["accepted"].add(name)
+        return 1
+
+    def system_bootstrapWithPrivateSshKey(
+        self, host, port, user, private_key, private_key_password, key, salt_ssh
+    ):
+        return self.system_bootstrap(host, port, user, None, key, salt_ssh)
+
+    def system_getInstalledProducts(self, system_id):
+        return self._system(system_id)["products"]
+
+    def system_getEntitlements(self, system_id):
+        return sorted(self._system(system_id)["entitlements"])
+
+    def system_listSystemsWithEntitlement(self, entitlement):
+        return [
+            {"id": s["id"], "name": s["name"], "last_checkin": s["last_checkin"]}
+            for s in self.fleet.systems.values()
+            if entitlement in s["entitlements"]
+        ]
+
+    def system_addEntitlements(self, system_id, entitlements):
+        self._system(system_id)["entitlements"].update(entitlements)
+        return 1
+
+    def system_removeEntitlements(self, system_id, entitlements):
+        self._system(system_id)["entitlements"].difference_update(entitlements)
+        return 1
+
+    def system_deleteSystem(self, system_id, cleanup_type="FAIL_ON_CLEANUP_ERR"):
+        self._system(system_id)
+        del self.fleet.systems[system_id]
+        return 1
+
+    def system_deleteSystems(self, system_ids, cleanup_type="FAIL_ON_CLEANUP_ERR"):
+        for system_id in system_ids:
+            self._system(system_id)
+        for system_id in system_ids:
+            del self.fleet.systems[system_id]
+        return 1
+
+
+class _FakeSumaRequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+    rpc_paths = ("/rpc/api",)
+
+    def setup(self):
+        super().setup()
+        with self.server.api.lock:
+            self.server.api.connections += 1
+        wfile = self.wfile
+        api = self.server.api
+
+        class CountingWriter:
+            def write(self, data):
+                with api.lock:
+                    api.bytes_out += len(data)
+                return wfile.write(data)
+
+            def __getattr__(self, name):
+                return getattr(wfile, name)
+
+        self.wfile = CountingWriter()
+
+    @property
+    def encode_threshold(self):
+        return self.server.encode_threshold
+
+    def do_POST(self):
+        with self.server.api.lock:
+            self.server.api.bytes_in += int(self.headers.get("content-length", 0))
+        super().do_POST()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSumaServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, api, port=0, gzip=False):
+        super().__init__(
+            ("127.0.0.1", port),
+            requestHandler=_FakeSumaRequestHandler,
+            logRequests=False,
+            allow_none=True,
+            use_builtin_types=True,
+        )
+        self.api = api
+        self.register_instance(api)
+        # Tomcat doesn't compress responses unless configured to
+        self.encode_threshold = 1400 if gzip else None
+        (context, self.certificate) = _server_context()
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self._thread = None
+
+    @property
+    def hostname(self):
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _server_context():
+    """Returns the server SSL context and its self-signed certificate"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName(
+                [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]
+            ),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        certfile = os.path.join(tmpdir, "cert.pem")
+        keyfile = os.path.join(tmpdir, "key.pem")
+        with open(certfile, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(keyfile, "wb") as f:
+            f.write(
+                key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption(),
+                )
+            )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+    return (context, cert.public_bytes(serialization.Encoding.PEM))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--systems", type=int, default=1000)
+    parser.add_argument("--pending", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    api = FakeSumaAPI(FakeFleet(args.systems, args.pending), args.latency)
+    server = FakeSumaServer(api, args.port, args.gzip)
+    print(f"Serving {args.systems} systems on https://{server.hostname}/rpc/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from ansible_collections.apatard.suma.plugins.callback.suma_stats import (
+    CallbackModule,
+)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+
+def make_result(task, host, result):
+    runner_result = MagicMock()
+    runner_result._task.get_name.return_value = task
+    runner_result._host.get_name.return_value = host
+    runner_result._result = result
+    return runner_result
+
+
+def suma_stats(method, count, duration):
+    return {
+        "connections": 1,
+        "calls": {
+            method: {"count": count, "time": duration, "sent": 100, "received": 200}
+        },
+        "traces": [
+            {
+                "method": method,
+                "start": 0.0,
+                "duration": duration / count,
+                "sent": 100 // count,
+                "received": 200 // count,
+            }
+        ]
+        * count,
+    }
+
+
+class test_suma_stats_callback(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.options = {"top": 10, "trace_path": None}
+        self.callback = CallbackModule()
+        self.callback.get_option = lambda name: self.options[name]
+        self.callback._display = MagicMock()
+
+    def test_summary(self):
+        self.callback.v2_runner_on_ok(
+            make_result(
+                "facts", "localhost", {"suma_stats": suma_stats("system.a", 2, 1.0)}
+            )
+        )
+        self.callback.v2_runner_on_failed(
+            make_result(
+                "delete", "localhost", {"suma_stats": suma_stats("system.b", 1, 3.0)}
+            )
+        )
+        # loop
+        self.callback.v2_runner_on_ok(
+            make_result(
+                "facts",
+                "localhost",
+                {
+                    "results": [
+                        {"suma_stats": suma_stats("system.a", 1, 0.5)},
+                        {"skipped": True},
+                    ]
+                },
+            )
+        )
+        # instrumentation disabled
+        self.callback.v2_runner_on_ok(
+            make_result("wait", "localhost", {"suma_stats": {"connections": 1}})
+        )
+
+        self.assertEqual(self.callback.methods["system.a"]["count"], 3)
+        self.assertEqual(self.callback.methods["system.a"]["time"], 1.5)
+        self.assertEqual(self.callback.tasks["facts"], {"count": 3, "time": 1.5})
+        self.assertNotIn("wait", self.callback.tasks)
+
+        self.callback.v2_playbook_on_stats(None)
+        output = self.callback._display.display.call_args.args[0].splitlines()
+        # slowest first
+        self.assertTrue(output[1].startswith("system.b"))
+        self.assertTrue(output[-2].startswith("delete"))
+
+    def test_top(self):
+        self.options["top"] = 1
+        for method in ("system.a", "system.b", "system.c"):
+            self.callback.v2_runner_on_ok(
+                make_result(
+                    method, "localhost", {"suma_stats": suma_stats(method, 1, 1)}
+                )
+            )
+        self.callback.v2_playbook_on_stats(None)
+        output = self.callback._display.display.call_args.args[0].splitlines()
+        self.assertEqual(len(output), 5)
+
+    def test_traces(self):
+        trace_path = os.path.join(self.tmpdir, "traces.jsonl")
+        self.options["trace_path"] = trace_path
+        with patch("ansible.plugins.callback.CallbackBase.set_options"):
+            self.callback.set_options()
+        self.callback.v2_runner_on_ok(
+            make_result("facts", "web1", {"suma_stats": suma_stats("system.a", 2, 1)})
+        )
+        self.callback.v2_playbook_on_stats(None)
+        with open(trace_path) as f:
+            traces = [json.loads(line) for line in f]
+        self.assertEqual(len(traces), 2)
+        self.assertEqual(traces[0]["task"], "facts")
+        self.assertEqual(traces[0]["host"], "web1")
+        self.assertEqual(traces[0]["method"], "system.a")
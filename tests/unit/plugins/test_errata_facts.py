@@ -0,0 +1,127 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    errata_facts,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import xmlrpc
+
+ERRATA = {
+    "SUSE-2022-0001": ("Security Advisory", "Critical"),
+    "SUSE-2022-0002": ("Bug Fix Advisory", "Low"),
+    "SUSE-2022-0003": ("Security Advisory", "Low"),
+}
+
+
+def relevant_errata(session_key, system_id):
+    if system_id == 1000010042:
+        raise xmlrpc.client.Fault(-210, "No such system")
+    names = {
+        1000010000: ["SUSE-2022-0001", "SUSE-2022-0002"],
+        1000010001: ["SUSE-2022-0001", "SUSE-2022-0003"],
+        1000010002: [],
+    }[system_id]
+    return [
+        {
+            "id": int(name[-4:]),
+            "advisory_name": name,
+            "advisory_type": ERRATA[name][0],
+            "advisory_synopsis": f"Update {name}",
+        }
+        for name in names
+    ]
+
+
+def errata_details(session_key, advisory_name):
+    return {"type": ERRATA[advisory_name][0], "severity": ERRATA[advisory_name][1]}
+
+
+class test_suma_errata_facts(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_errata_facts, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+        }
+
+    def setUp(self):
+        super(test_suma_errata_facts, self).setUp()
+        self.client = self.mock_serverproxy.return_value
+        self.client.system.listSystems.return_value = [
+            {"id": 1000010000 + i} for i in range(3)
+        ]
+        self.client.system.getRelevantErrata.side_effect = relevant_errata
+        self.client.errata.getDetails.side_effect = errata_details
+
+    def run_module(self, **kwargs):
+        self.set_module_args(dict(self.base_args, **kwargs))
+        with self.assertRaises(ansible_exit_json) as result:
+            errata_facts.main()
+        return result.exception.args[0]
+
+    def test_errata(self):
+        ret = self.run_module()
+        self.assertFalse(ret["changed"])
+        errata = ret["ansible_facts"]["suma_errata"]
+        self.assertEqual(sorted(errata["advisories"]), sorted(ERRATA))
+        self.assertEqual(
+            errata["advisories"]["SUSE-2022-0001"],
+            {
+                "id": 1,
+                "advisory_type": "Security Advisory",
+                "advisory_synopsis": "Update SUSE-2022-0001",
+            },
+        )
+        self.assertEqual(errata["affected"]["SUSE-2022-0001"], [1000010000, 1000010001])
+        self.assertEqual(errata["affected"]["SUSE-2022-0003"], [1000010001])
+        self.assertEqual(
+            errata["systems"],
+            {
+                1000010000: ["SUSE-2022-0001", "SUSE-2022-0002"],
+                1000010001: ["SUSE-2022-0001", "SUSE-2022-0003"],
+                1000010002: [],
+            },
+        )
+        self.assertEqual(ret["errors"], {})
+        self.assertEqual(self.client.errata.getDetails.call_count, 0)
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_errata_ids(self):
+        ret = self.run_module(ids=[1000010000, 1000010042])
+        errata = ret["ansible_facts"]["suma_errata"]
+        self.assertEqual(list(errata["systems"]), [1000010000])
+        self.assertEqual(list(ret["errors"]), [1000010042])
+        self.assertEqual(self.client.system.listSystems.call_count, 0)
+
+    def test_errata_types(self):
+        ret = self.run_module(advisory_types=["Bug Fix Advisory"])
+        errata = ret["ansible_facts"]["suma_errata"]
+        self.assertEqual(list(errata["advisories"]), ["SUSE-2022-0002"])
+        self.assertEqual(errata["affected"], {"SUSE-2022-0002": [1000010000]})
+        self.assertEqual(errata["systems"][1000010001], [])
+
+    def test_errata_severities(self):
+        ret = self.run_module(
+            advisory_types=["Security Advisory"], severities=["critical"]
+        )
+        errata = ret["ansible_facts"]["suma_errata"]
+        self.assertEqual(list(errata["advisories"]), ["SUSE-2022-0001"])
+        self.assertEqual(errata["advisories"]["SUSE-2022-0001"]["severity"], "Critical")
+        # only the advisories left by the type filter are looked up
+        self.assertEqual(self.client.errata.getDetails.call_count, 2)
+
+    def test_errata_severities_fail(self):
+        self.client.errata.getDetails.side_effect = xmlrpc.client.Fault(
+            -208, "No such errata"
+        )
+        self.set_module_args(dict(self.base_args, severities=["low"]))
+        with self.assertRaises(ansible_fail_json) as result:
+            errata_facts.main()
+        self.assertIn("Failed to get errata details", result.exception.args[0]["msg"])
+        self.assertEqual(self.logout.call_count, 1)
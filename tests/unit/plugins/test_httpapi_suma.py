@@ -0,0 +1,156 @@
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    HTTPAPI_SESSION_KEY,
+)
+from ansible_collections.apatard.suma.plugins.modules import (
+    saltkey,
+)
+from ansible_collections.apatard.suma.tests.unit.modules.fake_suma import (
+    FakeFleet,
+    FakeSumaAPI,
+)
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+from ansible.module_utils.connection import ConnectionError as AnsibleConnectionError
+
+import io
+import unittest
+import xmlrpc.client
+
+from mock import MagicMock, patch
+
+try:
+    from ansible_collections.apatard.suma.plugins.httpapi.suma import HttpApi
+except ImportError:
+    HttpApi = None
+
+
+def fake_send(api):
+    """Returns a Connection.send() implementation serving api"""
+
+    def send(path, data, **kwargs):
+        (params, method) = xmlrpc.client.loads(data, use_builtin_types=True)
+        try:
+            response = xmlrpc.client.dumps(
+                (api._dispatch(method, params),), methodresponse=True
+            )
+        except xmlrpc.client.Fault as fault:
+            response = xmlrpc.client.dumps(fault)
+        return (MagicMock(), io.BytesIO(response.encode()))
+
+    return send
+
+
+class test_suma_httpapi_module(test_suma_module):
+    def setUp(self):
+        super(test_suma_httpapi_module, self).setUp()
+        self.connection_patch = patch(
+            "ansible_collections.apatard.suma.plugins.module_utils.suma_utils.Connection"
+        )
+        self.addCleanup(self.connection_patch.stop)
+        self.connection = self.connection_patch.start().return_value
+        self.connection.get_option.return_value = "suma.example.com"
+        self.responses = {
+            "saltkey.acceptedList": [],
+            "saltkey.pendingList": ["pending1.example.com"],
+            "saltkey.rejectedList": [],
+            "saltkey.accept": 1,
+        }
+        self.requests = []
+
+        def send_request(data):
+            (params, method) = xmlrpc.client.loads(data)
+            self.requests.append((method, params))
+            return xmlrpc.client.dumps((self.responses[method],), methodresponse=True)
+
+        self.connection.send_request.side_effect = send_request
+
+    def test_httpapi(self):
+        self.set_module_args(
+            {
+                "key": "pending1.example.com",
+                "state": "accepted",
+                "_ansible_socket": "/tmp/suma.sock",
+            }
+        )
+        with self.assertRaises(ansible_exit_json) as result:
+            saltkey.main()
+        self.assertTrue(result.exception.args[0]["changed"])
+        # no login nor logout, the plugin owns the session
+        self.assertEqual(
+            [method for (method, params) in self.requests],
+            [
+                "saltkey.acceptedList",
+                "saltkey.pendingList",
+                "saltkey.rejectedList",
+                "saltkey.accept",
+            ],
+        )
+        self.assertEqual(
+            self.requests[-1][1], (HTTPAPI_SESSION_KEY, "pending1.example.com")
+        )
+        self.assertEqual(self.mock_serverproxy.call_count, 0)
+
+    def test_httpapi_error(self):
+        self.connection.send_request.side_effect = AnsibleConnectionError(
+            "Internal error", code=500
+        )
+        self.set_module_args(
+            {
+                "key": "pending1.example.com",
+                "state": "accepted",
+                "_ansible_socket": "/tmp/suma.sock",
+            }
+        )
+        with self.assertRaises(xmlrpc.client.ProtocolError) as err:
+            saltkey.main()
+        self.assertEqual(err.exception.errcode, 500)
+
+    def test_missing_credentials(self):
+        self.set_module_args({"key": "pending1.example.com", "state": "accepted"})
+        with self.assertRaises(ansible_fail_json) as result:
+            saltkey.main()
+        self.assertEqual(
+            result.exception.args[0]["msg"],
+            "missing required arguments: hostname, login, password",
+        )
+
+
+@unittest.skipIf(HttpApi is None, "ansible.netcommon is not installed")
+class test_suma_httpapi_plugin(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeSumaAPI(FakeFleet(10))
+        self.connection = MagicMock()
+        self.connection.send.side_effect = fake_send(self.api)
+        self.httpapi = HttpApi(self.connection)
+        self.httpapi.login("login", "password")
+
+    def send(self, method, *params):
+        request = xmlrpc.client.dumps(params, method)
+        response = self.httpapi.send_request(request)
+        return xmlrpc.client.loads(response, use_datetime=True)[0][0]
+
+    def test_send_request(self):
+        result = self.send("system.getName", HTTPAPI_SESSION_KEY, 1000010001)
+        self.assertEqual(result["name"], "sys-000001.example.com")
+        self.assertEqual(self.api.calls["auth.login"], 1)
+
+    def test_fault(self):
+        with self.assertRaises(xmlrpc.client.Fault) as fault:
+            self.send("system.getName", HTTPAPI_SESSION_KEY, 42)
+        self.assertEqual(fault.exception.faultCode, -210)
+        self.assertEqual(self.api.calls["auth.login"], 1)
+
+    def test_session_expired(self):
+        self.api.sessions.clear()
+        result = self.send("system.getName", HTTPAPI_SESSION_KEY, 1000010001)
+        self.assertEqual(result["id"], 1000010001)
+        self.assertEqual(self.api.calls["auth.login"], 2)
+
+    def test_logout(self):
+        self.httpapi.logout()
+        self.httpapi.logout()
+        self.assertEqual(self.api.calls["auth.logout"], 1)
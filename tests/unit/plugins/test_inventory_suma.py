@@ -0,0 +1,101 @@
+from ansible_collections.apatard.suma.plugins.inventory.suma import InventoryModule
+
+from ansible.inventory.data import InventoryData
+from ansible.parsing.dataloader import DataLoader
+
+import datetime
+import unittest
+
+from mock import patch
+
+
+class test_suma_inventory(unittest.TestCase):
+    def setUp(self):
+        self.mock_serverproxy_patch = patch("xmlrpc.client.ServerProxy")
+        self.addCleanup(self.mock_serverproxy_patch.stop)
+        self.mock_serverproxy = self.mock_serverproxy_patch.start()
+        client = self.mock_serverproxy.return_value
+        client.auth.login.return_value = "1234"
+        client.system.listSystems.return_value = [
+            {
+                "id": 1000010000,
+                "name": "web1",
+                "last_checkin": datetime.datetime(2022, 10, 1, 12, 0),
+            },
+            {"id": 1000010001, "name": "db1", "last_checkin": None},
+        ]
+        client.system.getNetworkForSystems.return_value = [
+            {
+                "system_id": 1000010000,
+                "system_name": "web1",
+                "hostname": "web1.example.com",
+                "ip": "192.168.1.10",
+            },
+            {
+                "system_id": 1000010001,
+                "system_name": "db1",
+                "hostname": "db1.example.com",
+                "ip": "192.168.1.11",
+            },
+        ]
+        client.systemgroup.listAllGroups.return_value = [{"name": "web servers"}]
+        client.systemgroup.listSystemsMinimal.return_value = [{"id": 1000010000}]
+
+        self.plugin = InventoryModule()
+        self.plugin._load_name = InventoryModule.NAME
+        self.inventory = InventoryData()
+        self.options = {
+            "plugin": "apatard.suma.suma",
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+            "ssl_check": True,
+            "inventory_hostname": "hostname",
+            "system_groups": True,
+            "refresh_cache": False,
+            "cache": True,
+            "compose": {},
+            "groups": {},
+            "keyed_groups": [],
+            "strict": False,
+        }
+        self.plugin._read_config_data = lambda path: None
+        self.plugin.get_option = self.options.get
+        self.plugin._cache = {}
+
+    def parse(self, cache=True):
+        self.plugin.parse(self.inventory, DataLoader(), "/tmp/suma.yml", cache)
+
+    def test_verify_file(self):
+        with patch("os.path.exists", return_value=True), patch(
+            "os.access", return_value=True
+        ):
+            self.assertTrue(self.plugin.verify_file("/tmp/suma.yml"))
+            self.assertFalse(self.plugin.verify_file("/tmp/hosts.yml"))
+
+    def test_populate(self):
+        self.parse()
+        host = self.inventory.get_host("web1.example.com")
+        self.assertEqual(host.vars["suma_system_id"], 1000010000)
+        self.assertEqual(host.vars["suma_ip"], "192.168.1.10")
+        self.assertEqual(host.vars["suma_last_checkin"], "2022-10-01T12:00:00")
+        self.assertIn("db1.example.com", self.inventory.hosts)
+        self.assertEqual(
+            [h.name for h in self.inventory.groups["suma_group_web_servers"].hosts],
+            ["web1.example.com"],
+        )
+
+    def test_cache(self):
+        client = self.mock_serverproxy.return_value
+        self.parse()
+        self.parse()
+        self.assertEqual(client.system.listSystems.call_count, 1)
+        self.assertEqual(client.auth.logout.call_count, 1)
+
+        # --flush-cache
+        self.parse(cache=False)
+        self.assertEqual(client.system.listSystems.call_count, 2)
+
+        self.options["refresh_cache"] = True
+        self.parse()
+        self.assertEqual(client.system.listSystems.call_count, 3)
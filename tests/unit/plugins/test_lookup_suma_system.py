@@ -0,0 +1,129 @@
+from ansible_collections.apatard.suma.plugins.lookup import suma_system
+from ansible_collections.apatard.suma.plugins.lookup.suma_system import LookupModule
+
+from ansible.errors import AnsibleError
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import xmlrpc
+
+from mock import patch
+
+
+class test_suma_system_lookup(unittest.TestCase):
+    def setUp(self):
+        self.mock_serverproxy_patch = patch("xmlrpc.client.ServerProxy")
+        self.addCleanup(self.mock_serverproxy_patch.stop)
+        self.mock_serverproxy = self.mock_serverproxy_patch.start()
+        client = self.mock_serverproxy.return_value
+        client.auth.login.return_value = "1234"
+        client.system.listSystems.return_value = [
+            {
+                "id": 1000010000,
+                "name": "web1",
+                "last_checkin": datetime.datetime(2022, 10, 1, 12, 0),
+            },
+            {
+                "id": 1000010001,
+                "name": "web1",
+                "last_checkin": datetime.datetime(2022, 10, 2, 12, 0),
+            },
+            {"id": 1000010002, "name": "db1", "last_checkin": None},
+        ]
+        client.system.getNetworkForSystems.return_value = [
+            {"system_id": 1000010000, "hostname": "web1.example.com", "ip": "10.0.0.1"},
+            {"system_id": 1000010001, "hostname": "web1.example.com", "ip": "10.0.0.2"},
+            {"system_id": 1000010002, "hostname": "db1.example.com", "ip": "10.0.0.3"},
+        ]
+        client.system.getMinionIdMap.return_value = {
+            "web1.example.com": 1000010001,
+            "db1.example.com": 1000010002,
+        }
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(suma_system._TABLES.clear)
+        self.addCleanup(suma_system._REFRESHED.clear)
+        self.options = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+            "ssl_check": True,
+            "key": "hostname",
+            "on_missing": "error",
+            "cache_dir": self.cache_dir,
+            "cache_ttl": 600,
+            "refresh_cache": False,
+        }
+
+    def run_lookup(self, terms, **kwargs):
+        lookup = LookupModule()
+        options = dict(self.options, **kwargs)
+        lookup.set_options = lambda var_options=None, direct=None: None
+        lookup.get_option = options.get
+        return lookup.run(terms, {})
+
+    def test_lookup_keys(self):
+        # the most recently checked in system wins
+        result = self.run_lookup(["web1.example.com"])
+        self.assertEqual(result[0]["id"], 1000010001)
+        self.assertEqual(result[0]["last_checkin"], "2022-10-02T12:00:00")
+
+        result = self.run_lookup(["10.0.0.1", "10.0.0.3"], key="ip")
+        self.assertEqual([s["id"] for s in result], [1000010000, 1000010002])
+
+        result = self.run_lookup([1000010002, "1000010000"], key="id")
+        self.assertEqual([s["name"] for s in result], ["db1", "web1"])
+
+        result = self.run_lookup(["db1.example.com"], key="minion_id")
+        self.assertEqual(result[0]["id"], 1000010002)
+        self.assertIsNone(self.run_lookup(["10.0.0.1"], key="ip")[0]["minion_id"])
+
+    def test_lookup_missing(self):
+        with self.assertRaises(AnsibleError):
+            self.run_lookup(["unknown.example.com"])
+        self.assertEqual(self.run_lookup(["unknown"], on_missing="skip"), [])
+        with patch.object(suma_system.display, "warning") as warning:
+            self.assertEqual(self.run_lookup(["unknown"], on_missing="warn"), [])
+        warning.assert_called_once()
+
+    def test_lookup_cache(self):
+        client = self.mock_serverproxy.return_value
+        for i in range(10):
+            self.run_lookup(["web1.example.com"])
+        self.assertEqual(client.system.listSystems.call_count, 1)
+        self.assertEqual(client.auth.logout.call_count, 1)
+
+        # a new process reuses the on-disk table
+        suma_system._TABLES.clear()
+        self.run_lookup(["db1.example.com"])
+        self.assertEqual(client.system.listSystems.call_count, 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        # refresh only once per process
+        self.run_lookup(["db1.example.com"], refresh_cache=True)
+        self.run_lookup(["db1.example.com"], refresh_cache=True)
+        self.assertEqual(client.system.listSystems.call_count, 2)
+
+        # expired
+        suma_system._TABLES.clear()
+        self.run_lookup(["db1.example.com"], cache_ttl=0)
+        self.run_lookup(["db1.example.com"], cache_ttl=0)
+        self.assertEqual(client.system.listSystems.call_count, 3)
+
+    def test_lookup_without_minion_map(self):
+        client = self.mock_serverproxy.return_value
+        client.system.getMinionIdMap.side_effect = xmlrpc.client.Fault(
+            -1, "Unknown method"
+        )
+        result = self.run_lookup(["db1.example.com"])
+        self.assertIsNone(result[0]["minion_id"])
+
+    def test_lookup_login_failure(self):
+        client = self.mock_serverproxy.return_value
+        client.auth.login.side_effect = xmlrpc.client.Fault(2950, "Wrong password")
+        with self.assertRaises(AnsibleError):
+            self.run_lookup(["db1.example.com"])
@@ -233,3 +233,95 @@ class test_suma_saltkey(test_suma_module):
         self.assertEqual(
             self.mock_serverproxy.return_value.saltkey.delete.call_count, 0
         )
+
+    # Tests for keys
+    def test_keys_accept(self):
+        self.set_args(
+            {
+                "keys": ["pending1.example.com", "accepted1.example.com"],
+                "state": "accepted",
+            }
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            saltkey.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertTrue(ret["results"]["pending1.example.com"]["changed"])
+        self.assertFalse(ret["results"]["accepted1.example.com"]["changed"])
+        self.assertEqual(ret["diff"]["after"], "pending1.example.com: accepted\n")
+        self.mock_serverproxy.return_value.saltkey.accept.assert_called_once_with(
+            "1234", "pending1.example.com"
+        )
+        self.assertEqual(
+            self.mock_serverproxy.return_value.saltkey.pendingList.call_count, 1
+        )
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_keys_partial_failure(self):
+        self.set_args(
+            {
+                "keys": ["pending1.example.com", "rej1.example.com", "notfound"],
+                "state": "accepted",
+            }
+        )
+
+        with self.assertRaises(ansible_fail_json) as result:
+            saltkey.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(
+            ret["results"]["rej1.example.com"]["msg"],
+            "Key neither accepted nor pending",
+        )
+        self.assertEqual(ret["results"]["notfound"]["msg"], "Key not found")
+        self.assertEqual(
+            self.mock_serverproxy.return_value.saltkey.accept.call_count, 1
+        )
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_keys_glob(self):
+        self.set_args(
+            {"keys": ["*1.example.com"], "match": "glob", "state": "accepted"}
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            saltkey.main()
+        ret = result.exception.args[0]
+        self.assertEqual(
+            sorted(ret["results"]), ["accepted1.example.com", "pending1.example.com"]
+        )
+        self.assertEqual(
+            self.mock_serverproxy.return_value.saltkey.accept.call_count, 1
+        )
+
+    def test_keys_regex_delete_check_mode(self):
+        self.set_args(
+            {
+                "keys": ["^pending", "^rej2"],
+                "match": "regex",
+                "state": "absent",
+                "_ansible_check_mode": True,
+            }
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            saltkey.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(
+            sorted(ret["results"]),
+            ["pending1.example.com", "pending2.example.com", "rej2.example.com"],
+        )
+        self.assertEqual(
+            self.mock_serverproxy.return_value.saltkey.delete.call_count, 0
+        )
+
+    def test_keys_invalid_regex(self):
+        self.set_args({"keys": ["pending(["], "match": "regex", "state": "absent"})
+
+        with self.assertRaises(ansible_fail_json) as result:
+            saltkey.main()
+        self.assertIn("Invalid regular expression", result.exception.args[0]["msg"])
+        # nothing asked to the server
+        self.assertEqual(self.login.call_count, 0)
@@ -0,0 +1,204 @@
+from ansible_collections.apatard.suma.plugins.module_utils.suma_async import (
+    AsyncSumaClient,
+    AsyncSumaTransport,
+    suma_async_map,
+)
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    SumaClient,
+    SumaLimiter,
+    SumaStats,
+    suma_proxy,
+    suma_ssl_context,
+)
+from ansible_collections.apatard.suma.tests.unit.modules.fake_suma import (
+    FakeFleet,
+    FakeSumaAPI,
+    FakeSumaServer,
+    _server_context,
+)
+
+import asyncio
+import datetime
+import shutil
+import tempfile
+import unittest
+import xmlrpc
+
+from mock import MagicMock, patch
+
+
+class test_suma_async(unittest.TestCase):
+    def start_server(self, **kwargs):
+        self.api = FakeSumaAPI(FakeFleet(100))
+        self.server = FakeSumaServer(self.api, **kwargs).start()
+        self.addCleanup(self.server.stop)
+
+    def connect(self):
+        module = MagicMock()
+        module.params = {"hostname": self.server.hostname, "ssl_check": False}
+        (proxy, transport) = suma_proxy(self.server.hostname, ssl_check=False)
+        client = SumaClient(module, proxy, transport)
+        client._session_key = proxy.auth.login("login", "password")
+        self.addCleanup(transport.close)
+        return client
+
+    def run_calls(self, *calls):
+        transport = AsyncSumaTransport(
+            self.server.hostname, suma_ssl_context(False), max_connections=2
+        )
+        client = AsyncSumaClient(transport)
+
+        async def run():
+            try:
+                session_key = await client.auth.login("login", "password")
+                return await asyncio.gather(
+                    *(call(client, session_key) for call in calls)
+                )
+            finally:
+                await transport.close()
+
+        return (asyncio.run(run()), transport)
+
+    def test_calls(self):
+        self.start_server()
+        ((systems, name), transport) = self.run_calls(
+            lambda c, key: c.system.listSystems(key),
+            lambda c, key: c.system.getName(key, 1000010001),
+        )
+        self.assertEqual(len(systems), 100)
+        self.assertIsInstance(systems[0]["last_checkin"], datetime.datetime)
+        self.assertEqual(name["name"], "sys-000001.example.com")
+        self.assertLessEqual(transport.connections, 2)
+        self.assertEqual(transport.sent, self.api.bytes_in)
+
+    def test_calls_gzip(self):
+        self.start_server(gzip=True)
+        ((systems,), transport) = self.run_calls(
+            lambda c, key: c.system.listSystems(key)
+        )
+        self.assertEqual(len(systems), 100)
+        raw = xmlrpc.client.dumps((systems,), methodresponse=True)
+        self.assertLess(transport.received, len(raw) / 4)
+
+    def test_fault(self):
+        self.start_server()
+        with self.assertRaises(xmlrpc.client.Fault) as fault:
+            self.run_calls(lambda c, key: c.system.getName(key, 42))
+        self.assertEqual(fault.exception.faultCode, -210)
+
+    def test_async_map(self):
+        self.start_server()
+        client = self.connect()
+        client._instrumentation = SumaStats()
+        session_key = client._session_key
+
+        async def get_products(async_client, system_id):
+            return await async_client.system.getInstalledProducts(
+                session_key, system_id
+            )
+
+        ids = list(range(1000010000, 1000010100)) + [42, 1000010000]
+        (results, errors) = suma_async_map(client, get_products, ids, 4)
+        self.assertEqual(list(results), ids[:100])
+        self.assertEqual(results[1000010000][0]["name"], "SLES")
+        self.assertEqual(list(errors), [42])
+        self.assertEqual(self.api.calls["system.getInstalledProducts"], 101)
+        # the pool is reused by the workers
+        self.assertEqual(client._stats()["connections"], 1 + 4)
+        calls = client._instrumentation.calls["system.getInstalledProducts"]
+        self.assertEqual(calls["count"], 101)
+        self.assertGreater(calls["received"], 0)
+
+    def test_async_map_stale_key(self):
+        self.start_server()
+        client = self.connect()
+        client._stale_keys.add("stale")
+
+        async def get_name(async_client, system_id):
+            return await async_client.system.getName("stale", system_id)
+
+        (results, errors) = suma_async_map(client, get_name, [1000010000], 2)
+        self.assertEqual(errors, {})
+        self.assertEqual(results[1000010000]["id"], 1000010000)
+
+    def test_async_map_limiter(self):
+        self.start_server()
+        client = self.connect()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        client._limiter = SumaLimiter(cache_dir, self.server.hostname, max_rate=50)
+        self.addCleanup(client._limiter.release)
+
+        async def get_name(async_client, system_id):
+            return await async_client.system.getName(client._session_key, system_id)
+
+        ids = list(range(1000010000, 1000010060))
+        # the event loop must not be blocked while waiting for tokens
+        with patch("time.sleep", side_effect=AssertionError("time.sleep called")):
+            (results, errors) = suma_async_map(client, get_name, ids, 4)
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(results), ids)
+        self.assertGreater(client._limiter.rate_wait, 0)
+
+
+class test_suma_async_retry(unittest.TestCase):
+    """Resending a request on a reused connection closed by the server"""
+
+    RESPONSE = (
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/xml\r\nContent-Length: 2\r\n\r\nok"
+    )
+
+    def run_requests(self, second):
+        """Sends two requests, the server answers the second with second"""
+        requests = []
+
+        async def handle(reader, writer):
+            try:
+                while True:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                    length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+                    await reader.readexactly(length)
+                    requests.append(writer)
+                    if len(requests) == 2:
+                        writer.write(second)
+                        writer.close()
+                        return
+                    writer.write(self.RESPONSE)
+                    await writer.drain()
+            except asyncio.IncompleteReadError:
+                writer.close()
+
+        async def run():
+            server = await asyncio.start_server(
+                handle, "127.0.0.1", 0, ssl=_server_context()[0]
+            )
+            port = server.sockets[0].getsockname()[1]
+            transport = AsyncSumaTransport(f"127.0.0.1:{port}", suma_ssl_context(False))
+            try:
+                first = await transport.request(b"<call/>")
+                try:
+                    second = await transport.request(b"<call/>")
+                except (OSError, EOFError) as err:
+                    second = err
+            finally:
+                await transport.close()
+                server.close()
+                await server.wait_closed()
+            return (first, second, transport)
+
+        (first, second, transport) = asyncio.run(run())
+        self.assertEqual(first[3], b"ok")
+        return (second, requests, transport)
+
+    def test_closed_before_response(self):
+        (response, requests, transport) = self.run_requests(b"")
+        self.assertEqual(response[3], b"ok")
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(transport.connections, 2)
+
+    def test_closed_during_response(self):
+        (error, requests, transport) = self.run_requests(self.RESPONSE[:20])
+        self.assertIsInstance(error, EOFError)
+        # the call may have run, it's not sent again
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(transport.connections, 1)
@@ -0,0 +1,464 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    saltkey,
+)
+
+from ansible_collections.apatard.suma.plugins.module_utils.suma_utils import (
+    SessionCache,
+    SumaClient,
+    SumaError,
+    SumaLimiter,
+    SumaStats,
+    SumaTransport,
+    suma_fetch_systems,
+    suma_map,
+    suma_proxy,
+    suma_ssl_context,
+)
+from ansible_collections.apatard.suma.tests.unit.modules.fake_suma import (
+    FakeFleet,
+    FakeSumaAPI,
+    FakeSumaServer,
+)
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    exit_json,
+    fail_json,
+    test_suma_module,
+)
+
+from ansible.module_utils import basic
+
+import os
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+import unittest
+import xmlrpc
+
+from mock import MagicMock, patch
+
+
+class test_suma_session_cache(test_suma_module):
+    def setUp(self):
+        super(test_suma_session_cache, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        ret_value = self.mock_serverproxy.return_value
+        ret_value.saltkey.acceptedList.return_value = ["accepted1.example.com"]
+        ret_value.saltkey.pendingList.return_value = []
+        ret_value.saltkey.rejectedList.return_value = []
+
+    def run_saltkey(self, **kwargs):
+        args = {
+            "key": "accepted1.example.com",
+            "state": "accepted",
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+            "session_cache": True,
+            "session_cache_dir": self.cache_dir,
+        }
+        args.update(kwargs)
+        self.set_module_args(args)
+        with self.assertRaises(ansible_exit_json) as result:
+            saltkey.main()
+        return result.exception.args[0]
+
+    def test_session_reused(self):
+        self.run_saltkey()
+        self.run_saltkey()
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(self.logout.call_count, 0)
+        entries = [f for f in os.listdir(self.cache_dir) if f.endswith(".json")]
+        self.assertEqual(len(entries), 1)
+
+    def test_session_per_login(self):
+        self.run_saltkey()
+        self.run_saltkey(login="other")
+        self.assertEqual(self.login.call_count, 2)
+
+    def test_session_expired_ttl(self):
+        self.run_saltkey(session_cache_ttl=0)
+        self.run_saltkey(session_cache_ttl=0)
+        self.assertEqual(self.login.call_count, 2)
+
+    def test_session_refused_relogin(self):
+        self.run_saltkey()
+        self.login.return_value = "5678"
+        accepted_list = self.mock_serverproxy.return_value.saltkey.acceptedList
+        accepted_list.side_effect = [
+            xmlrpc.client.Fault(2950, "Could not find session"),
+            ["accepted1.example.com"],
+        ]
+
+        result = self.run_saltkey()
+        self.assertFalse(result["changed"])
+        self.assertEqual(self.login.call_count, 2)
+        self.assertEqual(accepted_list.call_args_list[-1].args, ("5678",))
+        # later calls done with the old key are using the new session
+        pending_list = self.mock_serverproxy.return_value.saltkey.pendingList
+        self.assertEqual(pending_list.call_args.args, ("5678",))
+
+        accepted_list.side_effect = None
+        self.run_saltkey()
+        self.assertEqual(self.login.call_count, 2)
+
+
+class test_suma_session_cache_threads(unittest.TestCase):
+    def test_stale_key_threads(self):
+        api = FakeSumaAPI(FakeFleet(10))
+        server = FakeSumaServer(api).start()
+        self.addCleanup(server.stop)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        module = MagicMock()
+        module.params = {
+            "hostname": server.hostname,
+            "ssl_check": False,
+            "login": "login",
+            "password": "password",
+        }
+        (proxy, transport) = suma_proxy(server.hostname, ssl_check=False)
+        client = SumaClient(module, proxy, transport)
+        client._session_cache = SessionCache(cache_dir, server.hostname, "login", 60)
+        client._session_cache.set("stale")
+        client._session_key = client._login(client._session_cache)
+        self.assertEqual(client._session_key, "stale")
+
+        def get_name(thread_client, system_id):
+            return thread_client.system.getName("stale", system_id)
+
+        ids = list(range(1000010000, 1000010008))
+        outcome = []
+        thread = threading.Thread(
+            target=lambda: outcome.append(suma_map(client, get_name, ids, 4)),
+            daemon=True,
+        )
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "suma_map is stuck")
+        client._logout()
+
+        (results, errors) = outcome[0]
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(results), ids)
+        # a single session for all the threads
+        self.assertEqual(api.calls["auth.login"], 1)
+        self.assertNotEqual(client._session_key, "stale")
+        self.assertEqual(client._session_cache.get(), client._session_key)
+
+
+class test_suma_instrumentation(test_suma_module):
+    def setUp(self):
+        super(test_suma_instrumentation, self).setUp()
+        ret_value = self.mock_serverproxy.return_value
+        ret_value.saltkey.acceptedList.return_value = ["accepted1.example.com"]
+        ret_value.saltkey.pendingList.return_value = []
+        ret_value.saltkey.rejectedList.return_value = []
+
+    def run_saltkey(self, **kwargs):
+        args = {
+            "key": "accepted1.example.com",
+            "state": "accepted",
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+        }
+        args.update(kwargs)
+        self.set_module_args(args)
+        with self.assertRaises(ansible_exit_json) as result:
+            saltkey.main()
+        return result.exception.args[0]
+
+    def test_instrumentation_disabled(self):
+        result = self.run_saltkey()
+        self.assertNotIn("calls", result["suma_stats"])
+
+    def test_startup(self):
+        startup = self.run_saltkey()["suma_stats"]["startup"]
+        self.assertEqual(sorted(startup), ["connect", "login", "ssl_context"])
+
+    def test_instrumentation(self):
+        result = self.run_saltkey(instrumentation=True)
+        calls = result["suma_stats"]["calls"]
+        self.assertEqual(
+            sorted(calls),
+            [
+                "auth.login",
+                "auth.logout",
+                "saltkey.acceptedList",
+                "saltkey.pendingList",
+                "saltkey.rejectedList",
+            ],
+        )
+        self.assertEqual(calls["auth.login"]["count"], 1)
+        traces = result["suma_stats"]["traces"]
+        self.assertEqual(traces[0]["method"], "auth.login")
+        self.assertEqual(traces[-1]["method"], "auth.logout")
+        self.assertEqual(len(traces), 5)
+
+
+class test_suma_transport(unittest.TestCase):
+    def test_transport_bytes(self):
+        api = FakeSumaAPI(FakeFleet(10))
+        server = FakeSumaServer(api).start()
+        self.addCleanup(server.stop)
+
+        (proxy, transport) = suma_proxy(server.hostname, ssl_check=False)
+        session_key = proxy.auth.login("login", "password")
+        proxy.system.listSystems(session_key)
+        transport.close()
+
+        self.assertEqual(transport.connections, 1)
+        self.assertEqual(transport.sent, api.bytes_in)
+        # the server also counts the response headers
+        self.assertGreater(transport.received, 0)
+        self.assertLess(transport.received, api.bytes_out)
+
+
+class test_suma_fetch_systems(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeSumaAPI(FakeFleet(10))
+        self.server = FakeSumaServer(self.api).start()
+        self.addCleanup(self.server.stop)
+        close = patch.object(
+            SumaTransport, "close", autospec=True, side_effect=SumaTransport.close
+        )
+        self.close = close.start()
+        self.addCleanup(close.stop)
+
+    def test_fetch_systems(self):
+        (systems, names) = suma_fetch_systems(
+            self.server.hostname,
+            "login",
+            "password",
+            ssl_check=False,
+            extra=lambda client, key: client.system.getMinionIdMap(key),
+        )
+        self.assertEqual(len(systems), 10)
+        self.assertEqual(
+            systems[0],
+            {
+                "id": 1000010000,
+                "name": "sys-000000.example.com",
+                "hostname": "sys-000000.example.com",
+                "ip": "10.0.0.1",
+                "last_checkin": "2022-10-01T00:00:00",
+            },
+        )
+        self.assertEqual(len(names), 10)
+        self.assertEqual(self.api.calls["auth.logout"], 1)
+        self.assertEqual(self.close.call_count, 1)
+
+    def test_fetch_systems_fail(self):
+        with self.assertRaises(SumaError) as result:
+            suma_fetch_systems(self.server.hostname, "login", "wrong", ssl_check=False)
+        self.assertIn("Failed to login", str(result.exception))
+        self.assertEqual(self.close.call_count, 1)
+
+        def fail(client, key):
+            raise xmlrpc.client.Fault(-1, "oops")
+
+        with self.assertRaises(SumaError) as result:
+            suma_fetch_systems(
+                self.server.hostname, "login", "password", False, extra=fail
+            )
+        self.assertIn("Failed to get system list", str(result.exception))
+        self.assertEqual(self.api.calls["auth.logout"], 1)
+        self.assertEqual(self.close.call_count, 2)
+
+
+class test_suma_tls(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeSumaAPI(FakeFleet(10))
+        self.server = FakeSumaServer(self.api).start()
+        self.addCleanup(self.server.stop)
+
+    def test_context_cached(self):
+        self.assertIs(suma_ssl_context(False), suma_ssl_context(False))
+        self.assertIsNot(suma_ssl_context(False), suma_ssl_context(True))
+
+    def test_ca_file(self):
+        with tempfile.NamedTemporaryFile(suffix=".pem") as ca_file:
+            ca_file.write(self.server.certificate)
+            ca_file.flush()
+            (proxy, transport) = suma_proxy(self.server.hostname, ca_file=ca_file.name)
+            self.addCleanup(transport.close)
+            self.assertIsInstance(proxy.auth.login("login", "password"), str)
+        (proxy, transport) = suma_proxy(self.server.hostname)
+        self.addCleanup(transport.close)
+        with self.assertRaises(ssl.SSLCertVerificationError):
+            proxy.auth.login("login", "password")
+
+    def test_session_resumed(self):
+        (proxy, transport) = suma_proxy(self.server.hostname, ssl_check=False)
+        session_key = proxy.auth.login("login", "password")
+        transport.close()
+        proxy.system.listSystems(session_key)
+        transport.close()
+        # a new transport resumes the session too
+        (proxy, transport) = suma_proxy(self.server.hostname, ssl_check=False)
+        proxy.system.listSystems(session_key)
+        transport.close()
+        self.assertEqual(transport.connections, 1)
+        self.assertEqual(transport.resumed, 1)
+        self.assertGreater(transport.connect_time, 0)
+
+
+class test_suma_limiter(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_rate(self):
+        limiter = SumaLimiter(self.cache_dir, "suma.example.com", max_rate=2)
+        self.addCleanup(limiter.release)
+        with patch("time.sleep") as sleep:
+            limiter.throttle()
+            limiter.throttle()
+            sleep.assert_not_called()
+            limiter.throttle()
+            limiter.throttle()
+        # the bucket is shared with the other processes
+        other = SumaLimiter(self.cache_dir, "suma.example.com", max_rate=2)
+        self.addCleanup(other.release)
+        with patch("time.sleep") as other_sleep:
+            other.throttle()
+        self.assertEqual(sleep.call_count, 2)
+        self.assertAlmostEqual(sleep.call_args_list[0].args[0], 0.5, delta=0.1)
+        self.assertAlmostEqual(sleep.call_args_list[1].args[0], 1.0, delta=0.1)
+        self.assertAlmostEqual(other_sleep.call_args.args[0], 1.5, delta=0.1)
+        self.assertAlmostEqual(limiter.rate_wait, 1.5, delta=0.2)
+
+        # other hosts have their own bucket
+        limiter = SumaLimiter(self.cache_dir, "suma2.example.com", max_rate=2)
+        self.addCleanup(limiter.release)
+        with patch("time.sleep") as sleep:
+            limiter.throttle()
+        sleep.assert_not_called()
+
+    def test_sessions(self):
+        first = SumaLimiter(self.cache_dir, "suma.example.com", max_sessions=1)
+        first.acquire()
+        second = SumaLimiter(self.cache_dir, "suma.example.com", max_sessions=1)
+        thread = threading.Thread(target=second.acquire)
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        first.release()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        second.release()
+        self.assertGreater(second.session_wait, 0.05)
+        self.assertLess(first.session_wait, 0.05)
+
+    def test_module_limiter(self):
+        with patch("xmlrpc.client.ServerProxy") as proxy, patch.multiple(
+            basic.AnsibleModule, exit_json=exit_json, fail_json=fail_json
+        ):
+            proxy.return_value.auth.login.return_value = "1234"
+            proxy.return_value.saltkey.acceptedList.return_value = []
+            proxy.return_value.saltkey.pendingList.return_value = []
+            proxy.return_value.saltkey.rejectedList.return_value = []
+            args = {
+                "key": "accepted1.example.com",
+                "state": "absent",
+                "hostname": "localhost.localdomain",
+                "login": "login",
+                "password": "password",
+                "session_cache_dir": self.cache_dir,
+                "max_sessions": 2,
+                "max_rate": 100,
+            }
+            test_suma_module.set_module_args(self, args)
+            with self.assertRaises(ansible_exit_json) as result:
+                saltkey.main()
+        stats = result.exception.args[0]["suma_stats"]
+        self.assertLess(stats["limiter_wait"]["sessions"], 0.05)
+        self.assertEqual(stats["limiter_wait"]["rate"], 0.0)
+        # the slot is released
+        limiter = SumaLimiter(self.cache_dir, "localhost.localdomain", max_sessions=1)
+        limiter.acquire()
+        limiter.release()
+        self.assertLess(limiter.session_wait, 0.1)
+
+
+class test_suma_streaming(unittest.TestCase):
+    def connect(self, gzip=False, compression=False):
+        self.api = FakeSumaAPI(FakeFleet(500))
+        server = FakeSumaServer(self.api, gzip=gzip).start()
+        self.addCleanup(server.stop)
+        module = MagicMock()
+        module.params = {"hostname": server.hostname, "ssl_check": False}
+        (proxy, transport) = suma_proxy(server.hostname, False, compression)
+        self.addCleanup(transport.close)
+        client = SumaClient(module, proxy, transport)
+        client._session_key = proxy.auth.login("login", "password")
+        return client
+
+    def check_stream(self, client):
+        key = client._session_key
+        expected = client.system.listSystems(key)
+        systems = client._stream("system.listSystems", key)
+        self.assertNotIsInstance(systems, list)
+        self.assertEqual(list(systems), expected)
+        # the connection is reused
+        self.assertEqual(client.system.getName(key, 1000010001)["id"], 1000010001)
+        self.assertEqual(client._transport.connections, 1)
+
+    def test_stream(self):
+        self.check_stream(self.connect())
+
+    def test_stream_gzip(self):
+        client = self.connect(gzip=True, compression=True)
+        self.check_stream(client)
+        ids = list(range(1000010000, 1000010500))
+        sent = client._transport.sent
+        self.assertEqual(
+            len(
+                list(
+                    client._stream(
+                        "system.getNetworkForSystems", client._session_key, ids
+                    )
+                )
+            ),
+            500,
+        )
+        # the request was compressed
+        self.assertLess(
+            client._transport.sent - sent, len(xmlrpc.client.dumps((ids,))) / 2
+        )
+
+    def test_stream_partial(self):
+        client = self.connect()
+        key = client._session_key
+        systems = client._stream("system.listSystems", key)
+        self.assertEqual(next(systems)["id"], 1000010000)
+        # the unread response is dropped with the connection
+        self.assertEqual(client.system.getName(key, 1000010001)["id"], 1000010001)
+        self.assertEqual(client._transport.connections, 2)
+
+    def test_stream_fault(self):
+        client = self.connect()
+        with self.assertRaises(xmlrpc.client.Fault):
+            client._stream("system.listSystems", "invalid")
+        self.assertEqual(
+            list(client._stream("system.getId", client._session_key, "x")), []
+        )
+        # not an array
+        name = list(client._stream("system.getName", client._session_key, 1000010001))
+        self.assertEqual(name[0]["id"], 1000010001)
+        self.assertEqual(client._transport.connections, 1)
+
+    def test_stream_instrumentation(self):
+        client = self.connect()
+        client._instrumentation = SumaStats()
+        received = client._transport.received
+        systems = client._stream("system.listSystems", client._session_key)
+        self.assertEqual(client._instrumentation.calls, {})
+        list(systems)
+        calls = client._instrumentation.calls["system.listSystems"]
+        self.assertEqual(calls["received"], client._transport.received - received)
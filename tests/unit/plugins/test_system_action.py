@@ -0,0 +1,208 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    system_action,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.fake_suma import (
+    FakeFleet,
+    FakeSumaAPI,
+    FakeSumaServer,
+)
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import xmlrpc
+
+from mock import Mock
+
+
+def summaries(system_ids):
+    return [{"server_id": i, "message": "done", "timestamp": None} for i in system_ids]
+
+
+class test_suma_system_action(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_system_action, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+            "ids": [1000010000, 1000010001],
+            "delay": 0.01,
+            "max_delay": 0.01,
+        }
+
+    def setUp(self):
+        super(test_suma_system_action, self).setUp()
+        self.client = self.mock_serverproxy.return_value
+        self.client.system.scheduleApplyHighstate.return_value = 5000
+        self.client.system.scheduleApplyErrata.return_value = [5000, 5001]
+        self.client.schedule.listInProgressActions.side_effect = [
+            [{"id": 5000}, {"id": 5001}, {"id": 42}],
+            [{"id": 5001}, {"id": 42}],
+            [{"id": 42}],
+        ]
+        self.client.schedule.listCompletedSystems.side_effect = (
+            lambda key, action_id: summaries([1000010000, 1000010001])
+        )
+        self.client.schedule.listFailedSystems.return_value = []
+        self.client.schedule.listInProgressSystems.return_value = []
+
+    def run_module(self, args, exception=ansible_exit_json):
+        self.set_module_args(dict(self.base_args, **args))
+        with self.assertRaises(exception) as result:
+            system_action.main()
+        return result.exception.args[0]
+
+    def test_highstate(self):
+        ret = self.run_module({"action": "highstate"})
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["actions"], {5000: [1000010000, 1000010001]})
+        self.assertEqual(ret["systems"][1000010001]["status"], "completed")
+        self.assertEqual(ret["systems"][1000010001]["actions"][5000]["message"], "done")
+        self.assertEqual(ret["attempts"], 2)
+        # once for the systems of the action, once for its outcome
+        self.assertEqual(self.client.schedule.listCompletedSystems.call_count, 2)
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_errata(self):
+        ret = self.run_module({"action": "errata_apply", "errata_ids": [3000, 3001]})
+        self.assertEqual(sorted(ret["actions"]), [5000, 5001])
+        self.assertEqual(sorted(ret["systems"][1000010000]["actions"]), [5000, 5001])
+        self.assertEqual(ret["systems"][1000010000]["status"], "completed")
+        # a single query per round, whatever the number of actions
+        self.assertEqual(ret["attempts"], 3)
+        self.assertEqual(self.client.schedule.listInProgressActions.call_count, 3)
+        self.client.system.scheduleApplyErrata.assert_called_once()
+
+    def test_failed(self):
+        self.client.schedule.listCompletedSystems.side_effect = (
+            lambda key, action_id: summaries([1000010000])
+        )
+        self.client.schedule.listFailedSystems.return_value = summaries([1000010001])
+        ret = self.run_module({"action": "highstate"}, ansible_fail_json)
+        self.assertEqual(ret["msg"], "Action failed on 1 systems")
+        self.assertEqual(ret["systems"][1000010000]["status"], "completed")
+        self.assertEqual(ret["systems"][1000010001]["status"], "failed")
+
+    def test_timeout(self):
+        self.client.schedule.listInProgressActions.side_effect = None
+        self.client.schedule.listInProgressActions.return_value = [{"id": 5000}]
+        ret = self.run_module({"action": "highstate", "timeout": 0}, ansible_fail_json)
+        self.assertEqual(ret["msg"], "Timeout waiting for 2 systems")
+        self.assertEqual(ret["systems"][1000010000]["status"], "pending")
+        self.assertIsNone(ret["systems"][1000010000]["elapsed"])
+
+    def test_one_action_per_system(self):
+        self.client.system.scheduleApplyHighstate.return_value = [5000, 5001]
+        self.client.schedule.listCompletedSystems.side_effect = (
+            lambda key, action_id: summaries([1000010000 + action_id - 5000])
+        )
+        ret = self.run_module({"action": "highstate"})
+        self.assertEqual(ret["actions"], {5000: [1000010000], 5001: [1000010001]})
+        self.assertEqual(ret["systems"][1000010000]["status"], "completed")
+        self.assertEqual(list(ret["systems"][1000010000]["actions"]), [5000])
+
+    def test_unlisted(self):
+        listed = []
+
+        def completed(key, action_id):
+            listed.append(action_id)
+            # the second system only shows up on the next query
+            if len(listed) < 3:
+                return summaries([1000010000])
+            return summaries([1000010000, 1000010001])
+
+        self.client.schedule.listInProgressSystems.return_value = summaries(
+            [1000010000, 1000010001]
+        )
+        self.client.schedule.listCompletedSystems.side_effect = completed
+        ret = self.run_module({"action": "highstate"})
+        self.assertEqual(ret["systems"][1000010001]["status"], "completed")
+        self.assertEqual(ret["attempts"], 3)
+
+    def test_unknown(self):
+        self.client.schedule.listCompletedSystems.side_effect = None
+        self.client.schedule.listCompletedSystems.return_value = []
+        self.client.schedule.listInProgressSystems.return_value = summaries(
+            [1000010000, 1000010001]
+        )
+        ret = self.run_module({"action": "highstate"}, ansible_fail_json)
+        self.assertEqual(ret["systems"][1000010000]["status"], "unknown")
+        self.assertEqual(ret["attempts"], 3)
+
+    def test_reboot(self):
+        self.client.system.scheduleReboot.side_effect = lambda key, system_id, e: {
+            1000010000: 5000,
+            1000010001: 5001,
+        }[system_id]
+        self.client.schedule.listCompletedSystems.side_effect = (
+            lambda key, action_id: summaries([1000010000 + action_id - 5000])
+        )
+        ret = self.run_module({"action": "reboot"})
+        self.assertEqual(ret["actions"], {5000: [1000010000], 5001: [1000010001]})
+        self.assertEqual(ret["systems"][1000010001]["status"], "completed")
+
+    def test_schedule_fail(self):
+        self.client.system.schedulePackageInstall.side_effect = xmlrpc.client.Fault(
+            -210, "No such system"
+        )
+        ret = self.run_module(
+            {"action": "package_install", "package_ids": [2000]}, ansible_fail_json
+        )
+        self.assertIn("Failed to schedule package_install", ret["msg"])
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_no_wait(self):
+        ret = self.run_module({"action": "package_upgrade", "wait": False})
+        self.assertTrue(ret["changed"])
+        self.assertIn("actions", ret)
+        self.assertEqual(self.client.schedule.listInProgressActions.call_count, 0)
+
+    def test_check_mode(self):
+        self.client.system.scheduleApplyHighstate = Mock()
+        ret = self.run_module({"action": "highstate", "_ansible_check_mode": True})
+        self.assertTrue(ret["changed"])
+        self.assertEqual(self.client.system.scheduleApplyHighstate.call_count, 0)
+
+
+class test_suma_system_action_server(test_suma_module):
+    def setUp(self):
+        super(test_suma_system_action_server, self).setUp()
+        # talk to the fake server instead of the mocks
+        self.mock_serverproxy_patch.stop()
+        self.api = FakeSumaAPI(FakeFleet(8), action_duration=0.05)
+        self.server = FakeSumaServer(self.api).start()
+        self.addCleanup(self.server.stop)
+
+    def test_one_action_per_system(self):
+        self.api.action_per_system = True
+        self.api.failing_systems.add(1000010003)
+        ids = list(range(1000010000, 1000010008))
+        self.set_module_args(
+            {
+                "hostname": self.server.hostname,
+                "ssl_check": False,
+                "login": "login",
+                "password": "password",
+                "ids": ids,
+                "action": "package_upgrade",
+                "delay": 0.01,
+                "max_delay": 0.02,
+            }
+        )
+        with self.assertRaises(ansible_fail_json) as result:
+            system_action.main()
+        ret = result.exception.args[0]
+        self.assertEqual(ret["msg"], "Action failed on 1 systems")
+        self.assertEqual(len(ret["actions"]), 8)
+        self.assertEqual(sorted(i for a in ret["actions"].values() for i in a), ids)
+        self.assertEqual(ret["errors"], {})
+        statuses = {i: o["status"] for i, o in ret["systems"].items()}
+        self.assertEqual(statuses.pop(1000010003), "failed")
+        self.assertEqual(set(statuses.values()), {"completed"})
+        for outcome in ret["systems"].values():
+            self.assertEqual(len(outcome["actions"]), 1)
@@ -0,0 +1,141 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    system_addon,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import xmlrpc
+
+from mock import Mock
+
+ENTITLED = {
+    "monitoring_entitled": [1000010000, 1000010001],
+    "container_build_host": [1000010001],
+}
+
+
+class test_suma_system_addon(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_system_addon, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+        }
+
+    def setUp(self):
+        super(test_suma_system_addon, self).setUp()
+        self.client = self.mock_serverproxy.return_value
+        self.client.system.getEntitlements.return_value = [
+            "salt_entitled",
+            "monitoring_entitled",
+        ]
+        self.client.system.listSystemsWithEntitlement.side_effect = lambda key, addon: [
+            {"id": i} for i in ENTITLED.get(addon, [])
+        ]
+
+    def set_args(self, args):
+        self.set_module_args(dict(self.base_args, **args))
+
+    def test_addon_present(self):
+        self.set_args(
+            {"id": 1000010000, "addon": ["container_build_host"], "state": "present"}
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_addon.main()
+        self.assertTrue(result.exception.args[0]["changed"])
+        self.client.system.addEntitlements.assert_called_once_with(
+            "1234", 1000010000, ["container_build_host"]
+        )
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_addon_invalid(self):
+        self.set_args({"id": 1000010000, "addon": ["foo"], "state": "present"})
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_addon.main()
+        self.assertEqual(result.exception.args[0]["msg"], "Invalid add-ons: foo")
+
+    def test_addon_ids_present(self):
+        self.set_args(
+            {
+                "ids": [1000010000, 1000010001, 1000010002],
+                "addon": ["monitoring_entitled"],
+                "state": "present",
+            }
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_addon.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["diff"]["after"], "1000010002: monitoring_entitled\n")
+        self.client.system.addEntitlements.assert_called_once_with(
+            "1234", 1000010002, ["monitoring_entitled"]
+        )
+        self.assertEqual(self.client.system.getEntitlements.call_count, 0)
+        self.assertEqual(self.client.system.listSystemsWithEntitlement.call_count, 5)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_addon_ids_absent_check_mode(self):
+        self.set_args(
+            {
+                "ids": [1000010000, 1000010001, 1000010002],
+                "addon": ["monitoring_entitled", "container_build_host"],
+                "state": "absent",
+                "_ansible_check_mode": True,
+            }
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_addon.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(
+            ret["diff"]["before"],
+            "1000010000: monitoring_entitled\n"
+            "1000010001: container_build_host,monitoring_entitled\n",
+        )
+        self.assertEqual(ret["diff"]["after"], "1000010000: \n1000010001: \n")
+        self.assertEqual(self.client.system.removeEntitlements.call_count, 0)
+
+    def test_addon_ids_unchanged(self):
+        self.set_args(
+            {
+                "ids": [1000010001],
+                "addon": ["monitoring_entitled"],
+                "state": "present",
+            }
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_addon.main()
+        self.assertFalse(result.exception.args[0]["changed"])
+        self.assertEqual(self.client.system.addEntitlements.call_count, 0)
+
+    def test_addon_ids_fail(self):
+        self.set_args(
+            {
+                "ids": [1000010002, 1000010003],
+                "addon": ["monitoring_entitled"],
+                "state": "present",
+            }
+        )
+
+        def add_entitlements(session_key, system_id, addons):
+            if system_id == 1000010003:
+                raise xmlrpc.client.Fault(-210, "No such system")
+            return 1
+
+        self.client.system.addEntitlements = Mock(side_effect=add_entitlements)
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_addon.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(list(ret["errors"]), [1000010003])
@@ -0,0 +1,256 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    system_delete,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import xmlrpc
+
+from mock import Mock
+
+
+class test_suma_system_delete(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_system_delete, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+            "cleanup": "force",
+        }
+
+    def setUp(self):
+        super(test_suma_system_delete, self).setUp()
+        self.client = self.mock_serverproxy.return_value
+        self.client.system.getName.return_value = {"id": 1000010000}
+        self.client.system.listSystems.return_value = [
+            {"id": 1000010000 + i} for i in range(5)
+        ]
+
+    def set_args(self, args):
+        self.set_module_args(dict(self.base_args, **args))
+
+    def test_delete(self):
+        self.set_args({"id": 1000010000})
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        self.assertTrue(result.exception.args[0]["changed"])
+        self.client.system.deleteSystem.assert_called_once_with(
+            "1234", 1000010000, "FORCE_DELETE"
+        )
+        self.assertEqual(self.client.system.listSystems.call_count, 0)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_delete_missing(self):
+        self.set_args({"id": 1000010000})
+        self.client.system.getName = Mock(
+            side_effect=xmlrpc.client.Fault(-210, "No such system")
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        self.assertFalse(result.exception.args[0]["changed"])
+        self.assertEqual(self.client.system.deleteSystem.call_count, 0)
+
+    def test_delete_lookup_fail(self):
+        self.set_args({"id": 1000010000})
+        self.client.system.getName = Mock(side_effect=xmlrpc.client.Fault(123, ""))
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_delete.main()
+        self.assertTrue(result.exception.args[0]["failed"])
+        self.assertEqual(self.client.system.deleteSystem.call_count, 0)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_delete_check_mode(self):
+        self.set_args({"id": 1000010000, "_ansible_check_mode": True})
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        self.assertTrue(result.exception.args[0]["changed"])
+        self.assertEqual(self.client.system.deleteSystem.call_count, 0)
+
+    def test_delete_ids(self):
+        self.set_args(
+            {
+                "ids": [1000010000, 1000010001, 1000010002, 1000010042],
+                "batch_size": 2,
+                "cleanup": "none",
+            }
+        )
+
+        def delete_systems(key, system_ids, cleanup):
+            if 1000010042 in system_ids:
+                raise xmlrpc.client.Fault(-210, "No such system")
+            return 1
+
+        def delete_system(key, system_id, cleanup):
+            if system_id == 1000010042:
+                raise xmlrpc.client.Fault(-210, "No such system")
+            return 1
+
+        self.client.system.deleteSystems = Mock(side_effect=delete_systems)
+        self.client.system.deleteSystem = Mock(side_effect=delete_system)
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["deleted"], [1000010000, 1000010001, 1000010002])
+        self.assertEqual(ret["missing"], [1000010042])
+        self.assertEqual(ret["errors"], {})
+        self.assertEqual(
+            [c.args for c in self.client.system.deleteSystems.call_args_list],
+            [
+                ("1234", [1000010000, 1000010001], "NO_CLEANUP"),
+                ("1234", [1000010002, 1000010042], "NO_CLEANUP"),
+            ],
+        )
+        self.assertEqual(self.client.system.deleteSystem.call_count, 2)
+        # the system list isn't downloaded
+        self.assertEqual(self.client.system.listSystems.call_count, 0)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_delete_ids_check_mode(self):
+        self.set_args(
+            {"ids": [1000010000, 1000010042, 1000010000], "_ansible_check_mode": True}
+        )
+
+        def get_name(key, system_id):
+            if system_id == 1000010042:
+                raise xmlrpc.client.Fault(-210, "No such system")
+            return {"id": system_id}
+
+        self.client.system.getName = Mock(side_effect=get_name)
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["deleted"], [1000010000])
+        self.assertEqual(ret["missing"], [1000010042])
+        self.assertEqual(self.client.system.deleteSystems.call_count, 0)
+        self.assertEqual(self.client.system.listSystems.call_count, 0)
+
+    def test_delete_ids_partial_failure(self):
+        self.set_args({"ids": [1000010000, 1000010001, 1000010002]})
+        self.client.system.deleteSystems = Mock(
+            side_effect=xmlrpc.client.Fault(123, "")
+        )
+        self.client.system.deleteSystem = Mock(
+            side_effect=[1, xmlrpc.client.Fault(123, "oops"), 1]
+        )
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["deleted"], [1000010000, 1000010002])
+        self.assertEqual(list(ret["errors"]), [1000010001])
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_delete_names_check_mode(self):
+        self.set_args(
+            {
+                "names": ["web1.example.com", "gone.example.com"],
+                "_ansible_check_mode": True,
+            }
+        )
+        self.client.system.getId = Mock(
+            side_effect=lambda key, name: (
+                [{"id": 1000010000}, {"id": 1000010003}]
+                if name == "web1.example.com"
+                else []
+            )
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["deleted"], [1000010000, 1000010003])
+        self.assertEqual(ret["missing"], ["gone.example.com"])
+        self.assertEqual(self.client.system.deleteSystems.call_count, 0)
+
+    def set_inactive(self, count):
+        self.client.system.listInactiveSystems.return_value = [
+            {"id": 1000010000 + i, "name": f"sys{i}", "last_checkin": None}
+            for i in range(count)
+        ]
+        self.client.system.getNetworkForSystems.side_effect = lambda key, ids: [
+            {"system_id": i, "hostname": f"{'db' if i % 2 else 'web'}{i}.example.com"}
+            for i in ids
+        ]
+
+    def test_purge(self):
+        self.set_args({"inactive_days": 30, "batch_size": 2})
+        self.set_inactive(3)
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["deleted"], [1000010000, 1000010001, 1000010002])
+        self.client.system.listInactiveSystems.assert_called_once_with("1234", 30)
+        self.assertEqual(self.client.system.deleteSystems.call_count, 2)
+        self.client.system.deleteSystems.assert_called_with(
+            "1234", [1000010002], "FORCE_DELETE"
+        )
+        # no pattern, no need for the hostnames
+        self.assertEqual(self.client.system.getNetworkForSystems.call_count, 0)
+
+    def test_purge_patterns(self):
+        self.set_args(
+            {
+                "inactive_days": 30,
+                "include": ["*.example.com"],
+                "exclude": ["db*"],
+                "_ansible_check_mode": True,
+            }
+        )
+        self.set_inactive(4)
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["changed"])
+        self.assertEqual(ret["deleted"], [1000010000, 1000010002])
+        self.assertEqual(
+            [s["hostname"] for s in ret["systems"]],
+            ["web1000010000.example.com", "web1000010002.example.com"],
+        )
+        self.assertEqual(self.client.system.deleteSystems.call_count, 0)
+
+    def test_purge_max_delete(self):
+        self.set_args({"inactive_days": 30, "max_delete": 2})
+        self.set_inactive(3)
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_delete.main()
+        ret = result.exception.args[0]
+        self.assertEqual(ret["msg"], "3 systems to purge, more than max_delete (2)")
+        self.assertEqual(len(ret["systems"]), 3)
+        self.assertEqual(self.client.system.deleteSystems.call_count, 0)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_purge_nothing(self):
+        self.set_args({"inactive_days": 30, "include": ["web*"]})
+        self.set_inactive(0)
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_delete.main()
+        self.assertFalse(result.exception.args[0]["changed"])
+        self.assertEqual(self.client.system.deleteSystems.call_count, 0)
+
+    def test_purge_invalid_pattern(self):
+        self.set_args({"inactive_days": 30, "include": ["("], "match": "regex"})
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_delete.main()
+        self.assertTrue(result.exception.args[0]["msg"].startswith("include:"))
+        self.assertEqual(self.login.call_count, 0)
@@ -0,0 +1,197 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    system_info,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import json
+import os
+import tempfile
+import xmlrpc
+
+from mock import Mock
+
+
+def installed_products(session_key, system_id):
+    if system_id == 1000010042:
+        raise xmlrpc.client.Fault(-210, "No such system")
+    return [{"name": "SLES", "id": system_id}]
+
+
+def installed_packages(session_key, system_id):
+    return [
+        {"name": "bash", "version": "4.4", "arch": "x86_64"},
+        {"name": "zypper", "version": "1.14", "arch": "x86_64"},
+    ]
+
+
+class test_suma_system_info(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_system_info, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+            "info": "products",
+        }
+
+    def setUp(self):
+        super(test_suma_system_info, self).setUp()
+        self.client = self.mock_serverproxy.return_value
+        self.client.system.getInstalledProducts.side_effect = installed_products
+        self.client.system.listInstalledPackages.side_effect = installed_packages
+        self.client.system.getEntitlements.return_value = ["salt_entitled"]
+        self.client.system.listSystems.return_value = [
+            {"id": 1000010000 + i} for i in range(20)
+        ]
+
+    def set_args(self, args):
+        self.set_module_args(dict(self.base_args, **args))
+
+    def test_info(self):
+        self.set_args({"id": 1000010000})
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_info.main()
+        ret = result.exception.args[0]
+        self.assertFalse(ret["changed"])
+        self.assertEqual(ret["info"], [{"name": "SLES", "id": 1000010000}])
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_info_fail(self):
+        self.set_args({"id": 1000010042})
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_info.main()
+        self.assertTrue(result.exception.args[0]["failed"])
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_info_ids(self):
+        self.set_args({"ids": ["1000010000", "1000010001", "1000010042"]})
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_info.main()
+        ret = result.exception.args[0]
+        self.assertEqual(sorted(ret["info"]), [1000010000, 1000010001])
+        self.assertEqual(ret["info"][1000010001], [{"name": "SLES", "id": 1000010001}])
+        self.assertEqual(list(ret["errors"]), [1000010042])
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_info_ids_all(self):
+        self.set_args({"ids": "all", "workers": 4})
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_info.main()
+        ret = result.exception.args[0]
+        self.assertEqual(len(ret["info"]), 20)
+        self.assertEqual(ret["errors"], {})
+        self.assertEqual(self.client.system.getInstalledProducts.call_count, 20)
+        self.assertEqual(self.login.call_count, 1)
+
+    def test_info_ids_invalid(self):
+        self.set_args({"ids": ["web1"]})
+        self.client.system.getInstalledProducts = Mock()
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_info.main()
+        self.assertEqual(result.exception.args[0]["msg"], "Invalid system ids: web1")
+        self.assertEqual(self.client.system.getInstalledProducts.call_count, 0)
+
+    def test_info_kinds(self):
+        self.set_args(
+            {"id": 1000010000, "info": ["products", "packages", "entitlements"]}
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_info.main()
+        info = result.exception.args[0]["info"]
+        self.assertEqual(sorted(info), ["entitlements", "packages", "products"])
+        self.assertEqual(info["products"], [{"name": "SLES", "id": 1000010000}])
+        self.assertEqual(len(info["packages"]), 2)
+        self.assertEqual(info["entitlements"], ["salt_entitled"])
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_info_kinds_fail(self):
+        self.set_args({"id": 1000010042, "info": ["packages", "products"]})
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_info.main()
+        self.assertEqual(
+            result.exception.args[0]["msg"],
+            "Failed to get system installed products list: <Fault -210: 'No such system'>",
+        )
+
+    def test_info_fields(self):
+        self.set_args(
+            {
+                "id": 1000010000,
+                "info": ["packages", "products"],
+                "fields": {"packages": ["name", "version"]},
+            }
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_info.main()
+        info = result.exception.args[0]["info"]
+        self.assertEqual(info["packages"][0], {"name": "bash", "version": "4.4"})
+        self.assertEqual(info["products"], [{"name": "SLES", "id": 1000010000}])
+
+    def test_info_ids_kinds(self):
+        self.set_args(
+            {"ids": ["1000010000", "1000010042"], "info": ["products", "entitlements"]}
+        )
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_info.main()
+        ret = result.exception.args[0]
+        self.assertEqual(
+            ret["info"][1000010000]["products"], [{"name": "SLES", "id": 1000010000}]
+        )
+        # the kinds which could be fetched are still returned
+        self.assertEqual(ret["info"][1000010042], {"entitlements": ["salt_entitled"]})
+        self.assertEqual(list(ret["errors"]), [1000010042])
+        self.assertEqual(list(ret["errors"][1000010042]), ["products"])
+
+    def test_info_output_paths(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "packages.json")
+            self.set_args(
+                {
+                    "ids": ["1000010000", "1000010001"],
+                    "info": ["products", "packages"],
+                    "output_paths": {"packages": path},
+                }
+            )
+
+            with self.assertRaises(ansible_exit_json) as result:
+                system_info.main()
+            ret = result.exception.args[0]
+            self.assertEqual(ret["output_paths"], {"packages": path})
+            self.assertEqual(list(ret["info"][1000010000]), ["products"])
+            with open(path) as f:
+                packages = json.load(f)
+            self.assertEqual(sorted(packages), ["1000010000", "1000010001"])
+            self.assertEqual(packages["1000010001"][1]["name"], "zypper")
+
+    def test_info_output_paths_check_mode(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "packages.json")
+            self.set_args(
+                {
+                    "id": 1000010000,
+                    "info": "packages",
+                    "output_paths": {"packages": path},
+                    "_ansible_check_mode": True,
+                }
+            )
+
+            with self.assertRaises(ansible_exit_json) as result:
+                system_info.main()
+            self.assertNotIn("info", result.exception.args[0])
+            self.assertFalse(os.path.exists(path))
@@ -0,0 +1,97 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    system_wait,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import xmlrpc
+
+from mock import Mock, patch
+
+
+class test_suma_system_wait(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_system_wait, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+        }
+
+    def setUp(self):
+        super(test_suma_system_wait, self).setUp()
+        self.sleep_patch = patch("time.sleep")
+        self.addCleanup(self.sleep_patch.stop)
+        self.sleep = self.sleep_patch.start()
+        self.client = self.mock_serverproxy.return_value
+        self.search_ip = self.client.system.search.ip
+        self.search_ip.side_effect = [
+            [],
+            [{"id": 1000010001, "ip": "192.168.1.100"}],
+            [
+                {"id": 1000010001, "ip": "192.168.1.100"},
+                {"id": 1000010000, "ip": "192.168.1.10"},
+            ],
+        ]
+
+    def set_args(self, args):
+        self.set_module_args(dict(self.base_args, **args))
+
+    def test_wait_registered(self):
+        self.set_args({"ip": "192.168.1.10"})
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_wait.main()
+        ret = result.exception.args[0]
+        self.assertFalse(ret["changed"])
+        self.assertEqual(ret["system_id"], 1000010000)
+        self.assertEqual(ret["attempts"], 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        # exponential backoff
+        self.assertLess(self.sleep.call_args_list[0].args[0], 1.01)
+        self.assertGreater(self.sleep.call_args_list[1].args[0], 0.99)
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_wait_products(self):
+        self.set_args({"minion_id": "web1.example.com", "wait_for": "products"})
+        self.client.system.getId.return_value = [{"id": 1000010000}]
+        self.client.system.getInstalledProducts.side_effect = [
+            [],
+            [{"name": "SLES"}],
+        ]
+
+        with self.assertRaises(ansible_exit_json) as result:
+            system_wait.main()
+        ret = result.exception.args[0]
+        self.assertEqual(ret["system_id"], 1000010000)
+        self.assertEqual(ret["products"], [{"name": "SLES"}])
+        self.assertEqual(self.client.system.getId.call_count, 1)
+        self.assertEqual(self.client.system.getInstalledProducts.call_count, 2)
+
+    def test_wait_timeout(self):
+        self.set_args({"system_hostname": "web1.example.com", "timeout": 0})
+        self.client.system.search.hostname.return_value = []
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_wait.main()
+        ret = result.exception.args[0]
+        self.assertTrue(ret["failed"])
+        self.assertIsNone(ret["system_id"])
+        self.assertEqual(ret["attempts"], 1)
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_wait_fault(self):
+        self.set_args({"ip": "192.168.1.10"})
+        self.client.system.search.ip = Mock(side_effect=xmlrpc.client.Fault(123, ""))
+
+        with self.assertRaises(ansible_fail_json) as result:
+            system_wait.main()
+        self.assertEqual(
+            result.exception.args[0]["msg"], "Failed to get system: <Fault 123: ''>"
+        )
+        self.assertEqual(self.logout.call_count, 1)
@@ -0,0 +1,314 @@
+from ansible_collections.apatard.suma.plugins.modules import (
+    systems_facts,
+)
+
+from ansible_collections.apatard.suma.tests.unit.modules.utils import (
+    ansible_exit_json,
+    ansible_fail_json,
+    test_suma_module,
+)
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import xmlrpc
+
+from mock import Mock, patch
+
+
+def network(system_id):
+    return {
+        "system_id": system_id,
+        "system_name": f"sys{system_id}",
+        "hostname": f"sys{system_id}.example.com",
+        "ip": f"192.168.1.{system_id % 256}",
+    }
+
+
+class test_suma_systems_facts(test_suma_module):
+    def __init__(self, *args, **kwargs):
+        super(test_suma_systems_facts, self).__init__(*args, **kwargs)
+        self.base_args = {
+            "hostname": "localhost.localdomain",
+            "login": "login",
+            "password": "password",
+        }
+
+    def setUp(self):
+        super(test_suma_systems_facts, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.systems = [
+            {
+                "id": 1000010000 + i,
+                "name": f"sys{i}",
+                "last_checkin": datetime.datetime(2022, 10, 1, 12, i),
+                "last_boot": 1664625600.0 + i,
+            }
+            for i in range(3)
+        ]
+        ret_value = self.mock_serverproxy.return_value
+        ret_value.system.listSystems.side_effect = lambda key: self.systems
+        ret_value.system.getNetworkForSystems.side_effect = lambda key, ids: [
+            network(i) for i in ids
+        ]
+        self.get_network = ret_value.system.getNetworkForSystems
+
+    def set_args(self, args):
+        args.update(self.base_args)
+        self.set_module_args(args)
+
+    def run_module(self, args):
+        self.set_args(args)
+        with self.assertRaises(ansible_exit_json) as result:
+            systems_facts.main()
+        return result.exception.args[0]
+
+    def test_systems_facts(self):
+        result = self.run_module({})
+        self.assertFalse(result["changed"])
+        self.assertEqual(
+            [s["system_id"] for s in result["ansible_facts"]["suma_systems"]],
+            [1000010000, 1000010001, 1000010002],
+        )
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_systems_facts_network_fail(self):
+        self.get_network.side_effect = xmlrpc.client.Fault(123, "")
+        self.set_args({})
+        with self.assertRaises(ansible_fail_json) as result:
+            systems_facts.main()
+        self.assertTrue(result.exception.args[0]["failed"])
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_incremental(self):
+        path = os.path.join(self.tmpdir, "snapshot.json")
+        args = {"incremental": True, "snapshot_path": path}
+
+        result = self.run_module(dict(args))
+        self.assertEqual(result["refreshed"], 3)
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), 3)
+
+        # nothing changed
+        result = self.run_module(dict(args))
+        self.assertEqual(result["refreshed"], 0)
+        self.assertEqual(self.get_network.call_count, 1)
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), 3)
+
+        # one new system, one checked in, one removed
+        self.systems[1]["last_checkin"] = datetime.datetime(2022, 10, 2)
+        del self.systems[2]
+        self.systems.append(
+            {
+                "id": 1000010010,
+                "name": "sys10",
+                "last_checkin": datetime.datetime(2022, 10, 2),
+                "last_boot": 1664625600.0,
+            }
+        )
+        result = self.run_module(dict(args))
+        self.assertEqual(result["refreshed"], 2)
+        self.assertEqual(self.get_network.call_args.args[1], [1000010001, 1000010010])
+        self.assertEqual(
+            [s["system_id"] for s in result["ansible_facts"]["suma_systems"]],
+            [1000010000, 1000010001, 1000010010],
+        )
+
+    def test_incremental_filter(self):
+        path = os.path.join(self.tmpdir, "snapshot.json")
+        args = {"incremental": True, "snapshot_path": path}
+
+        result = self.run_module(dict(args, ids=[1000010001]))
+        self.assertEqual(result["refreshed"], 3)
+        self.assertEqual(
+            [s["system_id"] for s in result["ansible_facts"]["suma_systems"]],
+            [1000010001],
+        )
+
+        # the filtered run kept all the systems in the snapshot
+        result = self.run_module(dict(args))
+        self.assertEqual(result["refreshed"], 0)
+        self.assertEqual(self.get_network.call_count, 1)
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), 3)
+
+    def test_incremental_corrupted_snapshot(self):
+        path = os.path.join(self.tmpdir, "snapshot.json")
+        with open(path, "w") as f:
+            f.write("{")
+        self.get_network.side_effect = Mock(return_value=[network(1000010000)])
+
+        result = self.run_module({"incremental": True, "snapshot_path": path})
+        self.assertEqual(result["refreshed"], 3)
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), 1)
+
+    def test_filter_ids_prefix(self):
+        result = self.run_module(
+            {"ids": [1000010001, 1000010002], "name_prefix": "sys2"}
+        )
+        self.assertEqual(
+            [s["system_id"] for s in result["ansible_facts"]["suma_systems"]],
+            [1000010002],
+        )
+        self.assertEqual(self.get_network.call_args.args[1], [1000010002])
+
+    def test_filter_hostname_fields(self):
+        result = self.run_module(
+            {
+                "system_hostnames": ["*10000.example.com", "*10002.example.com"],
+                "fields": ["system_id", "ip"],
+            }
+        )
+        self.assertEqual(
+            result["ansible_facts"]["suma_systems"],
+            [
+                {"system_id": 1000010000, "ip": "192.168.1.16"},
+                {"system_id": 1000010002, "ip": "192.168.1.18"},
+            ],
+        )
+
+    def test_filter_ip_regex(self):
+        result = self.run_module({"ips": [r"\.17$"], "match": "regex"})
+        self.assertEqual(
+            [s["system_id"] for s in result["ansible_facts"]["suma_systems"]],
+            [1000010001],
+        )
+
+    def test_filter_invalid_regex(self):
+        self.set_args({"ips": ["("], "match": "regex"})
+        with self.assertRaises(ansible_fail_json) as result:
+            systems_facts.main()
+        self.assertTrue(result.exception.args[0]["msg"].startswith("ips: Invalid"))
+        self.assertEqual(self.login.call_count, 0)
+
+    def test_output_jsonl(self):
+        path = os.path.join(self.tmpdir, "systems.jsonl")
+        args = {"output_path": path, "fields": ["system_id"]}
+        result = self.run_module(dict(args))
+        self.assertTrue(result["changed"])
+        self.assertNotIn("ansible_facts", result)
+        self.assertEqual(result["output"]["records"], 3)
+        with open(path) as f:
+            self.assertEqual(
+                [json.loads(line) for line in f],
+                [{"system_id": 1000010000 + i} for i in range(3)],
+            )
+
+        result = self.run_module(dict(args))
+        self.assertFalse(result["changed"])
+
+    def test_output_jsonl_fail(self):
+        path = os.path.join(self.tmpdir, "systems.jsonl")
+
+        def get_network(key, ids):
+            # the second chunk fails once the first one is written
+            if ids[0] != 1000010000:
+                raise xmlrpc.client.ProtocolError("suma", 504, "Gateway Timeout", {})
+            return [network(i) for i in ids]
+
+        self.get_network.side_effect = get_network
+        self.set_args(
+            {"output_path": path, "chunk_size": 2, "chunk_retries": 0, "workers": 1}
+        )
+        with self.assertRaises(ansible_fail_json):
+            systems_facts.main()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_output_jsonl_gzip_check_mode(self):
+        path = os.path.join(self.tmpdir, "systems.jsonl.gz")
+        args = {"output_path": path, "output_compress": True}
+        result = self.run_module(dict(args, _ansible_check_mode=True))
+        self.assertTrue(result["changed"])
+        self.assertFalse(os.path.exists(path))
+        checksum = result["output"]["checksum"]
+
+        result = self.run_module(dict(args))
+        self.assertEqual(result["output"]["checksum"], checksum)
+        with gzip.open(path, "rt") as f:
+            self.assertEqual(len(f.readlines()), 3)
+        with open(path, "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), checksum)
+
+    def set_systems(self, count):
+        self.systems = [
+            {
+                "id": 1000010000 + i,
+                "name": f"sys{i}",
+                "last_checkin": datetime.datetime(2022, 10, 1, 12, i),
+                "last_boot": 1664625600.0 + i,
+            }
+            for i in range(count)
+        ]
+
+    def test_chunks(self):
+        self.set_systems(10)
+        result = self.run_module({"chunk_size": 3, "workers": 2})
+        self.assertEqual(
+            [s["system_id"] for s in result["ansible_facts"]["suma_systems"]],
+            [s["id"] for s in self.systems],
+        )
+        self.assertEqual(self.get_network.call_count, 4)
+        self.assertEqual(
+            [(c["first_id"], c["size"]) for c in result["chunks"]],
+            [(1000010000, 3), (1000010003, 3), (1000010006, 3), (1000010009, 1)],
+        )
+        self.assertEqual({c["attempts"] for c in result["chunks"]}, {1})
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_chunks_retry(self):
+        self.set_systems(6)
+        failures = []
+
+        def get_network(key, ids):
+            # the second chunk fails once
+            if ids[0] == 1000010003 and not failures:
+                failures.append(ids)
+                raise xmlrpc.client.ProtocolError("suma", 504, "Gateway Timeout", {})
+            return [network(i) for i in ids]
+
+        self.get_network.side_effect = get_network
+        with patch("time.sleep") as sleep:
+            result = self.run_module({"chunk_size": 3, "chunk_retry_delay": 0.5})
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), 6)
+        self.assertEqual([c["attempts"] for c in result["chunks"]], [1, 2])
+        self.assertEqual(self.get_network.call_count, 3)
+        # a single wait, with jitter, before the retry
+        self.assertEqual(sleep.call_count, 1)
+        self.assertGreaterEqual(sleep.call_args.args[0], 0.25)
+        self.assertLessEqual(sleep.call_args.args[0], 0.5)
+        for chunk in result["chunks"]:
+            self.assertGreaterEqual(chunk["total_time"], chunk["time"])
+
+    def test_chunks_fail(self):
+        self.set_systems(6)
+        self.get_network.side_effect = xmlrpc.client.ProtocolError(
+            "suma", 504, "Gateway Timeout", {}
+        )
+        self.set_args(
+            {
+                "chunk_size": 3,
+                "chunk_retries": 1,
+                "chunk_retry_delay": 0,
+                "workers": 1,
+            }
+        )
+        with self.assertRaises(ansible_fail_json) as result:
+            systems_facts.main()
+        self.assertIn(
+            "Failed to get network infos for systems 1000010000 to 1000010002",
+            result.exception.args[0]["msg"],
+        )
+        self.assertEqual(self.logout.call_count, 1)
+
+    def test_chunks_incremental(self):
+        self.set_systems(5)
+        path = os.path.join(self.tmpdir, "snapshot.json")
+        result = self.run_module(
+            {"incremental": True, "snapshot_path": path, "chunk_size": 2}
+        )
+        self.assertEqual(result["refreshed"], 5)
+        self.assertEqual(len(result["chunks"]), 3)
+        self.assertEqual(len(result["ansible_facts"]["suma_systems"]), 5)